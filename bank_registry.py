@@ -0,0 +1,218 @@
+import os
+import sys
+import glob
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+import orjson
+import yaml
+from question_bank import load_question_bank, build_question_record, build_question_records
+
+# --- 設定項目 ---
+# 問題集を探すディレクトリと、問題集とみなすファイル名のパターン
+EXAM_BANK_DIR = os.getenv("EXAM_BANK_DIR", "Salesforce_Question")
+EXAM_BANK_PATTERN = "*_final.yaml"
+DEFAULT_BANK_ID = "salesforce_exam_questions_final"
+
+# 同時にメモリへ載せておく問題集の上限
+MAX_RESIDENT_BANKS = int(os.getenv("EXAM_BANK_MAX_RESIDENT", "4"))
+MEMORY_BUDGET_BYTES = int(os.getenv("EXAM_BANK_MEMORY_BUDGET_MB", "256")) * 1024 * 1024
+
+# ディスク上の問題集を再探索する間隔（秒）
+DISCOVERY_INTERVAL = 30
+
+# 読み込み済みの問題集の更新を監視する設定
+HOT_RELOAD_ENABLED = os.getenv("EXAM_BANK_HOT_RELOAD", "1") == "1"
+WATCH_INTERVAL = 5  # 秒
+
+# 既知の問題集の表示名（未登録のものはファイル名から作る）
+BANK_TITLES = {
+    DEFAULT_BANK_ID: "Data Cloud 認定コンサルタント",
+}
+
+
+def _deep_sizeof(obj, seen=None):
+    """オブジェクトが参照するデータを含めたおおよそのメモリ使用量を返す"""
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_deep_sizeof(k, seen) + _deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(_deep_sizeof(item, seen) for item in obj)
+    elif hasattr(obj, '__slots__'):
+        size += sum(_deep_sizeof(getattr(obj, name), seen) for name in obj.__slots__)
+    return size
+
+
+def question_fingerprint(question):
+    """問題の内容が変わったかを判定するためのハッシュ"""
+    return hashlib.sha256(orjson.dumps(question, option=orjson.OPT_SORT_KEYS)).digest()
+
+def _file_signature(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+# 問題集の読み込みで起こりうるエラー（ファイルの欠落・破損・形式の不正）
+BANK_LOAD_ERRORS = (KeyError, OSError, ValueError, yaml.YAMLError)
+
+
+class LoadedBank:
+    """メモリ上に読み込まれた1つの問題集。更新時は新しいインスタンスに丸ごと差し替える"""
+
+    def __init__(self, bank_id, path, records, fingerprints, signature, version=1):
+        self.bank_id = bank_id
+        self.path = path
+        self.records = records
+        self.questions_dict = {q.question_id: q for q in records}
+        self.fingerprints = fingerprints
+        self.signature = signature
+        self.version = version
+        self.size_bytes = _deep_sizeof(records)
+
+    @classmethod
+    def load(cls, bank_id, path):
+        signature = _file_signature(path)
+        questions = load_question_bank(path)
+        records = build_question_records(questions)
+        loaded_ids = {q.question_id for q in records}
+        fingerprints = {q['question_id']: question_fingerprint(q) for q in questions
+                        if isinstance(q, dict) and q.get('question_id') in loaded_ids}
+        return cls(bank_id, path, records, fingerprints, signature)
+
+    def reloaded(self):
+        """ファイルを読み直し、内容が変わった問題だけを作り直した新しいLoadedBankと差分を返す"""
+        signature = _file_signature(self.path)
+        questions = load_question_bank(self.path)
+        records, fingerprints = [], {}
+        added, changed = [], []
+        for question in questions:
+            if not isinstance(question, dict) or 'question_id' not in question:
+                print(f"警告: 問題IDのない問題データを除外します: {question!r}")
+                continue
+            q_id = question['question_id']
+            fingerprint = question_fingerprint(question)
+            if self.fingerprints.get(q_id) == fingerprint:
+                # 変更のない問題は既存のレコードをそのまま使う
+                records.append(self.questions_dict[q_id])
+            else:
+                try:
+                    records.append(build_question_record(question))
+                except (KeyError, TypeError, ValueError, AttributeError) as e:
+                    print(f"警告: 問 {q_id} は形式が不正なため除外します: {e}")
+                    continue
+                (changed if q_id in self.fingerprints else added).append(q_id)
+            fingerprints[q_id] = fingerprint
+        removed = sorted(self.fingerprints.keys() - fingerprints.keys())
+        records.sort(key=lambda r: r.question_id)
+        bank = LoadedBank(self.bank_id, self.path, records, fingerprints, signature, self.version + 1)
+        return bank, {'added': added, 'changed': changed, 'removed': removed}
+
+
+class BankRegistry:
+    """ディスク上の問題集を探索し、選ばれた時に遅延読み込みして、最近使ったものだけを保持する"""
+
+    def __init__(self, bank_dir=EXAM_BANK_DIR, max_resident=MAX_RESIDENT_BANKS, memory_budget=MEMORY_BUDGET_BYTES, hot_reload=HOT_RELOAD_ENABLED):
+        self.bank_dir = bank_dir
+        self.max_resident = max_resident
+        self.memory_budget = memory_budget
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self._resident = OrderedDict()  # bank_id -> LoadedBank（末尾が最近使ったもの）
+        self._paths = {}
+        self._discovered_at = 0.0
+        self.discover()
+        if hot_reload:
+            threading.Thread(target=self._watch_loop, name="bank-watcher", daemon=True).start()
+
+    def discover(self):
+        """問題集のファイルを探索する"""
+        paths = sorted(glob.glob(os.path.join(self.bank_dir, "**", EXAM_BANK_PATTERN), recursive=True))
+        bank_paths = {os.path.splitext(os.path.relpath(path, self.bank_dir))[0].replace(os.sep, "/"): path for path in paths}
+        with self._lock:
+            self._paths = bank_paths
+            self._discovered_at = time.monotonic()
+        return list(bank_paths)
+
+    def bank_ids(self):
+        if time.monotonic() - self._discovered_at > DISCOVERY_INTERVAL:
+            self.discover()
+        return list(self._paths)
+
+    def title(self, bank_id):
+        return BANK_TITLES.get(bank_id) or os.path.basename(bank_id).removesuffix("_final").replace("_", " ")
+
+    def resident_bank_ids(self):
+        with self._lock:
+            return list(self._resident)
+
+    def get(self, bank_id):
+        """問題集を返す。未読み込みの場合はここで読み込み、必要に応じて古いものを追い出す"""
+        with self._lock:
+            bank = self._resident.get(bank_id)
+            if bank is not None:
+                self._resident.move_to_end(bank_id)
+                return bank
+            if bank_id not in self._paths:
+                raise KeyError(f"問題集 '{bank_id}' が見つかりません。")
+            load_lock = self._load_locks.setdefault(bank_id, threading.Lock())
+
+        # 同じ問題集を複数のセッションが同時に読み込まないよう、問題集ごとにロックする
+        with load_lock:
+            with self._lock:
+                bank = self._resident.get(bank_id)
+            if bank is None:
+                path = self._paths[bank_id]
+                bank = LoadedBank.load(bank_id, path)
+                self._store(bank)
+            return bank
+
+    def _store(self, bank):
+        with self._lock:
+            self._resident[bank.bank_id] = bank
+            self._resident.move_to_end(bank.bank_id)
+            self._evict(keep=bank.bank_id)
+
+    def _evict(self, keep):
+        """件数とメモリ予算を超えた分を、最も長く使われていない問題集から追い出す"""
+        total = sum(bank.size_bytes for bank in self._resident.values())
+        for bank_id in list(self._resident):
+            if len(self._resident) <= self.max_resident and total <= self.memory_budget:
+                break
+            if bank_id == keep:
+                continue
+            total -= self._resident.pop(bank_id).size_bytes
+            print(f"ℹ 問題集 '{bank_id}' をメモリから解放しました。")
+
+    def reload_if_changed(self, bank_id):
+        """ファイルが更新されていれば読み直して差し替える。差し替えた場合は差分を返す"""
+        with self._lock:
+            bank = self._resident.get(bank_id)
+        if bank is None:
+            return None
+        try:
+            if _file_signature(bank.path) == bank.signature:
+                return None
+            new_bank, diff = bank.reloaded()
+        except BANK_LOAD_ERRORS as e:
+            # 書き込み途中などで読めない場合は、次の監視周期で再試行する
+            print(f"⚠ 問題集 '{bank_id}' の再読み込みに失敗しました: {e}")
+            return None
+        with self._lock:
+            # 読み直している間に追い出されていたら差し替えない
+            if self._resident.get(bank_id) is bank:
+                self._resident[bank_id] = new_bank
+        print(f"✔ 問題集 '{bank_id}' を更新しました (v{new_bank.version}): "
+              f"追加 {len(diff['added'])}問 ／ 変更 {len(diff['changed'])}問 ／ 削除 {len(diff['removed'])}問")
+        return diff
+
+    def _watch_loop(self):
+        """読み込み済みの問題集のファイル更新を、リクエスト処理とは別のスレッドで監視する"""
+        while True:
+            time.sleep(WATCH_INTERVAL)
+            for bank_id in self.resident_bank_ids():
+                self.reload_if_changed(bank_id)
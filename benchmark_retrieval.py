@@ -0,0 +1,451 @@
+import os
+import gc
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+import faiss
+import numpy as np
+import pyarrow as pa
+
+# 検索の各段階を、ネットワークや実データなしで測るためのベンチマーク
+from preprocess_exam_data import hybrid_search_async
+from embedding_backends import EmbeddingBackend
+from vector_index import FAISS_INDEX_TYPE, VECTOR_QUANTIZATION, VECTOR_PCA_DIM, build_faiss_index, prepare_vectors, storage_label
+from chunk_store import write_chunk_store
+from bm25_index import BM25Index, simple_tokenizer
+from index_bundle import IndexBundleBuilder, IndexBundle
+
+# --- 設定項目 ---
+DEFAULT_SIZES = "10000,100000,1000000"
+RESULTS_DIR = "benchmark_results"
+RESULTS_FORMAT_VERSION = 1
+
+# 合成コーパスの設定（語彙はZipf分布で出現し、各チャンクは1つの話題に偏る）
+VOCAB_SIZE = 50000
+NUM_TOPICS = 256
+TOPIC_WORD_RATIO = 0.6
+WORDS_PER_CHUNK = 80
+# 語彙のうち、カタカナで作る語の割合（残りは英小文字）
+KATAKANA_WORD_RATIO = 0.6
+EMBEDDING_DIM = 768
+GENERATE_BATCH_SIZE = 4096
+
+# クエリの設定（コーパスのチャンクから語を抜き出して作る）
+NUM_QUERIES = 200
+WARMUP_QUERIES = 10
+QUERY_WORDS = 12
+BATCH_SIZE = 32
+# hybrid_search_async の既定値と揃える
+BM25_TOP_N = 30
+FINAL_TOP_K = 10
+
+# --baseline と比べて、p50またはp99がこの倍率を超え、かつ増えた時間が計測の揺らぎより大きければ性能の低下とみなす
+# 揺らぎは段階ごとに、計測値を REGRESSION_NOISE_REPEATS 組に分けて求めた p50/p99 の標準偏差とし、
+# その REGRESSION_NOISE_FACTOR 倍（ただし REGRESSION_MIN_DELTA_MS 以上）を下回る増加は無視する
+REGRESSION_THRESHOLD = 1.2
+REGRESSION_NOISE_REPEATS = 5
+REGRESSION_NOISE_FACTOR = 3.0
+REGRESSION_MIN_DELTA_MS = 0.01
+
+
+def current_rss_bytes():
+    """現在の常駐メモリ量を返す。/procがない環境では最大常駐メモリ量で代用する"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return peak_rss_bytes()
+
+def peak_rss_bytes():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def summarize_latencies(latencies_ms):
+    values = np.asarray(latencies_ms, dtype=np.float64)
+    summary = {
+        'count': int(len(values)),
+        'p50_ms': float(np.percentile(values, 50)),
+        'p99_ms': float(np.percentile(values, 99)),
+        'mean_ms': float(values.mean()),
+        'max_ms': float(values.max()),
+    }
+    summary.update(latency_noise(values))
+    return summary
+
+def latency_noise(values):
+    """計測値を連続した組に分け、組ごとの p50/p99 の標準偏差を揺らぎの目安として返す。
+    組を作れるほど計測値がない場合（一括検索など）は、計測値全体の標準偏差で代用する"""
+    if len(values) < REGRESSION_NOISE_REPEATS * 2:
+        spread = float(values.std())
+        return {'p50_noise_ms': spread, 'p99_noise_ms': spread}
+    groups = np.array_split(values, REGRESSION_NOISE_REPEATS)
+    return {
+        f'{metric}_noise_ms': float(np.std([np.percentile(g, q) for g in groups]))
+        for metric, q in (('p50', 50), ('p99', 99))
+    }
+
+def regression_floor_ms(current, baseline, metric):
+    """その段階で性能の低下とみなす最小の増加量 (ms)。前回・今回の揺らぎの大きい方を使う
+    （揺らぎを記録していない古い結果との比較では、今回の揺らぎだけを使う）"""
+    key = f'{metric}_noise_ms'
+    noise = max(current.get(key, 0.0), baseline.get(key, 0.0))
+    return max(REGRESSION_MIN_DELTA_MS, REGRESSION_NOISE_FACTOR * noise)
+
+
+def _encode_word(i, alphabet):
+    """語IDを、指定した文字で表した語にする（2文字以上になるよう底の分だけずらす）"""
+    base = len(alphabet)
+    i += base
+    chars = []
+    while i:
+        i, r = divmod(i, base)
+        chars.append(alphabet[r])
+    return "".join(reversed(chars))
+
+_KATAKANA = [chr(c) for c in range(0x30A1, 0x30F1)]
+_LOWERCASE = [chr(c) for c in range(ord('a'), ord('z') + 1)]
+
+
+class SyntheticCorpus:
+    """話題つきの合成コーパス。チャンクは語IDの並びで持ち、本文は必要なときに組み立てる"""
+
+    def __init__(self, n_chunks, words_per_chunk=WORDS_PER_CHUNK, vocab_size=VOCAB_SIZE, seed=0):
+        rng = np.random.default_rng(seed)
+        self.n_chunks = n_chunks
+        self.words_per_chunk = words_per_chunk
+        self.words = [
+            _encode_word(i, _KATAKANA if rng.random() < KATAKANA_WORD_RATIO else _LOWERCASE)
+            for i in range(vocab_size)
+        ]
+        # 語IDが小さいほど出現しやすい (Zipf分布)
+        weights = 1.0 / np.arange(1, vocab_size + 1)
+        self._word_cdf = np.cumsum(weights / weights.sum())
+        self.word_ids = np.empty((n_chunks, words_per_chunk), dtype=np.int32)
+        self.topics = rng.integers(0, NUM_TOPICS, n_chunks)
+        for start in range(0, n_chunks, GENERATE_BATCH_SIZE):
+            end = min(n_chunks, start + GENERATE_BATCH_SIZE)
+            self.word_ids[start:end] = self._sample_words(rng, self.topics[start:end])
+
+    def _sample_words(self, rng, topics):
+        shape = (len(topics), self.words_per_chunk)
+        common = np.searchsorted(self._word_cdf, rng.random(shape))
+        # 話題tの語は ID % NUM_TOPICS == t の語
+        per_topic = len(self.words) // NUM_TOPICS
+        topical = topics[:, None] + NUM_TOPICS * rng.integers(0, per_topic, shape)
+        ids = np.where(rng.random(shape) < TOPIC_WORD_RATIO, topical, common)
+        return np.minimum(ids, len(self.words) - 1)
+
+    def text(self, i):
+        body = " ".join(self.words[w] for w in self.word_ids[i])
+        return f"出典: https://example.com/docs/{i // 8}\nタイトル: 合成ドキュメント {i // 8}\n\n{body}"
+
+    # write_chunk_store にそのまま渡せるよう、チャンクのリストと同じく len() と添字で参照できるようにする
+    def __len__(self):
+        return self.n_chunks
+
+    def __getitem__(self, i):
+        return {"text": self.text(i), "source": f"https://example.com/docs/{i // 8}", "title": f"合成ドキュメント {i // 8}"}
+
+    def make_queries(self, n_queries, seed=1):
+        """ランダムなチャンクから語を抜き出して、そのチャンクが見つかるべきクエリを作る"""
+        rng = np.random.default_rng(seed)
+        rows = rng.integers(0, self.n_chunks, n_queries)
+        return [
+            " ".join(self.words[w] for w in rng.choice(self.word_ids[row], QUERY_WORDS, replace=False))
+            for row in rows
+        ]
+
+
+class StubEmbeddingBackend(EmbeddingBackend):
+    """ベンチマーク用の埋め込み。語の話題のヒストグラムを、話題ごとの固定ベクトルで射影する。
+
+    APIを呼ばず決定的に計算できるため、検索の段階だけを測れる。同じ話題の語を多く含むチャンクほど近くなる。
+    """
+
+    kind = "stub"
+
+    def __init__(self, corpus, dimension=EMBEDDING_DIM, seed=0):
+        self.dimension = dimension
+        self.name = f"stub-topic-histogram-{dimension}"
+        self.vocab = {word: i for i, word in enumerate(corpus.words)}
+        self.topic_vectors = np.random.default_rng(seed).standard_normal((NUM_TOPICS, dimension)).astype(np.float32)
+
+    def embed_word_ids(self, word_ids):
+        """(件数, 語数) の語IDの行列をベクトル化する"""
+        rows = np.repeat(np.arange(len(word_ids)), word_ids.shape[1])
+        histogram = np.bincount(rows * NUM_TOPICS + (word_ids.ravel() % NUM_TOPICS),
+                                minlength=len(word_ids) * NUM_TOPICS).reshape(len(word_ids), NUM_TOPICS)
+        vectors = histogram.astype(np.float32) @ self.topic_vectors
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors
+
+    def embed_query(self, text):
+        ids = [self.vocab[w] for w in simple_tokenizer(text) if w in self.vocab]
+        if not ids:
+            return np.zeros(self.dimension, dtype=np.float32)
+        return self.embed_word_ids(np.asarray([ids]))[0]
+
+    async def embed_documents_async(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+
+class _Timer:
+    def __init__(self, results, name):
+        self.results, self.name = results, name
+
+    def __enter__(self):
+        gc.collect()
+        self.rss_before = current_rss_bytes()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.results[self.name] = {
+            'sec': time.perf_counter() - self.start,
+            'rss_delta_bytes': current_rss_bytes() - self.rss_before,
+        }
+
+
+def build_bundle(corpus, backend, root, index_type, quantization, pca_dim, workdir):
+    """合成コーパスから、vectorize_documents.py と同じ形式のバンドルを作り、各段階の時間とサイズを返す"""
+    build = {}
+    bundle = IndexBundleBuilder(root)
+
+    with _Timer(build, 'chunk_store'):
+        write_chunk_store(corpus, bundle.path('chunks'))
+    with _Timer(build, 'bm25'):
+        BM25Index.build(simple_tokenizer(corpus.text(i)) for i in range(corpus.n_chunks)).save(bundle.path('bm25'))
+
+    with _Timer(build, 'embedding_stub'):
+        # ベクトルはディスク上に置き、Faissインデックスの分だけがメモリに載るようにする
+        vectors = np.lib.format.open_memmap(os.path.join(workdir, "vectors.npy"), mode='w+', dtype=np.float32,
+                                            shape=(corpus.n_chunks, backend.dimension))
+        for start in range(0, corpus.n_chunks, GENERATE_BATCH_SIZE):
+            end = min(corpus.n_chunks, start + GENERATE_BATCH_SIZE)
+            vectors[start:end] = backend.embed_word_ids(corpus.word_ids[start:end])
+        vectors.flush()
+    with _Timer(build, 'faiss'):
+        index = build_faiss_index(vectors, index_type, quantization, pca_dim)
+        faiss.write_index(index, bundle.path('faiss'))
+        del index
+    del vectors
+    os.remove(os.path.join(workdir, "vectors.npy"))
+
+    with _Timer(build, 'publish'):
+        manifest = bundle.publish(
+            row_count=corpus.n_chunks,
+            embedding={'backend': backend.kind, 'model': backend.name, 'dimension': backend.dimension},
+            index_type=index_type,
+            vector_storage={'quantization': quantization, 'pca_dim': pca_dim},
+            chunking={'synthetic': True, 'words_per_chunk': corpus.words_per_chunk},
+        )
+    for role in ('chunks', 'bm25', 'faiss'):
+        build[{'chunks': 'chunk_store'}.get(role, role)]['bytes'] = manifest['files'][role]['bytes']
+    return build
+
+
+def _time_calls(func, inputs, warmup=WARMUP_QUERIES):
+    """1件ずつ呼び出してレイテンシを測る。先頭の warmup 件は集計に含めない"""
+    latencies = []
+    for i, value in enumerate(inputs):
+        start = time.perf_counter()
+        func(value)
+        if i >= warmup:
+            latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+async def _time_hybrid(queries, bundle, backend, batch_size):
+    single, batches = [], []
+    for i, query in enumerate(queries):
+        start = time.perf_counter()
+        await hybrid_search_async(query, bundle.faiss_index, bundle.bm25_index, bundle.chunks, backend, BM25_TOP_N, FINAL_TOP_K)
+        if i >= WARMUP_QUERIES:
+            single.append((time.perf_counter() - start) * 1000)
+    for batch in _batched(queries, batch_size):
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            hybrid_search_async(query, bundle.faiss_index, bundle.bm25_index, bundle.chunks, backend, BM25_TOP_N, FINAL_TOP_K)
+            for query in batch
+        ))
+        batches.append((time.perf_counter() - start) * 1000)
+    return single, batches
+
+def _batched(values, batch_size):
+    return [values[i:i + batch_size] for i in range(0, len(values), batch_size)]
+
+def measure_queries(bundle, backend, queries, batch_size):
+    """検索の段階ごとに、1件ずつの場合とまとめて実行した場合のレイテンシを測る"""
+    faiss_index, bm25_index, chunks = bundle.faiss_index, bundle.bm25_index, bundle.chunks
+    tokenized = [simple_tokenizer(q) for q in queries]
+    query_vectors = np.stack([backend.embed_query(q) for q in queries])
+    batches = _batched(list(range(len(queries))), batch_size)
+
+    single = {
+        'tokenize': _time_calls(simple_tokenizer, queries),
+        'bm25': _time_calls(lambda tokens: bm25_index.top_k(tokens, BM25_TOP_N), tokenized),
+        'embedding_stub': _time_calls(backend.embed_query, queries),
+        'faiss': _time_calls(lambda v: faiss_index.search(prepare_vectors(faiss_index, v), FINAL_TOP_K), query_vectors),
+        'chunk_fetch': _time_calls(lambda ids: chunks.get(ids), [bm25_index.top_k(t, BM25_TOP_N)[0] for t in tokenized]),
+    }
+    batch = {
+        'tokenize': _time_calls(lambda rows: [simple_tokenizer(queries[i]) for i in rows], batches, warmup=1),
+        'bm25': _time_calls(lambda rows: [bm25_index.top_k(tokenized[i], BM25_TOP_N) for i in rows], batches, warmup=1),
+        'faiss': _time_calls(lambda rows: faiss_index.search(prepare_vectors(faiss_index, query_vectors[rows]), FINAL_TOP_K), batches, warmup=1),
+    }
+    single['hybrid_search_async'], batch['hybrid_search_async'] = asyncio.run(_time_hybrid(queries, bundle, backend, batch_size))
+
+    result = {'single': {stage: summarize_latencies(v) for stage, v in single.items()}, 'batch': {}}
+    for stage, latencies in batch.items():
+        summary = summarize_latencies(latencies)
+        summary['per_query_ms'] = summary['mean_ms'] / batch_size
+        result['batch'][stage] = summary
+    return result
+
+
+def run_size(n_chunks, args, workdir):
+    print(f"\n--- {n_chunks:,}チャンクのベンチマーク ---")
+    result = {'n_chunks': n_chunks}
+    start = time.perf_counter()
+    corpus = SyntheticCorpus(n_chunks, args.words_per_chunk, seed=args.seed)
+    backend = StubEmbeddingBackend(corpus, args.dim, seed=args.seed)
+    result['generate_sec'] = time.perf_counter() - start
+    print(f"  ✔ 合成コーパスを作成しました ({result['generate_sec']:.1f}秒)")
+
+    root = os.path.join(workdir, f"bundle_{n_chunks}")
+    result['build'] = build_bundle(corpus, backend, root, args.index_type, args.quantization, args.pca_dim, workdir)
+    for stage, r in result['build'].items():
+        size = f", {r['bytes'] / 1024 / 1024:.1f} MB" if 'bytes' in r else ""
+        print(f"  ✔ 作成 {stage:<15} {r['sec']:>8.2f}秒{size}")
+
+    queries = corpus.make_queries(args.queries + WARMUP_QUERIES, seed=args.seed + 1)
+    del corpus
+    gc.collect()
+    rss_before = current_rss_bytes()
+    start = time.perf_counter()
+    bundle = IndexBundle(root)
+    result['open'] = {'sec': time.perf_counter() - start, 'rss_delta_bytes': current_rss_bytes() - rss_before}
+    print(f"  ✔ バンドルを開きました ({result['open']['sec'] * 1000:.1f} ms, 常駐メモリ +{result['open']['rss_delta_bytes'] / 1024 / 1024:.1f} MB)")
+
+    result['query'] = measure_queries(bundle, backend, queries, args.batch_size)
+    result['rss_after_queries_bytes'] = current_rss_bytes()
+    result['peak_rss_bytes'] = peak_rss_bytes()
+    bundle.chunks.close()
+    print_query_report(result['query'], args.batch_size)
+    return result
+
+def print_query_report(query, batch_size):
+    print(f"  {'段階':<20} {'p50(ms)':>9} {'p99(ms)':>9}   {'一括' + str(batch_size) + '件 p50(ms)':>16} {'p99(ms)':>9} {'ms/件':>8}")
+    for stage, s in query['single'].items():
+        b = query['batch'].get(stage)
+        batch_cols = f"{b['p50_ms']:>16.3f} {b['p99_ms']:>9.3f} {b['per_query_ms']:>8.3f}" if b else ""
+        print(f"  {stage:<20} {s['p50_ms']:>9.3f} {s['p99_ms']:>9.3f}   {batch_cols}")
+
+
+def environment_info():
+    def git(*command):
+        try:
+            return subprocess.run(("git",) + command, capture_output=True, text=True, check=True,
+                                  cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+    status = git("status", "--porcelain", "--untracked-files=no")
+    return {
+        'git_commit': git("rev-parse", "HEAD"),
+        'git_dirty': bool(status) if status is not None else None,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'faiss': faiss.__version__,
+        'pyarrow': pa.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+def compare_with_baseline(results, baseline):
+    """前回の結果と比べて、レイテンシがしきい値を超えて悪化した項目を返す"""
+    baseline_by_size = {r['n_chunks']: r for r in baseline['results']}
+    regressions = []
+    print(f"\n--- ベースライン ({(baseline['environment'].get('git_commit') or '不明')[:10]}) との比較 ---")
+    for r in results:
+        base = baseline_by_size.get(r['n_chunks'])
+        if base is None:
+            continue
+        for mode in ('single', 'batch'):
+            for stage, s in r['query'][mode].items():
+                b = base['query'][mode].get(stage)
+                if b is None:
+                    continue
+                for metric in ('p50_ms', 'p99_ms'):
+                    ratio = s[metric] / b[metric] if b[metric] else 1.0
+                    floor_ms = regression_floor_ms(s, b, metric)
+                    if ratio > REGRESSION_THRESHOLD and s[metric] - b[metric] > floor_ms:
+                        regressions.append({'n_chunks': r['n_chunks'], 'mode': mode, 'stage': stage, 'metric': metric,
+                                            'baseline': b[metric], 'current': s[metric], 'ratio': ratio,
+                                            'floor_ms': floor_ms})
+                        print(f"  ⚠ {r['n_chunks']:,}件 {mode}/{stage} {metric}: {b[metric]:.3f} → {s[metric]:.3f} ms "
+                              f"(x{ratio:.2f}, 揺らぎの目安 {floor_ms:.3f} ms)")
+    if not regressions:
+        print(f"  ✅ x{REGRESSION_THRESHOLD} を超え、かつ計測の揺らぎより大きく遅くなった段階はありませんでした。")
+    return regressions
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="ハイブリッド検索の各段階のレイテンシ・作成時間・メモリを合成コーパスで測る")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="チャンク数 (カンマ区切り)")
+    parser.add_argument("--queries", type=int, default=NUM_QUERIES, help="計測するクエリ数")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="一括検索のクエリ数")
+    parser.add_argument("--words-per-chunk", type=int, default=WORDS_PER_CHUNK)
+    parser.add_argument("--dim", type=int, default=EMBEDDING_DIM, help="埋め込みの次元数")
+    parser.add_argument("--index-type", default=FAISS_INDEX_TYPE)
+    parser.add_argument("--quantization", default=VECTOR_QUANTIZATION)
+    parser.add_argument("--pca-dim", type=int, default=VECTOR_PCA_DIM)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", default=None, help="インデックスを作る一時ディレクトリの親 (既定はシステムの一時ディレクトリ)")
+    parser.add_argument("--output", default=None, help=f"結果のJSONの保存先 (既定は {RESULTS_DIR}/ 配下)")
+    parser.add_argument("--baseline", default=None,
+                        help=f"比較する前回の結果のJSON。p50またはp99が x{REGRESSION_THRESHOLD} を超え、かつ段階ごとの"
+                             f"計測の揺らぎ（{REGRESSION_NOISE_REPEATS}組に分けた値の標準偏差）の {REGRESSION_NOISE_FACTOR} 倍"
+                             f"より多く遅くなった段階があれば終了コード1で終わる")
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(",")]
+    environment = environment_info()
+    print(f"--- 検索ベンチマークを開始: {', '.join(f'{n:,}' for n in sizes)}チャンク, "
+          f"{storage_label(args.index_type, args.quantization, args.pca_dim)}, {args.dim}次元 ---")
+    results = []
+    with tempfile.TemporaryDirectory(prefix="retrieval_bench_", dir=args.workdir) as workdir:
+        for n_chunks in sizes:
+            results.append(run_size(n_chunks, args, workdir))
+
+    report = {
+        'format_version': RESULTS_FORMAT_VERSION,
+        'created_at': time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        'environment': environment,
+        'settings': {
+            'index_type': args.index_type, 'quantization': args.quantization, 'pca_dim': args.pca_dim,
+            'dimension': args.dim, 'words_per_chunk': args.words_per_chunk, 'queries': args.queries,
+            'warmup_queries': WARMUP_QUERIES, 'batch_size': args.batch_size, 'bm25_top_n': BM25_TOP_N,
+            'final_top_k': FINAL_TOP_K, 'seed': args.seed, 'noise_repeats': REGRESSION_NOISE_REPEATS,
+        },
+        'results': results,
+    }
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"retrieval-{time.strftime('%Y%m%d-%H%M%S')}-{(environment['git_commit'] or 'nogit')[:10]}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n✔ 結果を '{output}' に保存しました。")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if compare_with_baseline(results, baseline):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
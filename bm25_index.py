@@ -0,0 +1,126 @@
+import os
+import re
+from array import array
+from collections import Counter
+import numpy as np
+
+# --- 設定項目 ---
+BM25_INDEX_FILE = "salesforce_docs_bm25.npz"
+# rank_bm25.BM25Okapi と同じパラメータ
+BM25_K1 = 1.5
+BM25_B = 0.75
+BM25_EPSILON = 0.25
+
+
+def simple_tokenizer(text):
+    """BM25用の簡易的なトークナイザー（英数字の連続と、かな・カナ・漢字の連続を1語とする）"""
+    return re.findall(r'[A-Za-z0-9]+|[\u3040-\u309F\u30A0-\u30FF\u4E00-\u9FFF]+', text.lower())
+
+
+class BM25Index:
+    """CSR形式の転置インデックスによるBM25。
+
+    語ごとの出現文書 (doc_ids) と、その文書でのBM25の重み (weights) を indptr で区切って持つ。
+    重みは作成時に計算済みのため、検索はクエリ語の出現リストを足し合わせるだけで済む。
+    スコアは rank_bm25.BM25Okapi.get_scores と同じになる。
+    """
+
+    def __init__(self, vocab, indptr, doc_ids, weights, n_docs):
+        self.vocab = vocab  # 語 -> 語ID
+        self.indptr = indptr
+        self.doc_ids = doc_ids
+        self.weights = weights
+        self.n_docs = n_docs
+
+    @classmethod
+    def build(cls, tokenized_corpus, k1=BM25_K1, b=BM25_B, epsilon=BM25_EPSILON):
+        """トークン列のリスト（またはジェネレータ）から作成する。出現リストは型付き配列に詰めてメモリを抑える"""
+        vocab = {}
+        term_ids, doc_ids, tfs = array('i'), array('i'), array('i')
+        doc_lengths = array('d')
+        for doc_id, tokens in enumerate(tokenized_corpus):
+            doc_lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                term_ids.append(vocab.setdefault(term, len(vocab)))
+                doc_ids.append(doc_id)
+                tfs.append(tf)
+        term_ids = np.frombuffer(term_ids, dtype=np.int32)
+        doc_ids = np.frombuffer(doc_ids, dtype=np.int32)
+        tfs = np.frombuffer(tfs, dtype=np.int32)
+        doc_lengths = np.frombuffer(doc_lengths, dtype=np.float64)
+
+        # 語IDの順に並べ替えて、語ごとの出現リストを連続させる
+        order = np.argsort(term_ids, kind='stable')
+        term_ids, doc_ids, tfs = term_ids[order], doc_ids[order], tfs[order]
+        doc_freq = np.bincount(term_ids, minlength=len(vocab))
+        indptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(doc_freq, out=indptr[1:])
+
+        # IDFが負になる語は、平均IDFのepsilon倍に置き換える（BM25Okapiと同じ）
+        n_docs = len(doc_lengths)
+        idf = np.log(n_docs - doc_freq + 0.5) - np.log(doc_freq + 0.5)
+        if len(idf):
+            idf[idf < 0] = epsilon * idf.mean()
+        avgdl = doc_lengths.mean() if n_docs else 0.0
+        norm = k1 * (1 - b + b * doc_lengths[doc_ids] / avgdl) if avgdl else np.full(len(doc_ids), k1)
+        weights = (idf[term_ids] * tfs * (k1 + 1) / (tfs + norm)).astype(np.float32)
+        return cls(vocab, indptr, doc_ids, weights, n_docs)
+
+    def save(self, path=BM25_INDEX_FILE):
+        terms = list(self.vocab)
+        encoded = [term.encode('utf-8') for term in terms]
+        term_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(e) for e in encoded], out=term_offsets[1:])
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, terms=np.frombuffer(b"".join(encoded), dtype=np.uint8), term_offsets=term_offsets,
+                     indptr=self.indptr, doc_ids=self.doc_ids, weights=self.weights, n_docs=np.int64(self.n_docs))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=BM25_INDEX_FILE):
+        with np.load(path) as data:
+            blob = data['terms'].tobytes()
+            offsets = data['term_offsets']
+            vocab = {blob[offsets[i]:offsets[i + 1]].decode('utf-8'): i for i in range(len(offsets) - 1)}
+            return cls(vocab, data['indptr'], data['doc_ids'], data['weights'], int(data['n_docs']))
+
+    def _query_postings(self, tokens):
+        """クエリ語の出現リストだけを集め、(文書ID, 重み) を返す"""
+        spans, counts = [], []
+        for term, count in Counter(tokens).items():
+            term_id = self.vocab.get(term)
+            if term_id is not None:
+                spans.append((self.indptr[term_id], self.indptr[term_id + 1]))
+                counts.append(count)
+        if not spans:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+        doc_ids = np.concatenate([self.doc_ids[s:e] for s, e in spans])
+        # クエリ中で同じ語が繰り返された場合は、その回数分スコアに足す
+        weights = np.concatenate([self.weights[s:e] * c for (s, e), c in zip(spans, counts)])
+        return doc_ids, weights
+
+    def get_scores(self, tokens):
+        """全文書のスコアを返す（rank_bm25互換）"""
+        doc_ids, weights = self._query_postings(tokens)
+        return np.bincount(doc_ids, weights=weights, minlength=self.n_docs)
+
+    def top_k(self, tokens, k):
+        """スコアが正の上位k件を (文書IDの配列, スコアの配列) としてスコアの高い順に返す"""
+        doc_ids, weights = self._query_postings(tokens)
+        if not len(doc_ids):
+            return doc_ids, weights
+        # 全文書ではなく、クエリ語を含む文書だけでスコアを集計する
+        unique_ids, inverse = np.unique(doc_ids, return_inverse=True)
+        scores = np.bincount(inverse, weights=weights)
+        return _select_top_k(unique_ids, scores, k)
+
+
+def _select_top_k(doc_ids, scores, k):
+    positive = scores > 0
+    doc_ids, scores = doc_ids[positive], scores[positive]
+    if len(scores) > k:
+        top = np.argpartition(scores, -k)[-k:]
+        doc_ids, scores = doc_ids[top], scores[top]
+    order = np.argsort(-scores, kind='stable')
+    return doc_ids[order], scores[order]
@@ -0,0 +1,116 @@
+import os
+import numpy as np
+
+# --- 設定項目 ---
+DEDUP_ENABLED = os.getenv("CHUNK_DEDUP", "1") == "1"
+# 本文の文字n-gram（シングル）の長さ
+SHINGLE_SIZE = 5
+# MinHashの関数の数と、LSHのバンド分割（NUM_PERM = LSH_BANDS * LSH_ROWS）
+NUM_PERM = 128
+LSH_BANDS = 16
+LSH_ROWS = 8
+# 推定Jaccard類似度がこの値以上なら、ほぼ重複とみなす
+DEDUP_THRESHOLD = 0.85
+
+_rng = np.random.default_rng(20240601)
+# 乗算シフト法のハッシュ関数族（aは奇数）
+_HASH_A = _rng.integers(1, 2 ** 63, NUM_PERM, dtype=np.uint64) | np.uint64(1)
+_HASH_B = _rng.integers(0, 2 ** 63, NUM_PERM, dtype=np.uint64)
+
+
+def chunk_body(chunk):
+    """出典・タイトルのヘッダーを除いたチャンクの本文（ヘッダーは出典ごとに違うため比較に使わない）"""
+    text = chunk["text"]
+    if text.startswith("出典: "):
+        parts = text.split("\n\n", 1)
+        if len(parts) == 2:
+            return parts[1]
+    return text
+
+def shingle_hashes(text, size=SHINGLE_SIZE):
+    """空白を詰めた本文の文字n-gramを64ビットの値にする"""
+    codes = np.frombuffer("".join(text.split()).encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+    if len(codes) < size:
+        return np.unique(codes) if len(codes) else np.zeros(1, dtype=np.uint64)
+    h = np.zeros(len(codes) - size + 1, dtype=np.uint64)
+    for offset in range(size):
+        h = h * np.uint64(1000003) + codes[offset:len(codes) - size + 1 + offset]
+    return np.unique(h)
+
+def minhash_signature(text):
+    hashes = shingle_hashes(text)
+    # (シングル数, NUM_PERM) の行列を作り、ハッシュ関数ごとの最小値をとる
+    return ((hashes[:, None] * _HASH_A + _HASH_B) >> np.uint64(32)).min(axis=0)
+
+
+class _UnionFind:
+    def __init__(self, n):
+        self.parent = list(range(n))
+
+    def find(self, i):
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, i, j):
+        ri, rj = self.find(i), self.find(j)
+        if ri != rj:
+            # 入力順で先のチャンクを代表にする
+            self.parent[max(ri, rj)] = min(ri, rj)
+
+
+def deduplicate_chunks(chunks, threshold=DEDUP_THRESHOLD):
+    """MinHash/LSHでほぼ重複するチャンクをまとめ、各クラスタの代表だけを返す。
+
+    代表のチャンクには、クラスタ内の全ての出典を "sources" として記録する。
+    戻り値は (代表チャンクのリスト, 統計情報の辞書)。
+    """
+    n = len(chunks)
+    if n == 0:
+        return [], {'before': 0, 'after': 0, 'removed': 0, 'chars_before': 0, 'chars_after': 0}
+    signatures = np.stack([minhash_signature(chunk_body(chunk)) for chunk in chunks])
+    clusters = _UnionFind(n)
+
+    for band in range(LSH_BANDS):
+        band_values = np.ascontiguousarray(signatures[:, band * LSH_ROWS:(band + 1) * LSH_ROWS])
+        buckets = {}
+        for i, row in enumerate(band_values):
+            head = buckets.setdefault(row.tobytes(), i)
+            if head == i or clusters.find(head) == clusters.find(i):
+                continue
+            # 同じバケットに入った候補だけ、署名の一致率で類似度を確かめる
+            if np.mean(signatures[head] == signatures[i]) >= threshold:
+                clusters.union(head, i)
+
+    members = {}
+    for i in range(n):
+        members.setdefault(clusters.find(i), []).append(i)
+
+    deduplicated = []
+    for root in sorted(members):
+        representative = dict(chunks[root])
+        sources = []
+        for i in members[root]:
+            for source in chunks[i].get("sources") or [chunks[i]["source"]]:
+                if source not in sources:
+                    sources.append(source)
+        representative["sources"] = sources
+        deduplicated.append(representative)
+
+    stats = {
+        'before': n,
+        'after': len(deduplicated),
+        'removed': n - len(deduplicated),
+        'chars_before': sum(len(chunk["text"]) for chunk in chunks),
+        'chars_after': sum(len(chunk["text"]) for chunk in deduplicated),
+    }
+    return deduplicated, stats
+
+def print_dedup_report(stats, dimension=768):
+    removed_pct = stats['removed'] / stats['before'] * 100 if stats['before'] else 0.0
+    saved_chars = stats['chars_before'] - stats['chars_after']
+    saved_pct = saved_chars / stats['chars_before'] * 100 if stats['chars_before'] else 0.0
+    print(f"✔ ほぼ重複するチャンクを除去しました: {stats['before']}個 → {stats['after']}個 (-{stats['removed']}個, {removed_pct:.1f}%)")
+    print(f"  - 埋め込み対象の文字数: {saved_chars:,}文字 ({saved_pct:.1f}%) 削減 ＝ 埋め込みAPIのコストの削減量の目安")
+    print(f"  - Faissインデックスのメモリ: 約 {stats['removed'] * dimension * 4 / 1024 / 1024:.1f} MB 削減 (float32, {dimension}次元)")
@@ -0,0 +1,98 @@
+import os
+import bisect
+import pyarrow as pa
+
+# --- 設定項目 ---
+TEXT_CHUNKS_FILE = "salesforce_docs_chunks.arrow"
+# 1レコードバッチあたりの行数（行番号からバッチを二分探索で引く）
+ROWS_PER_BATCH = 4096
+
+CHUNK_SCHEMA = pa.schema([
+    ('text', pa.large_string()),
+    # 出典とタイトルは多くのチャンクで重複するため、辞書エンコードして保存する
+    ('source', pa.dictionary(pa.int32(), pa.string())),
+    ('title', pa.dictionary(pa.int32(), pa.string())),
+    # 重複除去でまとめられたチャンクの、全ての出典
+    ('sources', pa.list_(pa.string())),
+])
+
+
+def write_chunk_store(chunks, path=TEXT_CHUNKS_FILE):
+    """チャンクを列指向のArrow IPCファイルに保存する。行番号はFaissのIDと一致させる。
+
+    chunks は len() と添字で参照できればよい。本文はレコードバッチごとにArrowへ変換するため、
+    全チャンクの本文のコピーを一度に持たずに書き出せる。
+    """
+    # 辞書エンコードの辞書は全バッチで共通にする必要があるため、出典とタイトルを先に集める
+    source_ids, title_ids = {}, {}
+    for chunk in chunks:
+        source_ids.setdefault(str(chunk["source"]), len(source_ids))
+        title_ids.setdefault(str(chunk["title"]), len(title_ids))
+    source_dictionary = pa.array(list(source_ids), type=pa.string())
+    title_dictionary = pa.array(list(title_ids), type=pa.string())
+
+    # 読み込み側がメモリマップでそのまま参照できるよう、圧縮せずに書き出す
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, CHUNK_SCHEMA) as writer:
+            for start in range(0, len(chunks), ROWS_PER_BATCH):
+                batch = [chunks[i] for i in range(start, min(len(chunks), start + ROWS_PER_BATCH))]
+                writer.write_batch(pa.record_batch([
+                    pa.array([chunk["text"] for chunk in batch], type=pa.large_string()),
+                    pa.DictionaryArray.from_arrays(pa.array([source_ids[str(chunk["source"])] for chunk in batch], type=pa.int32()), source_dictionary),
+                    pa.DictionaryArray.from_arrays(pa.array([title_ids[str(chunk["title"])] for chunk in batch], type=pa.int32()), title_dictionary),
+                    pa.array([[str(s) for s in chunk.get("sources") or [chunk["source"]]] for chunk in batch], type=pa.list_(pa.string())),
+                ], schema=CHUNK_SCHEMA))
+    os.replace(tmp_path, path)
+
+
+class ChunkStore:
+    """メモリマップしたArrow IPCファイルから、IDを指定してチャンクを取り出す。
+
+    list と同じく len() と chunks[i] で使えるため、これまでのチャンクのリストの代わりに渡せる。
+    実際に読み込まれるのは参照された行のページだけになる。
+    """
+
+    def __init__(self, path=TEXT_CHUNKS_FILE):
+        self.path = path
+        self._source = pa.memory_map(path, 'r')
+        self._reader = pa.ipc.open_file(self._source)
+        if self._reader.schema.remove_metadata() != CHUNK_SCHEMA:
+            raise ValueError(f"'{path}' はチャンクストアの形式ではありません。")
+        self._batches = [self._reader.get_batch(i) for i in range(self._reader.num_record_batches)]
+        self._offsets = []
+        total = 0
+        for batch in self._batches:
+            self._offsets.append(total)
+            total += batch.num_rows
+        self._num_rows = total
+
+    def __len__(self):
+        return self._num_rows
+
+    def __getitem__(self, row_id):
+        row_id = int(row_id)
+        if row_id < 0:
+            row_id += self._num_rows
+        if not 0 <= row_id < self._num_rows:
+            raise IndexError(f"チャンクID {row_id} は範囲外です (0〜{self._num_rows - 1})。")
+        batch_index = bisect.bisect_right(self._offsets, row_id) - 1
+        batch = self._batches[batch_index]
+        i = row_id - self._offsets[batch_index]
+        return {
+            "text": batch.column(0)[i].as_py(),
+            "source": batch.column(1)[i].as_py(),
+            "title": batch.column(2)[i].as_py(),
+            "sources": batch.column(3)[i].as_py(),
+        }
+
+    def __iter__(self):
+        for row_id in range(self._num_rows):
+            yield self[row_id]
+
+    def get(self, row_ids):
+        """複数のIDのチャンクをまとめて返す"""
+        return [self[row_id] for row_id in row_ids]
+
+    def close(self):
+        self._source.close()
@@ -0,0 +1,77 @@
+import time
+import functools
+import numpy as np
+from search_merge import merge_search_candidates
+from embedding_backends import create_embedding_backend
+from vector_index import prepare_vectors
+from bm25_index import simple_tokenizer
+from index_bundle import INDEX_BUNDLE_ROOT, IndexBundle, IndexBundleError, bundle_exists
+
+# --- 設定項目 ---
+# クエリの埋め込みベクトルをキャッシュする件数
+QUERY_EMBEDDING_CACHE_SIZE = 1024
+# 埋め込みAPIが失敗した後、BM25のみで検索する時間（秒）
+EMBEDDING_RETRY_COOLDOWN = 60
+
+
+@functools.lru_cache(maxsize=QUERY_EMBEDDING_CACHE_SIZE)
+def embed_query(backend, query):
+    """クエリをベクトル化する。同じクエリはAPIを呼ばずにキャッシュから返す"""
+    vector = np.asarray(backend.embed_query(query), dtype='float32')
+    vector.setflags(write=False)
+    return vector
+
+
+class DocSearchEngine:
+    """FAISSとBM25のインデックスをプロセスで一度だけ読み込み、ハイブリッド検索を行う"""
+
+    def __init__(self, bundle_root=INDEX_BUNDLE_ROOT, embedding_backend=None):
+        # 公開済みのビルドをマニフェストと照合して開く。FAISSとチャンクはメモリマップで全セッションが共有する
+        self.bundle = IndexBundle(bundle_root)
+        self.faiss_index = self.bundle.faiss_index
+        self.bm25_index = self.bundle.bm25_index
+        self.chunks = self.bundle.chunks
+        if embedding_backend is None:
+            try:
+                embedding_backend = self.bundle.create_embedding_backend()
+            except IndexBundleError as e:
+                print(f"✖ インデックス作成時の埋め込みモデルを用意できません。BM25のみで検索します: {e}")
+                embedding_backend = create_embedding_backend()
+        self.embedding_backend = embedding_backend
+        # インデックスと次元が合わない、または学習済みでない場合はBM25のみで検索する
+        usable = (self.embedding_backend.available and not self.embedding_backend.needs_fit
+                  and self.embedding_backend.dimension == self.faiss_index.d
+                  and self.embedding_backend.name == self.bundle.manifest['embedding']['model'])
+        self._embedding_disabled_until = 0.0 if usable else float('inf')
+
+    @classmethod
+    def artifacts_exist(cls, bundle_root=INDEX_BUNDLE_ROOT):
+        return bundle_exists(bundle_root)
+
+    @property
+    def embedding_available(self):
+        return time.monotonic() >= self._embedding_disabled_until
+
+    def bm25_search(self, query, top_n):
+        top_indices, _ = self.bm25_index.top_k(simple_tokenizer(query), top_n)
+        return [self.chunks[i] for i in top_indices]
+
+    def vector_search(self, query, top_k):
+        """ベクトル検索を行う。埋め込みAPIが使えない場合はNoneを返す"""
+        if not self.embedding_available:
+            return None
+        try:
+            query_vector = embed_query(self.embedding_backend, query)
+        except Exception as e:
+            print(f"✖ クエリのベクトル化に失敗しました。しばらくBM25のみで検索します: {e}")
+            self._embedding_disabled_until = time.monotonic() + EMBEDDING_RETRY_COOLDOWN
+            return None
+        _, top_indices = self.faiss_index.search(prepare_vectors(self.faiss_index, query_vector), top_k)
+        return [self.chunks[i] for i in top_indices[0] if i >= 0]
+
+    def search(self, query, bm25_top_n=30, final_top_k=10):
+        """ハイブリッド検索を行い、(候補チャンク, 検索モード) を返す"""
+        bm25_candidates = self.bm25_search(query, bm25_top_n)
+        vector_candidates = self.vector_search(query, final_top_k)
+        mode = "hybrid" if vector_candidates is not None else "bm25"
+        return merge_search_candidates(vector_candidates or [], bm25_candidates, final_top_k), mode
@@ -0,0 +1,74 @@
+import os
+import orjson
+import yaml
+
+# libyamlが使える環境ではCで実装されたローダーを使う
+YamlLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+JSONL_SIDECAR_SUFFIX = ".jsonl"
+
+
+def jsonl_sidecar_path(yaml_path):
+    """YAMLファイルと並べて置くJSONL形式の副ファイルのパス"""
+    return os.path.splitext(yaml_path)[0] + JSONL_SIDECAR_SUFFIX
+
+def write_documents_jsonl(documents, yaml_path):
+    """スクレイパーの出力を、1行に1ドキュメントのJSONLとしても保存する"""
+    path = jsonl_sidecar_path(yaml_path)
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, 'wb') as f:
+        for doc in documents:
+            f.write(orjson.dumps(doc) + b"\n")
+    os.replace(tmp_path, path)
+    return path
+
+def _iter_jsonl(path):
+    with open(path, 'rb') as f:
+        for line in f:
+            if line.strip():
+                yield orjson.loads(line)
+
+def _load_item(lines):
+    return yaml.load("".join(lines), Loader=YamlLoader)[0]
+
+def iter_yaml_sequence(path):
+    """トップレベルがリストのYAMLを、要素ごとに読み込んで1つずつ返す。
+
+    yaml.dump が書き出す形式（要素が行頭の '- ' で始まる）を前提に、要素の境目で区切ってから
+    各要素だけをパースするため、メモリ使用量は1要素分で済む。それ以外の形式の場合や、要素をまたぐ
+    アンカーなどで要素単体をパースできなかった場合は、全体を読み込んでまだ返していない要素を返す。
+    """
+    yielded = 0
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            lines = []
+            for line in f:
+                if line.startswith('- ') or line.rstrip('\r\n') == '-':
+                    if lines:
+                        yield _load_item(lines)
+                        yielded += 1
+                    lines = [line]
+                elif lines:
+                    lines.append(line)
+                elif line.strip() and not line.startswith(('#', '---')):
+                    break
+            else:
+                if lines:
+                    yield _load_item(lines)
+                return
+    except yaml.YAMLError:
+        pass
+
+    # 逐次読み込みできない形式なので、ファイル全体をパースする
+    with open(path, 'r', encoding='utf-8') as f:
+        data = yaml.load(f, Loader=YamlLoader)
+    if isinstance(data, list):
+        yield from data[yielded:]
+
+def iter_documents(yaml_path):
+    """ドキュメントを1件ずつ返す。YAMLより新しいJSONLの副ファイルがあれば、そちらを読む"""
+    sidecar = jsonl_sidecar_path(yaml_path)
+    if os.path.exists(sidecar) and (not os.path.exists(yaml_path) or os.path.getmtime(sidecar) >= os.path.getmtime(yaml_path)):
+        yield from _iter_jsonl(sidecar)
+    else:
+        yield from iter_yaml_sequence(yaml_path)
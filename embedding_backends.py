@@ -0,0 +1,191 @@
+import os
+import asyncio
+import hashlib
+import numpy as np
+import google.generativeai as genai
+from dotenv import load_dotenv
+
+# .envファイルから環境変数を読み込む
+load_dotenv()
+
+# --- 設定項目 ---
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+# gemini: Gemini APIの埋め込みモデル ／ local: ネットワーク不要のCPUのみの埋め込み
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "gemini")
+GEMINI_EMBEDDING_MODEL = "models/text-embedding-004"
+GEMINI_EMBEDDING_DIM = 768
+# Gemini APIへのクエリ送信前の待機時間（秒）
+GEMINI_QUERY_INTERVAL = 1.2
+
+# ローカル埋め込みの設定
+LOCAL_EMBEDDING_MODEL_FILE = "salesforce_docs.local_embedding.npz"
+LOCAL_EMBEDDING_DIM = GEMINI_EMBEDDING_DIM  # Geminiと同じ次元にしてFAISSの構築処理を共通にする
+LOCAL_HASH_FEATURES = 2048
+LOCAL_NGRAM_SIZES = (2, 3)
+LOCAL_FIT_BATCH_SIZE = 2048
+
+
+class EmbeddingBackend:
+    """埋め込みベクトルを作るバックエンドの共通インターフェース"""
+
+    kind = None
+    name = None
+    dimension = None
+    # EmbeddingEngine に渡すレート制限などの設定
+    engine_options = {}
+
+    @property
+    def available(self):
+        return True
+
+    @property
+    def needs_fit(self):
+        """文書コーパスでの学習が必要な場合にTrue"""
+        return False
+
+    def fit(self, texts):
+        pass
+
+    async def embed_documents_async(self, texts):
+        """文書のリストをベクトル化し、ベクトルのリストを返す"""
+        raise NotImplementedError
+
+    def embed_query(self, text):
+        """検索クエリを (dimension,) のfloat32配列にする"""
+        raise NotImplementedError
+
+    async def embed_query_async(self, text):
+        return self.embed_query(text)
+
+
+class GeminiEmbeddingBackend(EmbeddingBackend):
+    """Gemini APIの埋め込みモデルを使うバックエンド"""
+
+    kind = "gemini"
+    dimension = GEMINI_EMBEDDING_DIM
+
+    def __init__(self, model=GEMINI_EMBEDDING_MODEL, api_key=GEMINI_API_KEY):
+        self.name = model
+        self.api_key = api_key
+        if self.available:
+            genai.configure(api_key=api_key)
+
+    @property
+    def available(self):
+        return bool(self.api_key) and self.api_key != "YOUR_GEMINI_API_KEY"
+
+    async def embed_documents_async(self, texts):
+        result = await genai.embed_content_async(model=self.name, content=texts, task_type="RETRIEVAL_DOCUMENT")
+        return result['embedding']
+
+    def embed_query(self, text):
+        result = genai.embed_content(model=self.name, content=text, task_type="RETRIEVAL_QUERY")
+        return np.asarray(result['embedding'], dtype='float32')
+
+    async def embed_query_async(self, text):
+        await asyncio.sleep(GEMINI_QUERY_INTERVAL)  # レートリミット対策
+        result = await genai.embed_content_async(model=self.name, content=text, task_type="RETRIEVAL_QUERY")
+        return np.asarray(result['embedding'], dtype='float32')
+
+
+def hashed_ngram_counts(text, n_features=LOCAL_HASH_FEATURES, ngram_sizes=LOCAL_NGRAM_SIZES):
+    """文字n-gramをハッシュして、n_features次元の出現回数ベクトルを返す"""
+    codes = np.frombuffer(text.lower().encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+    counts = np.zeros(n_features, dtype=np.float32)
+    for n in ngram_sizes:
+        if len(codes) < n:
+            continue
+        # n-gramの各文字を異なる係数で混ぜ合わせる多項式ハッシュ（プロセスをまたいで同じ値になる）
+        h = np.zeros(len(codes) - n + 1, dtype=np.uint64)
+        for offset in range(n):
+            h = h * np.uint64(1000003) + codes[offset:len(codes) - n + 1 + offset]
+        h ^= h >> np.uint64(29)
+        counts += np.bincount((h % np.uint64(n_features)).astype(np.int64), minlength=n_features).astype(np.float32)
+    return counts
+
+
+class LocalEmbeddingBackend(EmbeddingBackend):
+    """ネットワーク不要の埋め込み。文字n-gramのハッシュTF-IDFを、NumPyのSVDで低次元に射影する"""
+
+    kind = "local"
+    engine_options = {'requests_per_minute': 10 ** 9, 'tokens_per_minute': 10 ** 12, 'max_in_flight': 1}
+
+    def __init__(self, model_path=LOCAL_EMBEDDING_MODEL_FILE, dimension=LOCAL_EMBEDDING_DIM, n_features=LOCAL_HASH_FEATURES):
+        self.model_path = model_path
+        self.dimension = dimension
+        self.n_features = n_features
+        self.idf = None
+        self.components = None
+        self.name = None
+        if model_path and os.path.exists(model_path):
+            self.load(model_path)
+
+    @property
+    def needs_fit(self):
+        return self.components is None
+
+    def _tf(self, texts):
+        matrix = np.stack([hashed_ngram_counts(text, self.n_features) for text in texts])
+        return np.log1p(matrix, out=matrix)  # 長い文書で特定のn-gramが支配的にならないよう、対数で抑える
+
+    def _update_name(self):
+        # 学習結果が変わればキャッシュキーも変わるよう、モデル名に学習結果のハッシュを含める
+        digest = hashlib.sha256(self.idf.tobytes() + self.components.tobytes()).hexdigest()[:12]
+        self.name = f"local-ngram-tfidf-svd-{self.dimension}-{digest}"
+
+    def fit(self, texts):
+        """文書コーパスからIDFと射影行列を学習する"""
+        texts = list(texts)
+        doc_freq = np.zeros(self.n_features, dtype=np.float64)
+        for i in range(0, len(texts), LOCAL_FIT_BATCH_SIZE):
+            doc_freq += (self._tf(texts[i:i + LOCAL_FIT_BATCH_SIZE]) > 0).sum(axis=0)
+        self.idf = (np.log((1 + len(texts)) / (1 + doc_freq)) + 1).astype(np.float32)
+
+        # X^T X をバッチごとに足し合わせ、その固有ベクトル（= Xの右特異ベクトル）を射影に使う
+        gram = np.zeros((self.n_features, self.n_features), dtype=np.float64)
+        for i in range(0, len(texts), LOCAL_FIT_BATCH_SIZE):
+            x = self._weighted(self._tf(texts[i:i + LOCAL_FIT_BATCH_SIZE]))
+            gram += x.T.astype(np.float64) @ x
+        _, eigenvectors = np.linalg.eigh(gram.astype(np.float32))
+        self.components = np.ascontiguousarray(eigenvectors[:, ::-1][:, :self.dimension], dtype=np.float32)
+        self._update_name()
+
+    def _weighted(self, tf):
+        x = tf * self.idf
+        x /= np.maximum(np.linalg.norm(x, axis=1, keepdims=True), 1e-12)
+        return x
+
+    def _embed(self, texts):
+        if self.needs_fit:
+            raise RuntimeError("ローカル埋め込みモデルが学習されていません。先に vectorize_documents.py を実行してください。")
+        vectors = self._weighted(self._tf(texts)) @ self.components
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors.astype(np.float32)
+
+    def save(self, model_path=None):
+        model_path = model_path or self.model_path
+        tmp_path = f"{model_path}.tmp{os.getpid()}.npz"
+        np.savez(tmp_path, idf=self.idf, components=self.components)
+        os.replace(tmp_path, model_path)
+
+    def load(self, model_path):
+        with np.load(model_path) as data:
+            self.idf = data['idf']
+            self.components = data['components']
+        self.n_features, self.dimension = self.components.shape
+        self._update_name()
+
+    async def embed_documents_async(self, texts):
+        return self._embed(texts)
+
+    def embed_query(self, text):
+        return self._embed([text])[0]
+
+
+def create_embedding_backend(kind=EMBEDDING_BACKEND):
+    """設定に応じて埋め込みバックエンドを作る"""
+    if kind == "gemini":
+        return GeminiEmbeddingBackend()
+    if kind == "local":
+        return LocalEmbeddingBackend()
+    raise ValueError(f"未対応の埋め込みバックエンドです: {kind}")
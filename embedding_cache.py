@@ -0,0 +1,119 @@
+import os
+import json
+import hashlib
+import numpy as np
+
+# --- 設定項目 ---
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", "embedding_cache")
+KEYS_FILE = "keys.bin"
+VECTORS_FILE = "vectors.f32"
+META_FILE = "meta.json"
+KEY_SIZE = 32  # sha256のバイト数
+
+
+def embedding_cache_key(model, task_type, text):
+    """モデル名・タスク種別・テキストから、埋め込みベクトルのキャッシュキーを作る"""
+    h = hashlib.sha256()
+    for part in (model, task_type, text):
+        data = part.encode('utf-8')
+        # 区切り文字の衝突を避けるため、長さを前置してから連結する
+        h.update(len(data).to_bytes(8, 'little'))
+        h.update(data)
+    return h.digest()
+
+
+class EmbeddingCache:
+    """埋め込みベクトルの永続キャッシュ。
+
+    ベクトルは追記専用のfloat32ファイルにmmapで、キーは同じ行順の追記専用ファイルに保存する。
+    キーファイルはベクトルの書き込み後に追記するため、途中で中断されても不整合な行は読み込み時に切り捨てられる。
+    """
+
+    def __init__(self, cache_dir=EMBEDDING_CACHE_DIR):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        self.keys_path = os.path.join(cache_dir, KEYS_FILE)
+        self.vectors_path = os.path.join(cache_dir, VECTORS_FILE)
+        self.meta_path = os.path.join(cache_dir, META_FILE)
+        self.dim = None
+        self._index = {}  # キー -> 行番号
+        self._rows = 0
+        self._vectors = None
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.meta_path):
+            return
+        with open(self.meta_path, 'r', encoding='utf-8') as f:
+            self.dim = json.load(f)['dim']
+        keys = b""
+        if os.path.exists(self.keys_path):
+            with open(self.keys_path, 'rb') as f:
+                keys = f.read()
+        vector_rows = os.path.getsize(self.vectors_path) // (4 * self.dim) if os.path.exists(self.vectors_path) else 0
+        rows = min(len(keys) // KEY_SIZE, vector_rows)
+        # 書き込み途中で中断された末尾の行は捨てる
+        if len(keys) != rows * KEY_SIZE:
+            with open(self.keys_path, 'r+b') as f:
+                f.truncate(rows * KEY_SIZE)
+        if vector_rows != rows:
+            with open(self.vectors_path, 'r+b') as f:
+                f.truncate(rows * 4 * self.dim)
+        self._index = {keys[i * KEY_SIZE:(i + 1) * KEY_SIZE]: i for i in range(rows)}
+        self._rows = rows
+
+    def __len__(self):
+        return self._rows
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def _mapped_vectors(self):
+        if self._vectors is None or len(self._vectors) != self._rows:
+            self._vectors = np.memmap(self.vectors_path, dtype='float32', mode='r', shape=(self._rows, self.dim))
+        return self._vectors
+
+    def lookup(self, keys):
+        """キーごとにキャッシュ上の行番号を返す。未登録のキーはNone"""
+        return [self._index.get(key) for key in keys]
+
+    def get(self, rows):
+        """行番号のリストに対応するベクトルを (len(rows), dim) の配列で返す"""
+        if not rows:
+            return np.empty((0, self.dim or 0), dtype='float32')
+        return np.asarray(self._mapped_vectors()[np.asarray(rows)], dtype='float32')
+
+    def add(self, keys, vectors):
+        """新しいベクトルを追記する。登録済みのキーは無視する"""
+        vectors = np.asarray(vectors, dtype='float32')
+        if vectors.ndim != 2 or len(vectors) != len(keys):
+            raise ValueError("キーとベクトルの件数が一致しません。")
+        if self.dim is None:
+            self.dim = int(vectors.shape[1])
+            with open(self.meta_path, 'w', encoding='utf-8') as f:
+                json.dump({'dim': self.dim}, f)
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"ベクトルの次元 ({vectors.shape[1]}) がキャッシュの次元 ({self.dim}) と一致しません。")
+
+        new_keys, new_rows, pending = [], [], set()
+        for i, key in enumerate(keys):
+            if key in self._index or key in pending:
+                continue
+            pending.add(key)
+            new_keys.append(key)
+            new_rows.append(i)
+        if not new_keys:
+            return 0
+
+        with open(self.vectors_path, 'ab') as f:
+            f.write(vectors[new_rows].tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        with open(self.keys_path, 'ab') as f:
+            f.write(b"".join(new_keys))
+            f.flush()
+            os.fsync(f.fileno())
+        for key in new_keys:
+            self._index[key] = self._rows
+            self._rows += 1
+        return len(new_keys)
@@ -0,0 +1,198 @@
+import os
+import time
+import random
+import asyncio
+
+# --- 設定項目 ---
+# 埋め込みAPIの実際のクォータに合わせて環境変数で調整する
+EMBED_REQUESTS_PER_MINUTE = int(os.getenv("EMBED_REQUESTS_PER_MINUTE", "1500"))
+EMBED_TOKENS_PER_MINUTE = int(os.getenv("EMBED_TOKENS_PER_MINUTE", "1000000"))
+EMBED_MAX_IN_FLIGHT = int(os.getenv("EMBED_MAX_IN_FLIGHT", "4"))
+# 1リクエストあたりの上限（APIのバッチ上限は100件）
+EMBED_BATCH_MAX_ITEMS = 100
+EMBED_BATCH_TOKEN_BUDGET = int(os.getenv("EMBED_BATCH_TOKEN_BUDGET", "20000"))
+
+# リトライの設定
+MAX_ATTEMPTS = 6
+# クォータ超過 (429) やサーバーエラー (5xx) は時間を置けば回復するため、分割せずに多めに再試行する
+TRANSIENT_MAX_ATTEMPTS = int(os.getenv("EMBED_TRANSIENT_MAX_ATTEMPTS", "20"))
+BACKOFF_BASE = 1.0  # 秒
+BACKOFF_MAX = 60.0  # 秒
+
+# エラーの種類を判定するHTTPステータス（google.api_core の例外は code 属性に持つ）
+INPUT_ERROR_STATUSES = (400, 413, 422)
+TRANSIENT_ERROR_STATUSES = (408, 429, 500, 502, 503, 504)
+
+
+def estimate_tokens(text):
+    """トークン数のおおよその見積もり。日本語が多いため、2文字で1トークンと少し多めに見積もる"""
+    return max(1, len(text) // 2)
+
+def make_batches(texts, token_budget=EMBED_BATCH_TOKEN_BUDGET, max_items=EMBED_BATCH_MAX_ITEMS):
+    """件数ではなくトークン数の予算でバッチを区切り、(インデックスのリスト, トークン数) を返す"""
+    batches, current, current_tokens = [], [], 0
+    for i, text in enumerate(texts):
+        tokens = estimate_tokens(text)
+        if current and (current_tokens + tokens > token_budget or len(current) >= max_items):
+            batches.append((current, current_tokens))
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += tokens
+    if current:
+        batches.append((current, current_tokens))
+    return batches
+
+
+def classify_error(error):
+    """埋め込みAPIのエラーを分類する。
+
+    "input": 特定のテキストが原因（InvalidArgument など）。バッチを半分に分けて原因を切り分ける
+    "transient": クォータ超過や一時的な障害。同じバッチのまま、上限付きのバックオフで再試行する
+    "other": それ以外。数回再試行し、だめならバッチごと失敗とする
+    """
+    status = getattr(error, 'code', None)
+    if isinstance(status, int):
+        if status in INPUT_ERROR_STATUSES:
+            return "input"
+        if status in TRANSIENT_ERROR_STATUSES:
+            return "transient"
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return "transient"
+    return "other"
+
+
+class TokenBucket:
+    """1分あたりの上限をならして守るトークンバケット"""
+
+    def __init__(self, per_minute, capacity=None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self, amount=1):
+        amount = min(amount, self.capacity)
+        while True:
+            self._refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return
+            await asyncio.sleep((amount - self.tokens) / self.rate)
+
+
+class EmbeddingEngine:
+    """複数のバッチを並行して送りつつ、レート制限とリトライを行う埋め込みエンジン。
+
+    embed_batch は テキストのリストを受け取りベクトルのリストを返すコルーチン関数。
+    失敗したバッチは classify_error の分類に応じて、指数バックオフ後にキューへ戻すか、
+    入力が原因の場合は半分に分けて原因のテキストを切り分ける。
+    """
+
+    def __init__(self, embed_batch, requests_per_minute=EMBED_REQUESTS_PER_MINUTE, tokens_per_minute=EMBED_TOKENS_PER_MINUTE,
+                 max_in_flight=EMBED_MAX_IN_FLIGHT, token_budget=EMBED_BATCH_TOKEN_BUDGET, max_batch_items=EMBED_BATCH_MAX_ITEMS,
+                 classify_error=classify_error):
+        self.embed_batch = embed_batch
+        self.classify_error = classify_error
+        self.request_bucket = TokenBucket(requests_per_minute, capacity=max_in_flight)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.max_in_flight = max_in_flight
+        self.token_budget = token_budget
+        self.max_batch_items = max_batch_items
+        self.stats = {}
+
+    async def embed(self, texts, on_batch=None):
+        """全テキストをベクトル化し、(インデックス -> ベクトルの辞書, 失敗したインデックスのリスト) を返す。
+
+        on_batch(indices, vectors) はバッチが成功するたびに呼ばれる（キャッシュへの書き込みなどに使う）。
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        done = asyncio.Event()
+        results, failed = {}, []
+        state = {'pending': 0, 'requests': 0, 'retries': 0, 'error': None}
+        start = time.perf_counter()
+
+        def submit(indices, tokens, attempt=0):
+            state['pending'] += 1
+            queue.put_nowait((indices, tokens, attempt))
+
+        def finish():
+            state['pending'] -= 1
+            if state['pending'] == 0:
+                done.set()
+
+        async def worker():
+            while True:
+                indices, tokens, attempt = await queue.get()
+                await self.request_bucket.acquire()
+                await self.token_bucket.acquire(tokens)
+                state['requests'] += 1
+                try:
+                    vectors = await self.embed_batch([texts[i] for i in indices])
+                    if len(vectors) != len(indices):
+                        raise ValueError(f"返されたベクトルの件数 ({len(vectors)}) がテキストの件数 ({len(indices)}) と一致しません。")
+                except Exception as e:
+                    state['retries'] += 1
+                    kind = self.classify_error(e)
+                    max_attempts = TRANSIENT_MAX_ATTEMPTS if kind == "transient" else MAX_ATTEMPTS
+                    if kind == "input":
+                        if len(indices) > 1:
+                            # 特定のテキストが原因のため、半分に分けて切り分ける（同じバッチのままの再試行はしない）
+                            half = len(indices) // 2
+                            for part in (indices[:half], indices[half:]):
+                                submit(part, sum(estimate_tokens(texts[i]) for i in part))
+                        else:
+                            print(f"✖ テキスト {indices[0]} はAPIに受け付けられなかったためベクトル化できませんでした: {e}")
+                            failed.extend(indices)
+                    elif attempt + 1 < max_attempts:
+                        delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt) * (0.5 + random.random())
+                        print(f"⚠ 埋め込みAPIエラー ({len(indices)}件, {attempt + 1}回目): {e} → {delay:.1f}秒後に再試行します。")
+                        # 待機中もワーカーを塞がないよう、時間が来たらキューに戻す
+                        state['pending'] += 1
+                        loop.call_later(delay, queue.put_nowait, (indices, tokens, attempt + 1))
+                    else:
+                        print(f"✖ {len(indices)}件のテキストは {max_attempts}回失敗したためベクトル化できませんでした: {e}")
+                        failed.extend(indices)
+                    finish()
+                    continue
+                for i, vector in zip(indices, vectors):
+                    results[i] = vector
+                try:
+                    if on_batch is not None:
+                        on_batch(indices, vectors)
+                except Exception as e:
+                    # コールバックの失敗（キャッシュへの書き込みなど）は再試行せず、残りのバッチを打ち切って呼び出し元に伝える
+                    state['error'] = e
+                    done.set()
+                finally:
+                    finish()
+
+        for indices, tokens in make_batches(texts, self.token_budget, self.max_batch_items):
+            submit(indices, tokens)
+        if state['pending'] == 0:
+            done.set()
+        workers = [asyncio.create_task(worker()) for _ in range(self.max_in_flight)]
+        try:
+            await done.wait()
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+        if state['error'] is not None:
+            raise state['error']
+
+        elapsed = time.perf_counter() - start
+        self.stats = {
+            'chunks': len(results),
+            'failed': len(failed),
+            'requests': state['requests'],
+            'retries': state['retries'],
+            'elapsed_sec': elapsed,
+            'chunks_per_sec': len(results) / elapsed if elapsed > 0 else 0.0,
+        }
+        return results, sorted(failed)
@@ -0,0 +1,295 @@
+import os
+import sys
+import json
+import shutil
+import hashlib
+from question_bank import EXAM_QUESTIONS_FILE, load_question_bank, build_question_records
+
+# --- 設定項目 ---
+OUTPUT_DIR = "static_site"
+SITE_TITLE = "Salesforce 資格試験 AIアシスタント"
+
+INDEX_HTML = """<!DOCTYPE html>
+<html lang="ja">
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>{title}</title>
+<link rel="stylesheet" href="style.css?v={version}">
+</head>
+<body>
+<aside id="sidebar">
+  <h1>{title}</h1>
+  <p id="progress-summary"></p>
+  <input id="filter-text" type="search" placeholder="問題番号・キーワード">
+  <select id="filter-status">
+    <option value="all">すべて</option>
+    <option value="unanswered">未回答</option>
+    <option value="wrong">不正解</option>
+    <option value="contradicted">AI矛盾</option>
+  </select>
+  <ol id="question-list"></ol>
+  <button id="reset-progress" type="button">学習記録をリセット</button>
+</aside>
+<main id="main"></main>
+<script src="questions.js?v={version}"></script>
+<script src="app.js?v={version}"></script>
+</body>
+</html>
+"""
+
+STYLE_CSS = """body { margin: 0; display: flex; font-family: sans-serif; line-height: 1.6; color: #222; }
+#sidebar { width: 320px; height: 100vh; overflow-y: auto; position: sticky; top: 0; padding: 1rem; box-sizing: border-box; background: #f4f6f9; }
+#sidebar h1 { font-size: 1.1rem; }
+#sidebar input, #sidebar select { width: 100%; margin-bottom: .5rem; box-sizing: border-box; }
+#question-list { list-style: none; padding: 0; }
+#question-list a { display: block; padding: .2rem .3rem; white-space: nowrap; overflow: hidden; text-overflow: ellipsis; color: inherit; text-decoration: none; }
+#question-list a.current { background: #dde6f5; }
+#main { flex: 1; padding: 1rem 2rem; max-width: 900px; }
+.question-text { background: #e8f1fb; padding: 1rem; border-radius: 6px; white-space: pre-wrap; }
+.choice { display: block; padding: .4rem .6rem; margin: .3rem 0; border-radius: 6px; }
+.choice.correct-selected { background: #e3f6e6; }
+.choice.wrong-selected { background: #fbe6e6; }
+.choice.correct-missed { border: 2px dashed #4a9a5a; }
+.notice { padding: .6rem 1rem; border-radius: 6px; margin: .5rem 0; }
+.notice.info { background: #e8f1fb; }
+.notice.warning { background: #fff6dd; }
+.notice.error { background: #fbe6e6; }
+.notice.success { background: #e3f6e6; }
+.explanation { white-space: pre-wrap; }
+.related-doc { border-left: 3px solid #ccd; padding-left: .8rem; margin: .8rem 0; }
+.nav { display: flex; justify-content: space-between; margin-top: 1.5rem; }
+"""
+
+APP_JS = r"""(function () {
+  'use strict';
+  var data = window.QUIZ_DATA;
+  var storageKey = 'quiz-progress:' + data.bank_id;
+  var questions = data.questions;
+  var indexById = {};
+  questions.forEach(function (q, i) { indexById[q.id] = i; });
+
+  function loadProgress() {
+    try { return JSON.parse(localStorage.getItem(storageKey)) || {}; } catch (e) { return {}; }
+  }
+  function saveProgress() {
+    try { localStorage.setItem(storageKey, JSON.stringify(progress)); } catch (e) { /* 容量超過などは無視する */ }
+  }
+  var progress = loadProgress();
+
+  function el(tag, className, text) {
+    var node = document.createElement(tag);
+    if (className) node.className = className;
+    if (text !== undefined) node.textContent = text;
+    return node;
+  }
+  function sameSet(a, b) {
+    return a.length === b.length && a.every(function (x) { return b.indexOf(x) !== -1; });
+  }
+  function statusOf(q) {
+    var answer = progress[q.id];
+    if (!answer) return 'unanswered';
+    return answer.correct ? 'correct' : 'wrong';
+  }
+  function currentId() {
+    var match = /q=(\d+)/.exec(location.hash);
+    return match && indexById[match[1]] !== undefined ? Number(match[1]) : questions[0].id;
+  }
+
+  function renderList() {
+    var text = document.getElementById('filter-text').value.trim().toLowerCase();
+    var status = document.getElementById('filter-status').value;
+    var list = document.getElementById('question-list');
+    var current = currentId();
+    var fragment = document.createDocumentFragment();
+    questions.forEach(function (q) {
+      var s = statusOf(q);
+      if (status === 'unanswered' && s !== 'unanswered') return;
+      if (status === 'wrong' && s !== 'wrong') return;
+      if (status === 'contradicted' && !q.contradicted) return;
+      if (text && q.search.indexOf(text) === -1) return;
+      var prefix = s === 'wrong' ? '❌' : s === 'correct' ? '✅' : '📄';
+      var item = el('li');
+      var link = el('a', q.id === current ? 'current' : '', prefix + ' ' + q.label);
+      link.href = '#q=' + q.id;
+      item.appendChild(link);
+      fragment.appendChild(item);
+    });
+    list.replaceChildren(fragment);
+    var answered = Object.keys(progress).filter(function (id) { return indexById[id] !== undefined; });
+    var correct = answered.filter(function (id) { return progress[id].correct; });
+    document.getElementById('progress-summary').textContent =
+      '回答済み ' + answered.length + ' / ' + questions.length + '問（正解 ' + correct.length + '問）';
+  }
+
+  function renderQuestion() {
+    var q = questions[indexById[currentId()]];
+    var main = document.getElementById('main');
+    var answer = progress[q.id];
+    main.replaceChildren();
+    main.appendChild(el('h2', '', '問題 ' + q.id));
+    main.appendChild(el('div', 'question-text', q.text));
+    main.appendChild(el('h4', '', '選択肢'));
+
+    if (!answer) {
+      if (q.correct.length > 1) {
+        main.appendChild(el('div', 'notice warning', 'この問題は ' + q.correct.length + '個 の正解を選択してください。'));
+      }
+      var form = el('form');
+      q.choices.forEach(function (choice) {
+        var label = el('label', 'choice');
+        var box = el('input');
+        box.type = 'checkbox';
+        box.value = choice[0];
+        label.appendChild(box);
+        label.appendChild(document.createTextNode(' ' + choice[0] + '. ' + choice[1]));
+        form.appendChild(label);
+      });
+      var error = el('div', 'notice error');
+      error.hidden = true;
+      var submit = el('button', '', '回答を決定');
+      submit.type = 'submit';
+      form.appendChild(error);
+      form.appendChild(submit);
+      form.addEventListener('submit', function (event) {
+        event.preventDefault();
+        var selected = Array.prototype.filter.call(form.querySelectorAll('input'), function (box) { return box.checked; })
+          .map(function (box) { return box.value; }).sort();
+        if (selected.length !== q.correct.length) {
+          error.textContent = q.correct.length > 1
+            ? 'エラー: この問題では正確に ' + q.correct.length + '個 の選択肢を選んでください。'
+            : 'エラー: この問題では 1個だけ 選択肢を選んでください。';
+          error.hidden = false;
+          return;
+        }
+        progress[q.id] = { answers: selected, correct: sameSet(selected, q.correct), at: Date.now() };
+        saveProgress();
+        render();
+      });
+      main.appendChild(form);
+      return;
+    }
+
+    q.choices.forEach(function (choice) {
+      var selected = answer.answers.indexOf(choice[0]) !== -1;
+      var isCorrect = q.correct.indexOf(choice[0]) !== -1;
+      var className = selected ? (isCorrect ? 'correct-selected' : 'wrong-selected') : (isCorrect ? 'correct-missed' : '');
+      main.appendChild(el('div', 'choice ' + className, (selected ? (isCorrect ? '✅ ' : '❌ ') : '') + choice[0] + '. ' + choice[1]));
+    });
+    main.appendChild(el('h3', '', '分析結果'));
+    main.appendChild(answer.correct
+      ? el('div', 'notice success', '🎉 正解！')
+      : el('div', 'notice error', '❌ 不正解... (あなたの回答: ' + answer.answers.join(', ') + ' ／ 正解: ' + q.correct.join(', ') + ')'));
+    main.appendChild(el('h4', '', 'AIによる答えの検証'));
+    var verdictClass = { match: 'info', warning: 'warning', error: 'error' }[q.ai_verdict];
+    main.appendChild(el('div', 'notice ' + verdictClass, 'AIの評価: ' + q.ai_justification));
+    main.appendChild(el('h4', '', '解説'));
+    main.appendChild(el('div', 'explanation', q.explanation));
+
+    var details = el('details');
+    details.appendChild(el('summary', '', 'AIが厳選した関連ヘルプドキュメントを見る'));
+    if (!q.related_docs.length) details.appendChild(el('p', '', 'AIは正答の根拠となるドキュメントを見つけられませんでした。'));
+    q.related_docs.forEach(function (doc) {
+      var block = el('div', 'related-doc');
+      block.appendChild(el('small', '', '出典: ' + doc.title));
+      block.appendChild(el('blockquote', '', '根拠: ' + doc.supporting_text));
+      var link = el('a', '', '記事を読む ↗');
+      if (/^https?:\/\//.test(doc.url)) link.href = doc.url;
+      link.target = '_blank';
+      link.rel = 'noopener noreferrer';
+      block.appendChild(link);
+      details.appendChild(block);
+    });
+    main.appendChild(details);
+
+    var nav = el('div', 'nav');
+    var index = indexById[q.id];
+    var retry = el('button', '', 'もう一度解く');
+    retry.type = 'button';
+    retry.addEventListener('click', function () { delete progress[q.id]; saveProgress(); render(); });
+    nav.appendChild(index > 0 ? linkTo(questions[index - 1].id, '⬅️ 前の問題へ') : el('span'));
+    nav.appendChild(retry);
+    nav.appendChild(index < questions.length - 1 ? linkTo(questions[index + 1].id, '次の問題へ ➡️') : el('span'));
+    main.appendChild(nav);
+  }
+
+  function linkTo(id, text) {
+    var link = el('a', '', text);
+    link.href = '#q=' + id;
+    return link;
+  }
+
+  function render() {
+    renderQuestion();
+    renderList();
+  }
+
+  document.getElementById('filter-text').addEventListener('input', renderList);
+  document.getElementById('filter-status').addEventListener('change', renderList);
+  document.getElementById('reset-progress').addEventListener('click', function () {
+    if (confirm('この問題集の学習記録を削除しますか？')) { progress = {}; saveProgress(); render(); }
+  });
+  window.addEventListener('hashchange', function () { render(); window.scrollTo(0, 0); });
+  render();
+})();
+"""
+
+
+def build_site_data(bank_id, questions):
+    """アプリと同じ問題レコードから、ブラウザで使うデータを作る"""
+    raw_by_id = {q['question_id']: q for q in questions if isinstance(q, dict) and 'question_id' in q}
+    site_questions = []
+    for record in build_question_records(questions):
+        raw_docs = (raw_by_id[record.question_id].get('ai_analysis') or {}).get('related_docs') or []
+        site_questions.append({
+            'id': record.question_id,
+            'text': record.question_text,
+            'choices': [[key, record.choices[key]] for key in record.choice_keys],
+            'correct': list(record.correct_answers),
+            'explanation': record.explanation_markdown,
+            'ai_verdict': record.ai_verdict,
+            'ai_justification': record.ai_justification,
+            'contradicted': record.is_contradicted,
+            'related_docs': [
+                {'title': doc.get('title', 'N/A'), 'url': doc.get('url', ''), 'supporting_text': doc.get('supporting_text', 'N/A')}
+                for doc in raw_docs
+            ],
+            'label': record.sidebar_label,
+            'search': record.search_text,
+        })
+    return {'bank_id': bank_id, 'questions': site_questions}
+
+def export_static_site(yaml_path=EXAM_QUESTIONS_FILE, output_dir=OUTPUT_DIR):
+    """問題集を、Pythonなしで配信できる静的なHTML/JSに書き出す"""
+    bank_id = os.path.splitext(os.path.basename(yaml_path))[0]
+    site_data = build_site_data(bank_id, load_question_bank(yaml_path))
+    data_js = "window.QUIZ_DATA = " + json.dumps(site_data, ensure_ascii=False, separators=(',', ':')) + ";\n"
+    # ファイル名は変えずに、内容のハッシュでブラウザ・CDNのキャッシュを更新させる
+    version = hashlib.sha256((data_js + APP_JS + STYLE_CSS).encode('utf-8')).hexdigest()[:12]
+
+    # 書き出し途中の状態を配信しないよう、一時ディレクトリに作ってから置き換える
+    tmp_dir = f"{output_dir}.tmp{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    files = {
+        'index.html': INDEX_HTML.format(title=SITE_TITLE, version=version),
+        'style.css': STYLE_CSS,
+        'app.js': APP_JS,
+        'questions.js': data_js,
+    }
+    for filename, content in files.items():
+        with open(os.path.join(tmp_dir, filename), 'w', encoding='utf-8') as f:
+            f.write(content)
+    old_dir = f"{output_dir}.old{os.getpid()}"
+    if os.path.exists(output_dir):
+        os.rename(output_dir, old_dir)
+    os.rename(tmp_dir, output_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return len(site_data['questions'])
+
+if __name__ == "__main__":
+    yaml_path = sys.argv[1] if len(sys.argv) > 1 else EXAM_QUESTIONS_FILE
+    output_dir = sys.argv[2] if len(sys.argv) > 2 else OUTPUT_DIR
+    print("--- 静的サイトの書き出しを開始 ---")
+    count = export_static_site(yaml_path, output_dir)
+    print(f"✔ {count}問を '{output_dir}' に書き出しました。nginxやCDNでそのまま配信できます。")
@@ -0,0 +1,180 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import faiss
+from chunk_store import ChunkStore
+from bm25_index import BM25Index
+from embedding_backends import GeminiEmbeddingBackend, LocalEmbeddingBackend
+
+# --- 設定項目 ---
+INDEX_BUNDLE_ROOT = os.getenv("INDEX_BUNDLE_ROOT", "salesforce_docs_index")
+BUILDS_DIR = "builds"
+CURRENT_POINTER = "CURRENT"
+MANIFEST_FILE = "manifest.json"
+MANIFEST_FORMAT_VERSION = 1
+# 開くたびに全ファイルのSHA-256を計算すると、起動時間と読み込み量がコーパスの大きさに比例して増える。
+# 通常はサイズと行数だけを照合し、チェックサムの照合は INDEX_BUNDLE_VERIFY_CHECKSUMS=1 の場合のみ行う
+VERIFY_CHECKSUMS = os.getenv("INDEX_BUNDLE_VERIFY_CHECKSUMS", "0") == "1"
+# 公開済みのビルドを残す数（古いビルドを開いたままの読み込み側がいても困らないよう、すぐには消さない）
+KEEP_BUILDS = 3
+
+# バンドル内のファイル名
+BUNDLE_FILES = {
+    'faiss': "salesforce_docs.faiss",
+    'bm25': "salesforce_docs_bm25.npz",
+    'chunks': "salesforce_docs_chunks.arrow",
+    'embedding_model': "local_embedding.npz",
+}
+
+
+class IndexBundleError(ValueError):
+    """バンドルが見つからない、またはマニフェストと中身が一致しない場合のエラー"""
+
+
+def _sha256_of_file(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def _write_atomic(path, text):
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class IndexBundleBuilder:
+    """1回のビルドの出力先を用意し、全ファイルの書き込み後にマニフェストを付けて公開する"""
+
+    def __init__(self, root=INDEX_BUNDLE_ROOT):
+        self.root = root
+        self.build_id = time.strftime("%Y%m%d-%H%M%S") + f"-{os.getpid()}"
+        self.build_dir = os.path.join(root, BUILDS_DIR, self.build_id)
+        os.makedirs(self.build_dir)
+
+    def path(self, role):
+        return os.path.join(self.build_dir, BUNDLE_FILES[role])
+
+    def publish(self, row_count, embedding, index_type, chunking, vector_storage=None):
+        """マニフェストを書き、現在のビルドを指すポインタを原子的に差し替える"""
+        files = {}
+        for role, name in BUNDLE_FILES.items():
+            path = os.path.join(self.build_dir, name)
+            if os.path.exists(path):
+                files[role] = {'name': name, 'sha256': _sha256_of_file(path), 'bytes': os.path.getsize(path)}
+        for role in ('faiss', 'bm25', 'chunks'):
+            if role not in files:
+                raise IndexBundleError(f"バンドルに {BUNDLE_FILES[role]} がありません。")
+        manifest = {
+            'format_version': MANIFEST_FORMAT_VERSION,
+            'build_id': self.build_id,
+            'created_at': time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            'row_count': row_count,
+            'embedding': embedding,
+            'index_type': index_type,
+            'vector_storage': vector_storage or {'quantization': "none", 'pca_dim': 0},
+            'chunking': chunking,
+            'files': files,
+        }
+        _write_atomic(os.path.join(self.build_dir, MANIFEST_FILE), json.dumps(manifest, ensure_ascii=False, indent=2))
+        # ポインタはファイルの置き換えで切り替えるため、読み込み側は古いか新しいかのどちらかのビルドだけを見る
+        _write_atomic(os.path.join(self.root, CURRENT_POINTER), self.build_id + "\n")
+        self._prune_old_builds()
+        return manifest
+
+    def abort(self):
+        shutil.rmtree(self.build_dir, ignore_errors=True)
+
+    def _prune_old_builds(self):
+        builds_dir = os.path.join(self.root, BUILDS_DIR)
+        published = sorted(b for b in os.listdir(builds_dir) if os.path.exists(os.path.join(builds_dir, b, MANIFEST_FILE)))
+        for build_id in published[:-KEEP_BUILDS]:
+            if build_id != self.build_id:
+                shutil.rmtree(os.path.join(builds_dir, build_id), ignore_errors=True)
+
+
+def current_build_dir(root=INDEX_BUNDLE_ROOT):
+    pointer = os.path.join(root, CURRENT_POINTER)
+    if not os.path.exists(pointer):
+        return None
+    with open(pointer, 'r', encoding='utf-8') as f:
+        return os.path.join(root, BUILDS_DIR, f.read().strip())
+
+def bundle_exists(root=INDEX_BUNDLE_ROOT):
+    build_dir = current_build_dir(root)
+    return build_dir is not None and os.path.exists(os.path.join(build_dir, MANIFEST_FILE))
+
+
+class IndexBundle:
+    """公開済みのビルドを、マニフェストと照合しながらまとめて開く。
+
+    開く際はファイルのサイズと各インデックスの行数だけを照合する。ファイルの中身まで確かめる場合は
+    verify_checksums=True を指定するか、verify_checksums() を呼ぶ。
+    """
+
+    def __init__(self, root=INDEX_BUNDLE_ROOT, verify_checksums=VERIFY_CHECKSUMS):
+        build_dir = current_build_dir(root)
+        if build_dir is None:
+            raise IndexBundleError(f"'{root}' に公開済みの検索インデックスがありません。先にvectorize_documents.pyを実行してください。")
+        self.build_dir = build_dir
+        with open(os.path.join(build_dir, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        if self.manifest.get('format_version') != MANIFEST_FORMAT_VERSION:
+            raise IndexBundleError(f"未対応のマニフェストの形式です: {self.manifest.get('format_version')}")
+        self._verify_sizes()
+        if verify_checksums:
+            self.verify_checksums()
+
+        # Faissとチャンクはメモリマップで開き、プロセス間でページを共有する
+        self.faiss_index = faiss.read_index(self.path('faiss'), faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        self.bm25_index = BM25Index.load(self.path('bm25'))
+        self.chunks = ChunkStore(self.path('chunks'))
+        self._verify_contents()
+
+    @property
+    def build_id(self):
+        return self.manifest['build_id']
+
+    def path(self, role):
+        return os.path.join(self.build_dir, self.manifest['files'][role]['name'])
+
+    def _verify_sizes(self):
+        for entry in self.manifest['files'].values():
+            path = os.path.join(self.build_dir, entry['name'])
+            if not os.path.exists(path) or os.path.getsize(path) != entry['bytes']:
+                raise IndexBundleError(f"{entry['name']} がマニフェストと一致しません（欠落またはサイズ不一致）。")
+
+    def verify_checksums(self):
+        """全ファイルのSHA-256をマニフェストと照合する。ファイル全体を読むため、大きなバンドルでは時間がかかる"""
+        for entry in self.manifest['files'].values():
+            if _sha256_of_file(os.path.join(self.build_dir, entry['name'])) != entry['sha256']:
+                raise IndexBundleError(f"{entry['name']} のチェックサムがマニフェストと一致しません。")
+
+    def _verify_contents(self):
+        rows = self.manifest['row_count']
+        counts = {'faiss': self.faiss_index.ntotal, 'bm25': self.bm25_index.n_docs, 'chunks': len(self.chunks)}
+        mismatched = {role: n for role, n in counts.items() if n != rows}
+        if mismatched:
+            raise IndexBundleError(f"行数がマニフェスト ({rows}) と一致しません: {mismatched}")
+        if self.faiss_index.d != self.manifest['embedding']['dimension']:
+            raise IndexBundleError(f"Faissの次元 ({self.faiss_index.d}) がマニフェスト ({self.manifest['embedding']['dimension']}) と一致しません。")
+
+    def create_embedding_backend(self):
+        """インデックス作成時と同じ埋め込みバックエンドを作る"""
+        embedding = self.manifest['embedding']
+        if embedding['backend'] == "local":
+            backend = LocalEmbeddingBackend(model_path=self.path('embedding_model'))
+        elif embedding['backend'] == "gemini":
+            backend = GeminiEmbeddingBackend(model=embedding['model'])
+        else:
+            raise IndexBundleError(f"未対応の埋め込みバックエンドです: {embedding['backend']}")
+        if backend.name != embedding['model'] or backend.dimension != embedding['dimension']:
+            raise IndexBundleError(f"埋め込みモデル ({backend.name}, {backend.dimension}次元) がマニフェスト "
+                                   f"({embedding['model']}, {embedding['dimension']}次元) と一致しません。")
+        return backend
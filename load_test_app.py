@@ -0,0 +1,193 @@
+import os
+import time
+import uuid
+import pickle
+import random
+import argparse
+import resource
+import traceback
+import statistics
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# 負荷試験ではネットワークやディスク上の進捗DBを使わない
+os.environ.setdefault("PROGRESS_STORE", "memory")
+os.environ.setdefault("GEMINI_API_KEY", "")
+
+from streamlit.testing.v1 import AppTest
+
+# --- 設定項目 ---
+APP_FILE = "streamlit_app.py"
+DEFAULT_SESSIONS = 20
+# AppTest は同じプロセス内で並行に動かすと互いの実行を待ち合わせて止まるため、各セッションは別プロセスで動かす
+# （キャッシュはプロセスごとになる）。既定ではCPU数までに抑え、CPUの取り合いがレイテンシに混ざらないようにする
+DEFAULT_CONCURRENCY = min(4, os.cpu_count() or 1)
+DEFAULT_QUESTIONS_PER_SESSION = 5
+RERUN_TIMEOUT = 30  # 秒
+
+
+def current_rss_bytes():
+    """現在の常駐メモリ量を返す。/procがない環境では最大常駐メモリ量で代用する"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+def find_button(at, label_prefix):
+    for button in at.button:
+        if button.label.startswith(label_prefix):
+            return button
+    return None
+
+
+class SimulatedLearner:
+    """1人の学習者として、クイズの開始・回答・移動・復習を行う"""
+
+    def __init__(self, session_number, questions_per_session, seed):
+        self.session_number = session_number
+        self.questions_per_session = questions_per_session
+        self.rng = random.Random(seed)
+        self.latencies = []
+        self.errors = []
+        self.rss_growth_bytes = 0
+        self.at = AppTest.from_file(APP_FILE, default_timeout=RERUN_TIMEOUT)
+        self.at.query_params["user"] = f"loadtest-{uuid.uuid4().hex}"
+
+    def _run(self):
+        start = time.perf_counter()
+        self.at.run(timeout=RERUN_TIMEOUT)
+        self.latencies.append((time.perf_counter() - start) * 1000)
+        if self.at.exception:
+            self.errors.extend(str(e.message) for e in self.at.exception)
+
+    def _click(self, label_prefix):
+        button = find_button(self.at, label_prefix)
+        if button is None:
+            return False
+        button.click()
+        self._run()
+        return True
+
+    def _answer_current_question(self):
+        """半分程度は正解、残りはランダムに回答する"""
+        state = self.at.session_state
+        active_list = state["review_history"] if state["is_review_mode"] else state["navigator"].history
+        question = questions_by_id[active_list[state["current_index"]]]
+        if self.rng.random() < 0.5:
+            selected = set(question.correct_answers)
+        else:
+            selected = set(self.rng.sample(question.choice_keys, question.num_correct_answers))
+        for checkbox in self.at.checkbox:
+            if checkbox.label.split(".", 1)[0] in selected:
+                checkbox.check()
+        return self._click("回答を決定")
+
+    def run_scenario(self):
+        """シナリオを実行する。途中で例外が起きても、そこまでの計測結果とエラーを残して返す"""
+        try:
+            self._run()
+            # アプリの読み込み後からの増加分を、このセッションが使ったメモリとみなす
+            rss_start = current_rss_bytes()
+            self._run_steps()
+            self.rss_growth_bytes = current_rss_bytes() - rss_start
+        except Exception as e:
+            self.errors.append(f"{type(e).__name__}: {e}")
+            traceback.print_exc()
+        return self
+
+    def _run_steps(self):
+        if not self._click("学習を開始する"):
+            self.errors.append("開始ボタンが見つかりません。")
+            return
+        for _ in range(self.questions_per_session):
+            if not self._answer_current_question():
+                break
+            if not self._click("次の問題へ"):
+                break
+        if self._click("復習する"):
+            self._answer_current_question()
+
+    def session_state_bytes(self):
+        total = 0
+        for value in self.at.session_state.filtered_state.values():
+            try:
+                total += len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+            except Exception:
+                pass
+        return total
+
+    def result(self):
+        """親プロセスに返す計測結果"""
+        try:
+            state_bytes = self.session_state_bytes()
+        except Exception:
+            state_bytes = None
+        return {'latencies': self.latencies, 'errors': self.errors, 'state_bytes': state_bytes, 'rss_growth_bytes': self.rss_growth_bytes}
+
+
+questions_by_id = {}
+
+def load_questions():
+    """アプリと同じ問題集を使い、相対パスもアプリと揃える（ワーカープロセスごとに呼ぶ）"""
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    from bank_registry import BankRegistry, DEFAULT_BANK_ID
+    questions_by_id.update(BankRegistry().get(DEFAULT_BANK_ID).questions_dict)
+
+def run_learner(session_number, questions_per_session, seed):
+    try:
+        learner = SimulatedLearner(session_number, questions_per_session, seed)
+    except Exception as e:
+        return {'latencies': [], 'errors': [f"{type(e).__name__}: {e}"], 'state_bytes': None, 'rss_growth_bytes': 0}
+    return learner.run_scenario().result()
+
+def main():
+    parser = argparse.ArgumentParser(description="streamlit_app.py の同時セッション負荷試験")
+    parser.add_argument("--sessions", type=int, default=DEFAULT_SESSIONS, help="模擬する学習者の数")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="同時に実行するセッション数")
+    parser.add_argument("--questions", type=int, default=DEFAULT_QUESTIONS_PER_SESSION, help="1セッションで回答する問題数")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"--- 負荷試験を開始: {args.sessions}セッション (同時実行 {args.concurrency}) ---")
+    results = []
+    start = time.perf_counter()
+    # AppTest は実行中に __main__ を差し替えるため、ワーカーを使い回さず1セッションごとに新しいプロセスで動かす
+    with ProcessPoolExecutor(max_workers=args.concurrency, initializer=load_questions, max_tasks_per_child=1) as pool:
+        futures = {pool.submit(run_learner, i, args.questions, args.seed + i): i for i in range(args.sessions)}
+        for future in as_completed(futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                # ワーカープロセス自体が落ちた場合も、そのセッションのエラーとして集計を続ける
+                results.append({'latencies': [], 'errors': [f"セッション {futures[future]}: {type(e).__name__}: {e}"],
+                                'state_bytes': None, 'rss_growth_bytes': 0})
+            print(f"  - セッション {len(results)} / {args.sessions} 完了")
+    elapsed = time.perf_counter() - start
+
+    latencies = [ms for r in results for ms in r['latencies']]
+    errors = [e for r in results for e in r['errors']]
+    state_sizes = [r['state_bytes'] for r in results if r['state_bytes'] is not None]
+    rss_growth = [r['rss_growth_bytes'] for r in results]
+
+    print("\n--- 負荷試験の結果 ---")
+    print(f"  再実行回数: {len(latencies)}回 ／ 所要時間: {elapsed:.2f}秒")
+    print(f"  スループット: {len(latencies) / elapsed:.1f} 再実行/秒")
+    print(f"  レイテンシ p50: {percentile(latencies, 50):.1f} ms ／ p95: {percentile(latencies, 95):.1f} ms ／ p99: {percentile(latencies, 99):.1f} ms")
+    if latencies:
+        print(f"  レイテンシ 平均: {statistics.mean(latencies):.1f} ms ／ 最大: {max(latencies):.1f} ms")
+    print(f"  セッション状態 (平均): {statistics.mean(state_sizes) / 1024 if state_sizes else 0:.1f} KB")
+    print(f"  常駐メモリ増加量 (1セッションあたり, アプリ読み込み後): {statistics.mean(rss_growth) / 1024 if rss_growth else 0:.1f} KB")
+    if errors:
+        print(f"  ❌ エラー: {len(errors)}件 (例: {errors[0]})")
+    else:
+        print("  ✅ エラーはありませんでした。")
+
+if __name__ == "__main__":
+    main()
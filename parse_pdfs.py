@@ -3,6 +3,7 @@ import yaml
 import re
 import os
 import glob
+from document_loader import write_documents_jsonl
 
 
 # --- 設定項目 ---
@@ -100,6 +101,8 @@ def structure_text_into_sections(full_text, section_titles, source_filename):
 def save_as_yaml(data, filename):
     with open(filename, 'w', encoding='utf-8') as f:
         yaml.dump(data, f, allow_unicode=True, sort_keys=False, indent=2)
+    # ベクトル化の際に高速に逐次読み込みできるよう、JSONL形式でも保存する
+    write_documents_jsonl(data, filename)
     print(f"\n成功！ 合計{len(data)}件の記事が '{filename}' に保存されました。")
 
 # --- メイン処理 ---
@@ -0,0 +1,207 @@
+import os
+import sys
+import json
+import time
+import pickle
+import functools
+import threading
+from contextlib import contextmanager
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+# --- 設定項目 ---
+# 環境変数 QUIZ_PERF=1 または URLの ?perf=1 で計測を有効にする
+PERF_ENV_FLAG = os.getenv("QUIZ_PERF", "") == "1"
+PERF_QUERY_PARAM = "perf"
+PERF_LOG_FILE = os.getenv("QUIZ_PERF_LOG", "perf_log.jsonl")
+
+# セッション状態のサイズは重いため、この回数に1回だけ計測する
+STATE_SAMPLE_EVERY = 10
+
+# 呼び出し回数を数えるウィジェット
+WIDGET_FUNCTIONS = ("button", "checkbox", "radio", "selectbox", "text_input", "number_input", "form_submit_button")
+
+_active = threading.local()
+_patch_lock = threading.Lock()
+_patched = False
+_log_lock = threading.Lock()
+
+
+def _count_widget(name, func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        profiler = getattr(_active, 'profiler', None)
+        if profiler is not None:
+            profiler.widget_counts[name] = profiler.widget_counts.get(name, 0) + 1
+        return func(*args, **kwargs)
+    return wrapper
+
+def _patch_widgets():
+    """ウィジェット関数を、計測中のみ呼び出し回数を数えるラッパーに置き換える"""
+    global _patched
+    with _patch_lock:
+        if _patched:
+            return
+        for name in WIDGET_FUNCTIONS:
+            setattr(st, name, _count_widget(name, getattr(st, name)))
+        _patched = True
+
+def estimate_session_state_size():
+    """セッション状態のキーごとのおおよそのサイズ（バイト）を返す"""
+    sizes = {}
+    for key in list(st.session_state.keys()):
+        value = st.session_state[key]
+        try:
+            sizes[key] = len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        except Exception:
+            sizes[key] = sys.getsizeof(value)
+    return sizes
+
+
+class RerunProfiler:
+    """1回の再実行について、区間ごとの処理時間とウィジェット数を記録する"""
+
+    def __init__(self, run_number):
+        self.run_number = run_number
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.sections = {}
+        self.widget_counts = {}
+        self.state_sizes = None
+        self._current = None
+        self._current_start = None
+
+    def begin(self, name):
+        """区間を開始する。直前の区間はここで終了する"""
+        now = time.perf_counter()
+        self._end_current(now)
+        self._current, self._current_start = name, now
+
+    def _end_current(self, now):
+        if self._current is not None:
+            self.sections[self._current] = self.sections.get(self._current, 0.0) + (now - self._current_start) * 1000
+            self._current = None
+
+    @contextmanager
+    def section(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.sections[name] = self.sections.get(name, 0.0) + (time.perf_counter() - start) * 1000
+
+    def finish(self):
+        now = time.perf_counter()
+        self._end_current(now)
+        return {
+            'run': self.run_number,
+            'timestamp': self.started_at,
+            'total_ms': round((now - self._start) * 1000, 3),
+            'sections_ms': {name: round(ms, 3) for name, ms in self.sections.items()},
+            'widgets': sum(self.widget_counts.values()),
+            'widget_counts': self.widget_counts,
+            'session_state_bytes': sum(self.state_sizes.values()) if self.state_sizes is not None else None,
+            'session_state_top': sorted(self.state_sizes.items(), key=lambda kv: -kv[1])[:5] if self.state_sizes is not None else None,
+        }
+
+
+class NullProfiler:
+    """計測が無効な場合に使う、何もしないプロファイラ"""
+
+    def begin(self, name):
+        pass
+
+    @contextmanager
+    def section(self, name):
+        yield
+
+    def finish(self):
+        pass
+
+
+def _write_log(record):
+    with _log_lock:
+        with open(PERF_LOG_FILE, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+def _finalize(profiler):
+    record = profiler.finish()
+    st.session_state._perf_last = record
+    _write_log(record)
+
+def is_enabled():
+    return PERF_ENV_FLAG or st.query_params.get(PERF_QUERY_PARAM) == "1"
+
+def start_rerun_profiler():
+    """再実行の先頭で呼ぶ。st.stop()やst.rerun()で終わった前回分もここで記録する"""
+    pending = st.session_state.pop('_perf_pending', None)
+    if pending is not None:
+        _finalize(pending)
+    if not is_enabled():
+        _active.profiler = None
+        return NullProfiler()
+
+    _patch_widgets()
+    run_number = st.session_state.get('_perf_runs', 0) + 1
+    st.session_state._perf_runs = run_number
+    profiler = RerunProfiler(run_number)
+    if run_number % STATE_SAMPLE_EVERY == 1:
+        profiler.state_sizes = estimate_session_state_size()
+    st.session_state._perf_pending = profiler
+    _active.profiler = profiler
+    return profiler
+
+def finish_rerun_profiler(profiler):
+    """再実行の最後で呼ぶ"""
+    if st.session_state.get('_perf_pending') is profiler:
+        del st.session_state['_perf_pending']
+        _finalize(profiler)
+    _active.profiler = None
+
+def active_profiler():
+    """実行中の再実行（フラグメント単独の再実行を含む）のプロファイラを返す。計測が無効な場合は何もしないプロファイラ"""
+    return getattr(_active, 'profiler', None) or NullProfiler()
+
+def is_fragment_rerun():
+    """フラグメントだけが再実行されている場合にTrueを返す"""
+    ctx = get_script_run_ctx()
+    return bool(ctx and getattr(ctx, 'fragment_ids_this_run', None))
+
+def profiled_fragment(name):
+    """フラグメント単独の再実行も1件の計測結果として記録するデコレーター"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not is_fragment_rerun() or not is_enabled():
+                return func(*args, **kwargs)
+            _patch_widgets()
+            profiler = RerunProfiler(st.session_state.get('_perf_runs', 0))
+            outer_profiler = getattr(_active, 'profiler', None)
+            _active.profiler = profiler
+            try:
+                with profiler.section(name):
+                    return func(*args, **kwargs)
+            finally:
+                _active.profiler = outer_profiler
+                record = profiler.finish()
+                record['fragment'] = name
+                st.session_state._perf_last = record
+                _write_log(record)
+        return wrapper
+    return decorator
+
+def render_perf_panel():
+    """開発者向けに、直前の再実行の計測結果をサイドバーに表示する"""
+    if not is_enabled():
+        return
+    record = st.session_state.get('_perf_last')
+    with st.sidebar.expander("🛠 パフォーマンス計測", expanded=False):
+        if not record:
+            st.caption("計測結果はまだありません。")
+            return
+        scope = f"フラグメント {record['fragment']}" if record.get('fragment') else "アプリ全体"
+        st.caption(f"再実行 #{record['run']} ({scope}) ／ 合計 {record['total_ms']:.1f} ms ／ ウィジェット {record['widgets']}個")
+        st.table({"区間": list(record['sections_ms']), "ms": list(record['sections_ms'].values())})
+        if record['session_state_bytes'] is not None:
+            st.caption(f"セッション状態: 約 {record['session_state_bytes'] / 1024:.1f} KB")
+        st.caption(f"ログ: {PERF_LOG_FILE}")
@@ -2,6 +2,7 @@ import asyncio
 from playwright.async_api import async_playwright
 import yaml
 from urllib.parse import urljoin
+from document_loader import write_documents_jsonl
 
 # --- 設定項目 ---
 START_URL = "https://help.salesforce.com/s/articleView?id=data.c360_a_product_considerations.htm&type=5&language=ja"
@@ -125,6 +126,8 @@ async def main():
             if all_articles:
                 with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
                     yaml.dump(all_articles, f, allow_unicode=True, sort_keys=False, indent=2)
+                # ベクトル化の際に高速に逐次読み込みできるよう、JSONL形式でも保存する
+                write_documents_jsonl(all_articles, OUTPUT_FILE)
                 print(f"\n✅ {len(all_articles)} 件の記事を {OUTPUT_FILE} に保存しました。")
             else:
                 print("❌ 有効な記事が取得できませんでした。")
@@ -1,16 +1,16 @@
 import os
 import yaml
-import faiss
-import numpy as np
 import google.generativeai as genai
-import pickle
 from dotenv import load_dotenv
-from rank_bm25 import BM25Okapi
 import time
 import json
 import re
 import asyncio
 from tqdm.asyncio import tqdm_asyncio
+from vector_index import prepare_vectors
+from bm25_index import simple_tokenizer
+from search_merge import merge_search_candidates
+from index_bundle import INDEX_BUNDLE_ROOT, IndexBundle, IndexBundleError
 
 # .envファイルから環境変数を読み込む
 load_dotenv()
@@ -26,9 +26,6 @@ MAX_RETRIES = 3
 # 入力ファイル
 EXAM_QUESTIONS_FILE = os.path.join("Salesforce_Question", "salesforce_exam_questions.yaml")
 GLOSSARY_FILE = "salesforce_master_glossary.yaml"
-FAISS_INDEX_FILE = "salesforce_docs.faiss"
-TEXT_CHUNKS_FILE = "salesforce_docs_chunks.pkl"
-BM25_INDEX_FILE = "salesforce_docs.bm25"
 
 # 出力ファイル
 OUTPUT_PROCESSED_FILE = os.path.join("Salesforce_Question", "salesforce_exam_questions_final.yaml")
@@ -72,39 +69,22 @@ async def translate_explanation_async(model, explanation, glossary_str):
     except Exception:
         return "（翻訳失敗）\n" + explanation
 
-def simple_tokenizer(text):
-    """BM25の検索クエリ用の簡易的なトークナイザー"""
-    return re.findall(r'[A-Za-z0-9]+|[\u3040-\u309F\u30A0-\u30FF\u4E00-\u9FFF]+', text.lower())
-
-async def hybrid_search_async(query, faiss_index, bm25_index, chunks, embedding_model, bm25_top_n=30, final_top_k=10):
+async def hybrid_search_async(query, faiss_index, bm25_index, chunks, embedding_backend, bm25_top_n=30, final_top_k=10):
     """ハイブリッド検索を実行し、最終的な候補チャンクを返す"""
     tokenized_query = simple_tokenizer(query)
-    bm25_scores = bm25_index.get_scores(tokenized_query)
-    bm25_top_indices = np.argsort(bm25_scores)[::-1][:bm25_top_n]
+    bm25_top_indices, _ = bm25_index.top_k(tokenized_query, bm25_top_n)
     bm25_candidates = [chunks[i] for i in bm25_top_indices]
     
     vector_candidates = []
     try:
-        await asyncio.sleep(1.2)
-        result = await genai.embed_content_async(
-            model=embedding_model,
-            content=query,
-            task_type="RETRIEVAL_QUERY"
-        )
-        query_vector = result['embedding']
-        _, faiss_top_indices = faiss_index.search(np.array([query_vector]).astype('float32'), final_top_k)
-        vector_candidates = [chunks[i] for i in faiss_top_indices[0]]
+        query_vector = await embedding_backend.embed_query_async(query)
+        # PCAによる次元削減はインデックスに含まれているため、クエリにも作成時と同じ変換がかかる
+        _, faiss_top_indices = faiss_index.search(prepare_vectors(faiss_index, query_vector), final_top_k)
+        vector_candidates = [chunks[i] for i in faiss_top_indices[0] if i >= 0]
     except Exception as e:
         print(f"      - ✖ ベクトル検索エラー: {e}")
 
-    final_candidates = []
-    seen_texts = set()
-    for chunk in vector_candidates + bm25_candidates:
-        if chunk["text"] not in seen_texts:
-            final_candidates.append(chunk)
-            seen_texts.add(chunk["text"])
-            
-    return final_candidates[:final_top_k]
+    return merge_search_candidates(vector_candidates, bm25_candidates, final_top_k)
 
 async def select_and_verify_docs_with_ai_async(model, question, candidate_docs):
     """候補ドキュメントの中から、Geminiが最適なものを厳選し、答えを検証する（リトライ対応）"""
@@ -156,7 +136,7 @@ async def select_and_verify_docs_with_ai_async(model, question, candidate_docs):
     except Exception as e:
         return {'related_docs': [], 'excluded_docs': [], 'ai_verification': {'status': 'エラー', 'justification': f'AI処理中にエラーが発生しました: {e}'}}
 
-async def process_single_question_async(question, model, embedding_model, faiss_index, bm25_index, chunks, glossary_str):
+async def process_single_question_async(question, model, embedding_backend, faiss_index, bm25_index, chunks, glossary_str):
     """1つの問題に対する全処理を非同期で実行する。失敗した場合はNoneを返す"""
     try:
         jp_explanation = await translate_explanation_async(model, question.get('explanation', ''), glossary_str)
@@ -166,7 +146,7 @@ async def process_single_question_async(question, model, embedding_model, faiss_
         correct_answer_full_text = " ".join(correct_answer_texts)
         enhanced_query = f"{question['question_text']} {correct_answer_full_text} {jp_explanation}"
         
-        candidate_chunks = await hybrid_search_async(enhanced_query, faiss_index, bm25_index, chunks, embedding_model)
+        candidate_chunks = await hybrid_search_async(enhanced_query, faiss_index, bm25_index, chunks, embedding_backend)
         
         analysis_result = await select_and_verify_docs_with_ai_async(model, question, candidate_chunks)
         
@@ -190,7 +170,6 @@ async def main_async():
 
     genai.configure(api_key=GEMINI_API_KEY)
     model = genai.GenerativeModel('gemini-1.5-pro-latest')
-    embedding_model = "models/text-embedding-004"
     
     print("--- 必要なデータを読み込んでいます ---")
     glossary_str = ""
@@ -202,13 +181,15 @@ async def main_async():
     with open(EXAM_QUESTIONS_FILE, 'r', encoding='utf-8') as f:
         exam_questions = yaml.safe_load(f)
     print(f"✔ 試験問題を {len(exam_questions)} 問読み込みました。")
-    faiss_index = faiss.read_index(FAISS_INDEX_FILE)
-    with open(TEXT_CHUNKS_FILE, 'rb') as f:
-        chunks = pickle.load(f)
-    print(f"✔ ベクトルデータベースを読み込みました。")
-    with open(BM25_INDEX_FILE, 'rb') as f:
-        bm25_index = pickle.load(f)
-    print(f"✔ BM25キーワードインデックスを読み込みました。")
+    # Faiss・BM25・チャンクは、マニフェストで整合性を確かめた1つのビルドからまとめて開く
+    try:
+        bundle = IndexBundle(INDEX_BUNDLE_ROOT)
+        embedding_backend = bundle.create_embedding_backend()
+    except IndexBundleError as e:
+        print(f"エラー: 検索インデックスを開けません: {e}")
+        return
+    faiss_index, bm25_index, chunks = bundle.faiss_index, bundle.bm25_index, bundle.chunks
+    print(f"✔ ベクトルデータベースとBM25キーワードインデックスを読み込みました (ビルド {bundle.build_id})。")
 
     processed_questions_dict = {}
     if os.path.exists(OUTPUT_PROCESSED_FILE):
@@ -225,7 +206,7 @@ async def main_async():
 
     print(f"\n--- 未処理の {len(questions_to_process)}問の事前処理を最大{MAX_CONCURRENT_TASKS}件の並列処理で開始 ---")
 
-    tasks = [process_single_question_async(q, model, embedding_model, faiss_index, bm25_index, chunks, glossary_str) for q in questions_to_process]
+    tasks = [process_single_question_async(q, model, embedding_backend, faiss_index, bm25_index, chunks, glossary_str) for q in questions_to_process]
     
     newly_processed_results = await tqdm_asyncio.gather(*tasks)
 
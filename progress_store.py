@@ -0,0 +1,264 @@
+import os
+import json
+import time
+import queue
+import atexit
+import sqlite3
+import threading
+from review_scheduler import ReviewCard
+
+# --- 設定項目 ---
+# 使用するバックエンド ("sqlite" または "memory")
+PROGRESS_STORE_BACKEND = os.getenv("PROGRESS_STORE", "sqlite")
+PROGRESS_DB_FILE = os.getenv("PROGRESS_DB_FILE", "quiz_progress.sqlite3")
+
+# 非同期書き込みの設定
+WRITE_BATCH_SIZE = 100
+WRITE_FLUSH_INTERVAL = 0.5  # 秒
+# 書き込みに失敗したバッチは破棄せず、待ち時間を倍々に延ばしながら（上限あり）書き込み直す
+WRITE_RETRY_BASE_DELAY = 0.5  # 秒
+WRITE_RETRY_MAX_DELAY = 30.0  # 秒
+# 終了時に未書き込みの進捗の保存を待つ最大時間
+EXIT_FLUSH_TIMEOUT = 10.0  # 秒
+
+UPSERT_ANSWER_SQL = """
+    INSERT INTO answers (user_id, question_id, answers, is_correct, answered_at)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (user_id, question_id) DO UPDATE SET
+        answers = excluded.answers,
+        is_correct = excluded.is_correct,
+        answered_at = excluded.answered_at
+"""
+UPSERT_REVIEW_CARD_SQL = """
+    INSERT INTO review_cards (user_id, question_id, easiness, interval, repetitions, due)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT (user_id, question_id) DO UPDATE SET
+        easiness = excluded.easiness,
+        interval = excluded.interval,
+        repetitions = excluded.repetitions,
+        due = excluded.due
+"""
+
+
+def empty_progress():
+    """学習進捗の初期状態を返す"""
+    return {'answered_ids': set(), 'wrong_answer_ids': set(), 'all_user_answers': {}}
+
+def _apply_answer(progress, question_id, answers, is_correct):
+    progress['answered_ids'].add(question_id)
+    progress['all_user_answers'][question_id] = list(answers)
+    if is_correct:
+        progress['wrong_answer_ids'].discard(question_id)
+    else:
+        progress['wrong_answer_ids'].add(question_id)
+
+
+class ProgressStore:
+    """学習進捗の保存先の共通インターフェース"""
+
+    def load(self, user_id):
+        """ユーザーの進捗を answered_ids / wrong_answer_ids / all_user_answers の辞書で返す"""
+        raise NotImplementedError
+
+    def record_answer(self, user_id, question_id, answers, is_correct):
+        """回答を1件記録する。書き込みは非同期でもよい"""
+        raise NotImplementedError
+
+    def load_review_cards(self, user_id):
+        """ユーザーの復習カード (ReviewCard) のリストを返す"""
+        raise NotImplementedError
+
+    def record_review_card(self, user_id, card):
+        """更新された復習カードを1件記録する。書き込みは非同期でもよい"""
+        raise NotImplementedError
+
+    def flush(self):
+        """未書き込みの回答を全て保存する"""
+
+    def close(self):
+        self.flush()
+
+
+class InMemoryProgressStore(ProgressStore):
+    """プロセス内のみで保持する進捗ストア（テスト・開発用）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._progress = {}
+        self._review_cards = {}
+
+    def load(self, user_id):
+        with self._lock:
+            progress = self._progress.get(user_id) or empty_progress()
+            return {
+                'answered_ids': set(progress['answered_ids']),
+                'wrong_answer_ids': set(progress['wrong_answer_ids']),
+                'all_user_answers': dict(progress['all_user_answers']),
+            }
+
+    def record_answer(self, user_id, question_id, answers, is_correct):
+        with self._lock:
+            progress = self._progress.setdefault(user_id, empty_progress())
+            _apply_answer(progress, question_id, answers, is_correct)
+
+    def load_review_cards(self, user_id):
+        with self._lock:
+            return [ReviewCard.from_row(row) for row in self._review_cards.get(user_id, {}).values()]
+
+    def record_review_card(self, user_id, card):
+        with self._lock:
+            self._review_cards.setdefault(user_id, {})[card.question_id] = card.to_row()
+
+
+class SQLiteProgressStore(ProgressStore):
+    """SQLite (WALモード) に進捗を保存するストア。書き込みはバックグラウンドでまとめて行う"""
+
+    def __init__(self, db_path=PROGRESS_DB_FILE, batch_size=WRITE_BATCH_SIZE, flush_interval=WRITE_FLUSH_INTERVAL):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS answers (
+                    user_id TEXT NOT NULL,
+                    question_id INTEGER NOT NULL,
+                    answers TEXT NOT NULL,
+                    is_correct INTEGER NOT NULL,
+                    answered_at REAL NOT NULL,
+                    PRIMARY KEY (user_id, question_id)
+                ) WITHOUT ROWID
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS review_cards (
+                    user_id TEXT NOT NULL,
+                    question_id INTEGER NOT NULL,
+                    easiness REAL NOT NULL,
+                    interval INTEGER NOT NULL,
+                    repetitions INTEGER NOT NULL,
+                    due REAL NOT NULL,
+                    PRIMARY KEY (user_id, question_id)
+                ) WITHOUT ROWID
+            """)
+        self._queue = queue.Queue()
+        # まだ書き込まれていない記録 (user_id -> {(SQL, question_id): パラメータ})。読み込み時に重ねて返す
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._writer = threading.Thread(target=self._write_loop, name="progress-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self._flush_at_exit)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _connection(self):
+        """スレッドごとに接続を使い回す"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def load(self, user_id):
+        # 主キー (user_id, question_id) の索引を使う1回のクエリで読み込む
+        rows = self._connection().execute(
+            "SELECT question_id, answers, is_correct FROM answers WHERE user_id = ?", (user_id,)
+        ).fetchall()
+        progress = empty_progress()
+        # 書き込み待ちの回答はDBの内容より新しいので、後から重ねる
+        for question_id, answers, is_correct, *_ in rows + self._pending_rows(user_id, UPSERT_ANSWER_SQL):
+            _apply_answer(progress, question_id, json.loads(answers), is_correct)
+        return progress
+
+    def record_answer(self, user_id, question_id, answers, is_correct):
+        self._enqueue(UPSERT_ANSWER_SQL, (user_id, question_id, json.dumps(list(answers)), int(is_correct), time.time()))
+
+    def load_review_cards(self, user_id):
+        rows = self._connection().execute(
+            "SELECT question_id, easiness, interval, repetitions, due FROM review_cards WHERE user_id = ?", (user_id,)
+        ).fetchall()
+        cards = {row[0]: row for row in rows}
+        for row in self._pending_rows(user_id, UPSERT_REVIEW_CARD_SQL):
+            cards[row[0]] = row
+        return [ReviewCard.from_row(row) for row in cards.values()]
+
+    def record_review_card(self, user_id, card):
+        self._enqueue(UPSERT_REVIEW_CARD_SQL, (user_id, *card.to_row()))
+
+    def _enqueue(self, sql, params):
+        with self._pending_lock:
+            self._pending.setdefault(params[0], {})[(sql, params[1])] = params
+        self._queue.put((sql, params))
+
+    def _pending_rows(self, user_id, sql):
+        """ユーザーの書き込み待ちの記録を、SELECT の結果と同じ並び (user_id を除く) で返す"""
+        with self._pending_lock:
+            pending = self._pending.get(user_id, {})
+            return [params[1:] for (pending_sql, _), params in pending.items() if pending_sql == sql]
+
+    def _mark_written(self, batch):
+        with self._pending_lock:
+            for sql, params in batch:
+                pending = self._pending.get(params[0])
+                # 書き込み中に同じ問題の記録が更新されていれば、新しい方を残す
+                if pending is not None and pending.get((sql, params[1])) is params:
+                    del pending[(sql, params[1])]
+                    if not pending:
+                        del self._pending[params[0]]
+
+    def _write_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            delay = WRITE_RETRY_BASE_DELAY
+            while True:
+                try:
+                    self._write_batch(batch)
+                    break
+                except sqlite3.Error as e:
+                    print(f"✖ 進捗の保存中にエラーが発生しました ({len(batch)}件)。{delay:.1f}秒後に再試行します: {e}")
+                    time.sleep(delay)
+                    delay = min(delay * 2, WRITE_RETRY_MAX_DELAY)
+            self._mark_written(batch)
+            for _ in batch:
+                self._queue.task_done()
+
+    def _write_batch(self, batch):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # 1バッチを1トランザクションでまとめて書き込む
+            for sql, params in batch:
+                conn.execute(sql, params)
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            conn.execute("ROLLBACK")
+            raise
+
+    def flush(self):
+        self._queue.join()
+
+    def _flush_at_exit(self):
+        """終了時は、書き込みが失敗し続けていても EXIT_FLUSH_TIMEOUT 秒で諦める"""
+        with self._queue.all_tasks_done:
+            if not self._queue.all_tasks_done.wait_for(lambda: not self._queue.unfinished_tasks, EXIT_FLUSH_TIMEOUT):
+                print(f"✖ 保存できなかった進捗が {self._queue.unfinished_tasks}件あります。")
+
+
+def create_progress_store(backend=PROGRESS_STORE_BACKEND):
+    """設定に応じた進捗ストアを作成する"""
+    if backend == "memory":
+        return InMemoryProgressStore()
+    if backend == "sqlite":
+        return SQLiteProgressStore()
+    raise ValueError(f"未対応の進捗ストアです: {backend}")
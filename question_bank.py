@@ -0,0 +1,245 @@
+import os
+import sys
+import struct
+import hashlib
+import orjson
+import yaml
+
+# --- 設定項目 ---
+EXAM_QUESTIONS_FILE = os.path.join("Salesforce_Question", "salesforce_exam_questions_final.yaml")
+
+# コンパイル済みアーティファクトの設定
+ARTIFACT_SUFFIX = ".qbank"
+ARTIFACT_MAGIC = b"QBANK\x00"
+ARTIFACT_FORMAT_VERSION = 1
+
+# 1問あたりに必須の項目
+REQUIRED_FIELDS = ('question_id', 'question_text', 'choices', 'correct_answer')
+
+# libyamlが使える環境ではCローダーを使う（純Python版より一桁速い）
+YamlLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
+def artifact_path_for(yaml_path):
+    """YAMLファイルに対応するアーティファクトのパスを返す"""
+    return os.path.splitext(yaml_path)[0] + ARTIFACT_SUFFIX
+
+def _sha256_of_file(path):
+    """ファイル内容のSHA-256を計算する"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def validate_questions(questions):
+    """問題集全体の形式（リストであること、問題IDが重複しないこと）を検証し、不正な場合はValueErrorを送出する。
+
+    1問ごとの必須項目や選択肢の不備は、問題集全体を読めなくしないよう build_question_records で問題単位に除外する。
+    """
+    if not isinstance(questions, list):
+        raise ValueError("問題データがリスト形式ではありません。")
+    seen_ids = set()
+    for q in questions:
+        if not isinstance(q, dict) or 'question_id' not in q:
+            continue
+        if q['question_id'] in seen_ids:
+            raise ValueError(f"問題IDが重複しています: {q['question_id']}")
+        seen_ids.add(q['question_id'])
+
+class QuestionRecord:
+    """描画に必要な値を読み込み時に一度だけ計算して保持する、変更不可の問題レコード"""
+
+    __slots__ = (
+        'question_id', 'question_text', 'choices', 'choice_keys', 'choice_count',
+        'correct_answers', 'correct_answer_set', 'num_correct_answers', 'is_multiple_choice',
+        'choice_labels', 'choice_markdown', 'explanation_markdown',
+        'ai_status', 'ai_verdict', 'ai_justification', 'is_contradicted', 'related_docs',
+        'topic', 'sidebar_label', 'search_text',
+    )
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            object.__setattr__(self, name, fields[name])
+
+    def __setattr__(self, name, value):
+        raise AttributeError("QuestionRecord は変更できません。")
+
+    def __delattr__(self, name):
+        raise AttributeError("QuestionRecord は変更できません。")
+
+    def __repr__(self):
+        return f"QuestionRecord(question_id={self.question_id!r})"
+
+
+def build_question_record(question):
+    """問題の辞書からQuestionRecordを作る。不正な問題の場合はValueErrorを送出する"""
+    if not isinstance(question, dict):
+        raise ValueError(f"問題データが辞書形式ではありません: {question!r}")
+    missing = [field for field in REQUIRED_FIELDS if field not in question]
+    if missing:
+        raise ValueError(f"必須項目 {missing} がありません。")
+    q_id = question['question_id']
+    choices = {str(key): str(text) for key, text in question['choices'].items()}
+    choice_keys = tuple(sorted(choices))
+    correct_answers = tuple(sorted(key.strip() for key in str(question['correct_answer']).replace(" ", "").split(',') if key.strip()))
+    if not correct_answers:
+        raise ValueError(f"問 {q_id} に正解が設定されていません。")
+    unknown_keys = [key for key in correct_answers if key not in choices]
+    if unknown_keys:
+        raise ValueError(f"問 {q_id} の正解 {unknown_keys} が選択肢にありません。")
+
+    ai_analysis = question.get('ai_analysis') or {}
+    verification = ai_analysis.get('ai_verification') or {}
+    status = verification.get('status', '不明')
+    if "一致" in status:
+        ai_verdict = 'match'
+    elif "矛盾" in status or "判断不能" in status:
+        ai_verdict = 'warning'
+    else:
+        ai_verdict = 'error'
+
+    related_docs = tuple(
+        (
+            f"出典: {doc.get('title', 'N/A')}",
+            f"> **根拠:** {doc.get('supporting_text', 'N/A')}",
+            f"<a href='{doc.get('url', '#')}' target='_blank' rel='noopener noreferrer'>記事を読む ↗</a>",
+        )
+        for doc in ai_analysis.get('related_docs') or []
+    )
+    topic = question.get('topic') or ((ai_analysis.get('related_docs') or [{}])[0].get('title') or '')
+    flat_text = " ".join(question['question_text'].replace('\\n', ' ').split())
+
+    return QuestionRecord(
+        question_id=q_id,
+        question_text=question['question_text'],
+        choices=choices,
+        choice_keys=choice_keys,
+        choice_count=len(choice_keys),
+        correct_answers=correct_answers,
+        correct_answer_set=frozenset(correct_answers),
+        num_correct_answers=len(correct_answers),
+        is_multiple_choice=len(correct_answers) > 1,
+        choice_labels=tuple(f"{key}. {choices[key]}" for key in choice_keys),
+        choice_markdown=tuple(f"**{key}.** {choices[key]}" for key in choice_keys),
+        explanation_markdown=question.get('japanese_explanation', '（日本語の解説が見つかりません）'),
+        ai_status=status,
+        ai_verdict=ai_verdict,
+        ai_justification=verification.get('justification', '検証の理由がありません。'),
+        is_contradicted=ai_verdict == 'warning',
+        related_docs=related_docs,
+        topic=topic,
+        sidebar_label=f"問{q_id}: {flat_text}",
+        search_text=f"{q_id} {flat_text}".lower(),
+    )
+
+def build_question_records(questions):
+    """問題リストを問題ID順のQuestionRecordのリストに変換する。不正な問題は警告を出して除外する"""
+    records = []
+    for question in questions:
+        try:
+            records.append(build_question_record(question))
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            q_id = question.get('question_id', '?') if isinstance(question, dict) else '?'
+            print(f"警告: 問 {q_id} は形式が不正なため除外します: {e}")
+    records.sort(key=lambda r: r.question_id)
+    return records
+
+def load_questions_from_yaml(yaml_path):
+    """YAMLファイルから問題リストを読み込む"""
+    with open(yaml_path, 'r', encoding='utf-8') as f:
+        return yaml.load(f, Loader=YamlLoader) or []
+
+def compile_question_bank(yaml_path, artifact_path=None):
+    """YAMLの問題集を検証し、ハッシュ付きのバイナリアーティファクトにコンパイルする"""
+    artifact_path = artifact_path or artifact_path_for(yaml_path)
+    stat = os.stat(yaml_path)
+    source_sha256 = _sha256_of_file(yaml_path)
+    questions = load_questions_from_yaml(yaml_path)
+    validate_questions(questions)
+
+    payload = orjson.dumps(questions)
+    header = orjson.dumps({
+        'format_version': ARTIFACT_FORMAT_VERSION,
+        'source_sha256': source_sha256,
+        'source_size': stat.st_size,
+        'source_mtime_ns': stat.st_mtime_ns,
+        'payload_sha256': hashlib.sha256(payload).hexdigest(),
+        'question_count': len(questions),
+    })
+
+    # 書き込み途中のファイルを読まれないよう、一時ファイル経由で置き換える
+    tmp_path = f"{artifact_path}.tmp{os.getpid()}"
+    with open(tmp_path, 'wb') as f:
+        f.write(ARTIFACT_MAGIC)
+        f.write(struct.pack('<I', len(header)))
+        f.write(header)
+        f.write(payload)
+    os.replace(tmp_path, artifact_path)
+    return questions
+
+def read_artifact_header(artifact_path):
+    """アーティファクトのヘッダーと本体を読み込む。形式が不正な場合はNoneを返す"""
+    with open(artifact_path, 'rb') as f:
+        data = f.read()
+    if not data.startswith(ARTIFACT_MAGIC):
+        return None, None
+    offset = len(ARTIFACT_MAGIC)
+    (header_len,) = struct.unpack_from('<I', data, offset)
+    offset += 4
+    header = orjson.loads(data[offset:offset + header_len])
+    return header, data[offset + header_len:]
+
+def load_compiled_questions(yaml_path, artifact_path=None):
+    """最新のアーティファクトがあれば問題リストを返し、古い・壊れている場合はNoneを返す"""
+    artifact_path = artifact_path or artifact_path_for(yaml_path)
+    if not os.path.exists(artifact_path):
+        return None
+    try:
+        header, payload = read_artifact_header(artifact_path)
+    except (OSError, ValueError, struct.error):
+        return None
+    if not header or header.get('format_version') != ARTIFACT_FORMAT_VERSION:
+        return None
+
+    # まずはサイズと更新時刻で判定し、一致しない場合のみハッシュを計算する
+    stat = os.stat(yaml_path)
+    if (stat.st_size, stat.st_mtime_ns) != (header.get('source_size'), header.get('source_mtime_ns')):
+        if _sha256_of_file(yaml_path) != header.get('source_sha256'):
+            return None
+
+    if hashlib.sha256(payload).hexdigest() != header.get('payload_sha256'):
+        return None
+    questions = orjson.loads(payload)
+    if len(questions) != header.get('question_count'):
+        return None
+    return questions
+
+def load_question_bank(yaml_path=EXAM_QUESTIONS_FILE):
+    """問題集を読み込む。アーティファクトが古い場合のみYAMLから読み直し、再コンパイルする"""
+    questions = load_compiled_questions(yaml_path)
+    if questions is not None:
+        return questions
+    try:
+        return compile_question_bank(yaml_path)
+    except OSError:
+        # 読み取り専用の環境ではアーティファクトを書けないため、YAMLの内容をそのまま使う
+        questions = load_questions_from_yaml(yaml_path)
+        validate_questions(questions)
+        return questions
+
+def main(yaml_paths):
+    print("--- 問題集のコンパイルを開始 ---")
+    for yaml_path in yaml_paths:
+        if not os.path.exists(yaml_path):
+            print(f"警告: ファイル '{yaml_path}' が見つかりません。スキップします。")
+            continue
+        try:
+            questions = compile_question_bank(yaml_path)
+        except ValueError as e:
+            print(f"✖ '{yaml_path}' の検証に失敗しました: {e}")
+            continue
+        print(f"✔ '{yaml_path}' の {len(questions)}問を '{artifact_path_for(yaml_path)}' にコンパイルしました。")
+
+if __name__ == "__main__":
+    main(sys.argv[1:] or [EXAM_QUESTIONS_FILE])
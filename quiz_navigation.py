@@ -0,0 +1,98 @@
+import random
+
+# 出題順の種類
+ORDER_SEQUENTIAL = 'sequential'
+ORDER_SHUFFLED = 'shuffled'
+ORDER_BY_TOPIC = 'topic'
+ORDERINGS = (ORDER_SEQUENTIAL, ORDER_SHUFFLED, ORDER_BY_TOPIC)
+
+
+class QuizNavigator:
+    """セッションごとの出題順と閲覧履歴を管理し、次・前・ジャンプを定数時間で行う"""
+
+    def __init__(self, question_ids, order=ORDER_SEQUENTIAL, seed=None, topic_of=None):
+        if order not in ORDERINGS:
+            raise ValueError(f"未対応の出題順です: {order}")
+        self.order = order
+        self.seed = seed
+        self.question_order = self._build_order(list(question_ids), order, seed, topic_of or {})
+        self.order_index = {q_id: i for i, q_id in enumerate(self.question_order)}
+        # 出題順の位置ごとに「閲覧済みか」を持つビットマップと、未閲覧を指すポインタ
+        self.seen = bytearray(len(self.question_order))
+        self.next_unseen_pos = 0
+        # 閲覧した順の履歴と、問題IDから履歴上の位置への対応表
+        self.history = []
+        self.history_index = {}
+
+    @staticmethod
+    def _build_order(question_ids, order, seed, topic_of):
+        """出題順を一度だけ計算する（再実行のたびにソートしない）"""
+        if order == ORDER_SHUFFLED:
+            random.Random(seed).shuffle(question_ids)
+            return question_ids
+        if order == ORDER_BY_TOPIC:
+            return sorted(question_ids, key=lambda q_id: (topic_of.get(q_id) or '', q_id))
+        return sorted(question_ids)
+
+    def __len__(self):
+        return len(self.question_order)
+
+    def __contains__(self, q_id):
+        return q_id in self.history_index
+
+    def position_of(self, q_id):
+        """履歴上の位置を返す。未閲覧の場合はNone"""
+        return self.history_index.get(q_id)
+
+    def visit(self, q_id):
+        """問題を閲覧済みにして履歴上の位置を返す"""
+        pos = self.history_index.get(q_id)
+        if pos is not None:
+            return pos
+        if q_id not in self.order_index:
+            # 問題集の更新で追加された問題は出題順の末尾に加える
+            self.order_index[q_id] = len(self.question_order)
+            self.question_order.append(q_id)
+            self.seen.append(0)
+        self.seen[self.order_index[q_id]] = 1
+        self.history_index[q_id] = len(self.history)
+        self.history.append(q_id)
+        return self.history_index[q_id]
+
+    def peek_next_unseen(self):
+        """出題順で最初の未閲覧の問題IDを返す。全て閲覧済みならNone"""
+        # ポインタは前にしか進まないため、セッション全体で償却O(1)
+        while self.next_unseen_pos < len(self.seen) and self.seen[self.next_unseen_pos]:
+            self.next_unseen_pos += 1
+        if self.next_unseen_pos >= len(self.seen):
+            return None
+        return self.question_order[self.next_unseen_pos]
+
+    def visit_next_unseen(self):
+        """次の未閲覧の問題を閲覧済みにして履歴上の位置を返す。全て閲覧済みならNone"""
+        q_id = self.peek_next_unseen()
+        if q_id is None:
+            return None
+        return self.visit(q_id)
+
+    def has_unseen(self):
+        return self.peek_next_unseen() is not None
+
+    def sync(self, question_ids):
+        """問題集の更新に合わせて、削除された問題を出題順から外し、追加された問題を末尾に加える。
+
+        閲覧履歴はそのまま残す（削除された問題に戻った場合は、呼び出し側で扱う）。
+        """
+        question_ids = set(question_ids)
+        kept = [q_id for q_id in self.question_order if q_id in question_ids]
+        added = sorted(question_ids - set(kept))
+        if len(kept) == len(self.question_order) and not added:
+            return
+        self.question_order = kept + added
+        self.order_index = {q_id: i for i, q_id in enumerate(self.question_order)}
+        self.seen = bytearray(q_id in self.history_index for q_id in self.question_order)
+        self.next_unseen_pos = 0
+
+    @property
+    def first_question_id(self):
+        return self.question_order[0] if self.question_order else None
@@ -0,0 +1,117 @@
+import time
+import heapq
+import itertools
+
+# SM-2 の設定
+DEFAULT_EASINESS = 2.5
+MIN_EASINESS = 1.3
+SECONDS_PER_DAY = 24 * 60 * 60
+
+# 正解・不正解をSM-2の回答品質 (0-5) に対応付ける
+QUALITY_CORRECT = 4
+QUALITY_WRONG = 2
+
+
+class ReviewCard:
+    """1問分の復習スケジュール"""
+
+    __slots__ = ('question_id', 'easiness', 'interval', 'repetitions', 'due')
+
+    def __init__(self, question_id, easiness=DEFAULT_EASINESS, interval=0, repetitions=0, due=0.0):
+        self.question_id = question_id
+        self.easiness = easiness
+        self.interval = interval  # 日数
+        self.repetitions = repetitions
+        self.due = due  # UNIX時刻
+
+    def to_row(self):
+        return (self.question_id, self.easiness, self.interval, self.repetitions, self.due)
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(*row)
+
+
+def sm2_update(card, quality, now):
+    """SM-2アルゴリズムで次回の復習日時を更新する"""
+    if quality < 3:
+        card.repetitions = 0
+        card.interval = 1
+    else:
+        card.repetitions += 1
+        if card.repetitions == 1:
+            card.interval = 1
+        elif card.repetitions == 2:
+            card.interval = 6
+        else:
+            card.interval = round(card.interval * card.easiness)
+    card.easiness = max(MIN_EASINESS, card.easiness + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+    card.due = now + card.interval * SECONDS_PER_DAY
+    return card
+
+
+class ReviewScheduler:
+    """期限順のヒープで復習カードを管理する。次の期限到来カードの取得はO(log n)"""
+
+    def __init__(self, cards=()):
+        self.cards = {}
+        self._heap = []
+        self._entries = {}  # 問題ID -> ヒープ内の有効なエントリ
+        # 期限が同じエントリの順序を決める通し番号（無効化した問題IDの欄が比較されないようにする）
+        self._sequence = itertools.count()
+        for card in cards:
+            self._push(card)
+
+    def __len__(self):
+        return len(self.cards)
+
+    def _push(self, card):
+        old_entry = self._entries.get(card.question_id)
+        if old_entry is not None:
+            # 古いエントリは無効化だけしておき、取り出し時に読み飛ばす
+            old_entry[2] = None
+        entry = [card.due, next(self._sequence), card.question_id]
+        self.cards[card.question_id] = card
+        self._entries[card.question_id] = entry
+        heapq.heappush(self._heap, entry)
+        # 無効なエントリが溜まりすぎたら作り直す
+        if len(self._heap) > 2 * len(self._entries) + 32:
+            self._heap = list(self._entries.values())
+            heapq.heapify(self._heap)
+
+    def record(self, question_id, is_correct, now=None):
+        """回答結果を反映し、更新後のカードを返す"""
+        now = time.time() if now is None else now
+        card = self.cards.get(question_id)
+        if card is None and not is_correct:
+            # 初めて間違えた問題はすぐに復習できるようにする
+            card = ReviewCard(question_id, due=now)
+        else:
+            card = sm2_update(card or ReviewCard(question_id), QUALITY_CORRECT if is_correct else QUALITY_WRONG, now)
+        self._push(card)
+        return card
+
+    def peek_due(self, now=None):
+        """期限が来ている中で最も古いカードの問題IDを返す。なければNone"""
+        now = time.time() if now is None else now
+        heap = self._heap
+        while heap and heap[0][2] is None:
+            heapq.heappop(heap)
+        if heap and heap[0][0] <= now:
+            return heap[0][2]
+        return None
+
+    def due_count(self, now=None):
+        """期限が来ているカードの数を返す（期限到来分のみ辿るためO(k)）"""
+        now = time.time() if now is None else now
+        heap = self._heap
+        count = 0
+        stack = [0] if heap else []
+        while stack:
+            i = stack.pop()
+            if heap[i][0] > now:
+                continue
+            if heap[i][2] is not None:
+                count += 1
+            stack.extend(j for j in (2 * i + 1, 2 * i + 2) if j < len(heap))
+        return count
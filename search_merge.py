@@ -0,0 +1,10 @@
+def merge_search_candidates(vector_candidates, bm25_candidates, final_top_k):
+    """ベクトル検索とBM25の候補を、ベクトル検索を優先して重複なく結合する"""
+    final_candidates = []
+    seen_texts = set()
+    for chunk in vector_candidates + bm25_candidates:
+        if chunk["text"] not in seen_texts:
+            final_candidates.append(chunk)
+            seen_texts.add(chunk["text"])
+
+    return final_candidates[:final_top_k]
@@ -1,7 +1,11 @@
-import os
-import yaml
+import uuid
 import random
 import streamlit as st
+from bank_registry import BankRegistry, EXAM_BANK_DIR, DEFAULT_BANK_ID, BANK_LOAD_ERRORS
+from progress_store import create_progress_store
+from quiz_navigation import QuizNavigator, ORDER_SEQUENTIAL, ORDER_SHUFFLED, ORDER_BY_TOPIC
+from review_scheduler import ReviewScheduler
+from perf_instrumentation import start_rerun_profiler, finish_rerun_profiler, render_perf_panel, profiled_fragment, active_profiler
 
 # --- ページ設定 (ファイルの先頭に移動) ---
 st.set_page_config(page_title="Salesforce AI 試験対策クイズ", layout="wide")
@@ -21,24 +25,117 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# --- オリジナルの設定項目と関数 (ChatGPT版から変更なし) ---
-EXAM_QUESTIONS_FILE = os.path.join("Salesforce_Question", "salesforce_exam_questions_final.yaml")
+# 計測が有効な場合のみ、区間ごとの処理時間を記録する (QUIZ_PERF=1 または ?perf=1)
+profiler = start_rerun_profiler()
+
+# --- 設定項目 ---
+# サイドバーの問題一覧で1ページに表示する件数
+SIDEBAR_PAGE_SIZE = 20
+SIDEBAR_STATUS_FILTERS = ["すべて", "未回答", "不正解", "AI矛盾"]
+
+# 出題順の選択肢
+QUESTION_ORDER_LABELS = {
+    ORDER_SEQUENTIAL: "問題番号順",
+    ORDER_SHUFFLED: "シャッフル",
+    ORDER_BY_TOPIC: "トピック別",
+}
+
+@st.cache_resource
+def get_bank_registry():
+    """全セッションで共有する問題集レジストリ。問題集は選ばれた時に読み込まれる"""
+    return BankRegistry()
+
+def filter_sidebar_entries(query, status_filter):
+    """検索語と状態フィルターに一致するサイドバー項目を返す"""
+    query = query.strip().lower()
+    answered_ids = st.session_state.answered_ids
+    wrong_answer_ids = st.session_state.wrong_answer_ids
+    matched = []
+    for entry in sorted_questions_list:
+        q_id = entry.question_id
+        if status_filter == "未回答" and q_id in answered_ids:
+            continue
+        if status_filter == "不正解" and q_id not in wrong_answer_ids:
+            continue
+        if status_filter == "AI矛盾" and not entry.is_contradicted:
+            continue
+        if query and query not in entry.search_text:
+            continue
+        matched.append(entry)
+    return matched
+
+def reset_sidebar_page():
+    st.session_state.sidebar_page = 0
+
+def set_sidebar_page(page):
+    st.session_state.sidebar_page = page
+
+def create_navigator(order):
+    topic_of = {q_id: q.topic for q_id, q in questions_dict.items()} if order == ORDER_BY_TOPIC else None
+    return QuizNavigator(questions_dict.keys(), order=order, seed=random.randrange(2**32), topic_of=topic_of)
 
 @st.cache_resource
-def load_processed_data():
-    if not os.path.exists(EXAM_QUESTIONS_FILE):
-        st.error(f"'{EXAM_QUESTIONS_FILE}'が見つかりません。先にpreprocess_exam_data.pyを実行してください。")
-        return None, None
-    with open(EXAM_QUESTIONS_FILE, 'r', encoding='utf-8') as f:
-        exam_questions = yaml.safe_load(f)
-    questions_dict = {q['question_id']: q for q in exam_questions}
-    sorted_questions_list = sorted(exam_questions, key=lambda q: q['question_id'])
-    return questions_dict, sorted_questions_list
+def get_progress_store():
+    """全セッションで共有する進捗ストア"""
+    return create_progress_store()
+
+def get_user_id():
+    """URLの ?user= で学習者を識別する。未指定なら新しいIDを発行してURLに付与する"""
+    user_id = st.query_params.get("user")
+    if not user_id:
+        user_id = uuid.uuid4().hex
+        st.query_params["user"] = user_id
+    return user_id
+
+@st.cache_resource(max_entries=2)
+def get_doc_search_engine(build_dir):
+    """公開中のビルドごとに、検索インデックスをプロセスで一度だけ読み込む。未作成または開けない場合はNone
+
+    build_dir をキャッシュのキーにするため、新しいビルドが公開されると次の検索から読み込み直す。
+    """
+    from doc_search import DocSearchEngine
+    from index_bundle import IndexBundleError
+    if build_dir is None or not DocSearchEngine.artifacts_exist():
+        return None
+    try:
+        return DocSearchEngine()
+    except IndexBundleError as e:
+        print(f"✖ 検索インデックスを開けませんでした: {e}")
+        return None
+
+@st.fragment
+@profiled_fragment("doc_search")
+def render_doc_search_panel():
+    query = st.text_input("キーワードや質問を入力", key="doc_search_query")
+    if not query.strip():
+        return
+    # 検索ライブラリの読み込みは重いため、最初に検索されるまで遅らせる
+    from index_bundle import current_build_dir
+    engine = get_doc_search_engine(current_build_dir())
+    if engine is None:
+        st.caption("検索インデックスがありません。先にvectorize_documents.pyを実行してください。")
+        return
+    results, mode = engine.search(query)
+    if mode == "bm25":
+        st.caption("ℹ 埋め込みAPIに接続できないため、キーワード検索 (BM25) のみで検索しています。")
+    if not results:
+        st.write("該当するドキュメントが見つかりませんでした。")
+    for chunk in results:
+        st.markdown(f"**{chunk['title']}**")
+        st.caption(chunk['source'])
+        st.text(chunk['text'].split("\n\n", 1)[-1][:300])
+        st.divider()
+
+def progress_key():
+    """進捗の保存キー。既定の問題集以外は問題集IDで区別する"""
+    if st.session_state.bank_id == DEFAULT_BANK_ID:
+        return st.session_state.user_id
+    return f"{st.session_state.user_id}:{st.session_state.bank_id}"
 
 def get_current_question():
     if st.session_state.current_index == -1:
         return None
-    active_list = st.session_state.review_history if st.session_state.is_review_mode else st.session_state.history
+    active_list = st.session_state.review_history if st.session_state.is_review_mode else st.session_state.navigator.history
     if not active_list or st.session_state.current_index >= len(active_list):
         return None
     return questions_dict.get(active_list[st.session_state.current_index])
@@ -47,39 +144,79 @@ def go_to_question_by_id(q_id):
     st.session_state.page = 'quiz'
     st.session_state.is_review_mode = False
     st.session_state.answer_submitted = q_id in st.session_state.answered_ids
-    if q_id not in st.session_state.history:
-        st.session_state.history.append(q_id)
-    st.session_state.current_index = st.session_state.history.index(q_id)
+    st.session_state.current_index = st.session_state.navigator.visit(q_id)
     st.session_state.user_answers = st.session_state.all_user_answers.get(q_id, [])
 
 def go_to_next_question():
     st.session_state.answer_submitted = False
     st.session_state.user_answers = []
-    active_list = st.session_state.review_history if st.session_state.is_review_mode else st.session_state.history
+    active_list = st.session_state.review_history if st.session_state.is_review_mode else st.session_state.navigator.history
     if st.session_state.current_index < len(active_list) - 1:
         st.session_state.current_index += 1
-    elif not st.session_state.is_review_mode:
-        unseen_q_ids = list(set(questions_dict.keys()) - set(st.session_state.history))
-        if not unseen_q_ids:
+    elif st.session_state.is_review_mode:
+        # 復習モードでは、期限が来ている次のカードをヒープから取り出す
+        next_q_id = st.session_state.review_scheduler.peek_due()
+        if next_q_id is None or next_q_id == active_list[-1]:
+            st.toast("🎉 期限が来ている復習はすべて完了しました！", icon="🥳")
+            return
+        active_list.append(next_q_id)
+        st.session_state.current_index += 1
+    else:
+        next_index = st.session_state.navigator.visit_next_unseen()
+        if next_index is None:
             st.toast("🎉 全ての問題を解きました！", icon="🥳")
             return
-        new_q_id = sorted(unseen_q_ids)[0]
-        st.session_state.history.append(new_q_id)
-        st.session_state.current_index = len(st.session_state.history) - 1
+        st.session_state.current_index = next_index
 
 def go_to_prev_question():
     if st.session_state.current_index > 0:
         st.session_state.current_index -= 1
         st.session_state.answer_submitted = True
 
-questions_dict, sorted_questions_list = load_processed_data()
-if not questions_dict:
+def start_quiz():
+    st.session_state.page = 'quiz'
+    question_order = st.session_state.start_question_order
+    if question_order != st.session_state.navigator.order:
+        st.session_state.navigator = create_navigator(question_order)
+    go_to_question_by_id(st.session_state.navigator.first_question_id)
+
+def start_review():
+    st.session_state.page = 'quiz'
+    st.session_state.is_review_mode = True
+    st.session_state.review_history = [st.session_state.review_scheduler.peek_due()]
+    st.session_state.current_index = 0
+    st.session_state.answer_submitted = False
+    st.session_state.user_answers = []
+
+profiler.begin("loading")
+bank_registry = get_bank_registry()
+bank_ids = bank_registry.bank_ids()
+if not bank_ids:
+    st.error(f"'{EXAM_BANK_DIR}'に問題集が見つかりません。先にpreprocess_exam_data.pyを実行してください。")
     st.stop()
+fallback_bank_id = DEFAULT_BANK_ID if DEFAULT_BANK_ID in bank_ids else bank_ids[0]
+if st.session_state.get('bank_id') not in bank_ids:
+    st.session_state.bank_id = fallback_bank_id
+try:
+    bank = bank_registry.get(st.session_state.bank_id)
+except BANK_LOAD_ERRORS as e:
+    # 読み込めない問題集が選ばれたままだと毎回失敗するため、既定の問題集に戻す
+    st.error(f"問題集「{bank_registry.title(st.session_state.bank_id)}」を読み込めませんでした: {e}")
+    if st.session_state.bank_id == fallback_bank_id:
+        st.stop()
+    st.session_state.bank_id = fallback_bank_id
+    try:
+        bank = bank_registry.get(fallback_bank_id)
+    except BANK_LOAD_ERRORS as e:
+        st.error(f"問題集「{bank_registry.title(fallback_bank_id)}」も読み込めませんでした: {e}")
+        st.stop()
+questions_dict, sorted_questions_list = bank.questions_dict, bank.records
 
-def initialize_session():
-    for key, default in {
+progress_store = get_progress_store()
+
+def session_defaults():
+    return {
         'page': 'start',
-        'history': [],
         'current_index': -1,
         'answer_submitted': False,
         'user_answers': [],
@@ -88,42 +225,76 @@ def initialize_session():
         'is_review_mode': False,
         'review_history': [],
         'all_user_answers': {},
+        'sidebar_page': 0,
         'stats': {'contradicted_questions': []}
-    }.items():
-        if key not in st.session_state:
-            st.session_state[key] = default
+    }
+
+def initialize_session():
+    if 'user_id' not in st.session_state:
+        st.session_state.user_id = get_user_id()
+    # 再接続や別レプリカへの振り分け後も、保存済みの進捗から再開する
+    # 問題集を切り替えた場合は、その問題集の進捗で学習状態を作り直す
+    key = progress_key()
+    if st.session_state.get('progress_key') != key:
+        for name in [*session_defaults(), 'navigator']:
+            st.session_state.pop(name, None)
+        st.session_state.progress_key = key
+        st.session_state.update(progress_store.load(key))
+        st.session_state.review_scheduler = ReviewScheduler(progress_store.load_review_cards(key))
+        # 復習カードが作られる前に間違えた問題は、すぐに復習できるカードとして登録する
+        for q_id in st.session_state.wrong_answer_ids - st.session_state.review_scheduler.cards.keys():
+            progress_store.record_review_card(key, st.session_state.review_scheduler.record(q_id, False))
+    for name, default in session_defaults().items():
+        if name not in st.session_state:
+            st.session_state[name] = default
+    if 'navigator' not in st.session_state:
+        st.session_state.navigator = create_navigator(ORDER_SEQUENTIAL)
 
 initialize_session()
 
-with st.sidebar:
-    st.title("Salesforce AI クイズ")
-    if st.session_state.wrong_answer_ids:
-        if st.button(f"間違えた問題 ({len(st.session_state.wrong_answer_ids)}) を復習", use_container_width=True):
-            st.session_state.page = 'quiz'
-            st.session_state.is_review_mode = True
-            st.session_state.review_history = random.sample(list(st.session_state.wrong_answer_ids), len(st.session_state.wrong_answer_ids))
-            st.session_state.current_index = 0
-            st.session_state.answer_submitted = False
-            st.session_state.user_answers = []
-            st.rerun()
+if st.session_state.get('bank_version') != bank.version:
+    # 問題集が更新された場合は、出題順から削除された問題を外し、追加された問題を「次の問題」で出題できるようにする
+    st.session_state.navigator.sync(questions_dict.keys())
+    st.session_state.bank_version = bank.version
 
-    st.markdown("---")
+@st.fragment
+@profiled_fragment("question_list")
+def render_question_list():
+    """サイドバーの問題一覧。検索・絞り込み・ページ送りではこの部分だけを再実行する"""
     st.subheader("問題一覧")
-    for q in sorted_questions_list:
-        q_id = q['question_id']
-        is_answered = q_id in st.session_state.answered_ids
+    nav_query = st.text_input("問題を検索", key="nav_query", placeholder="問題番号・キーワード", on_change=reset_sidebar_page)
+    nav_status = st.radio("表示する問題", SIDEBAR_STATUS_FILTERS, key="nav_status", horizontal=True, on_change=reset_sidebar_page)
+    matched_entries = filter_sidebar_entries(nav_query, nav_status)
+
+    # 表示中のページ分だけボタンを描画し、問題数が増えても再実行の負荷を一定に保つ
+    num_pages = max(1, -(-len(matched_entries) // SIDEBAR_PAGE_SIZE))
+    page = min(st.session_state.sidebar_page, num_pages - 1)
+    start = page * SIDEBAR_PAGE_SIZE
+    for entry in matched_entries[start:start + SIDEBAR_PAGE_SIZE]:
+        q_id = entry.question_id
         is_wrong = q_id in st.session_state.wrong_answer_ids
-        prefix = "✅" if is_answered and not is_wrong else "❌" if is_wrong else "📄"
-        label = f"{prefix} 問{q_id}: {q['question_text'].replace('\\n', ' ')}"
-        st.button(label, key=f"jump_{q_id}", on_click=go_to_question_by_id, args=(q_id,), use_container_width=True)
+        prefix = "❌" if is_wrong else "✅" if q_id in st.session_state.answered_ids else "📄"
+        if st.button(f"{prefix} {entry.sidebar_label}", key=f"jump_{q_id}", use_container_width=True):
+            # 問題の移動はメイン画面も描き直す必要があるため、アプリ全体を再実行する
+            go_to_question_by_id(q_id)
+            st.rerun()
 
-def render_answer_feedback(question, choice_keys, correct_answers):
+    if not matched_entries:
+        st.caption("条件に一致する問題はありません。")
+    elif num_pages > 1:
+        nav_col1, nav_col2, nav_col3 = st.columns([1, 2, 1])
+        with nav_col1:
+            st.button("◀", key="sidebar_prev", disabled=(page <= 0), on_click=set_sidebar_page, args=(page - 1,), use_container_width=True)
+        with nav_col2:
+            st.caption(f"{page + 1} / {num_pages} ページ ({len(matched_entries)}問)")
+        with nav_col3:
+            st.button("▶", key="sidebar_next", disabled=(page >= num_pages - 1), on_click=set_sidebar_page, args=(page + 1,), use_container_width=True)
+
+def render_answer_feedback(question):
     user_answers_set = set(st.session_state.user_answers)
-    correct_answers_set = set(correct_answers)
-    for key in choice_keys:
-        display_text = f"**{key}.** {question['choices'][key]}"
+    for key, display_text in zip(question.choice_keys, question.choice_markdown):
         is_user_selected = key in user_answers_set
-        is_correct = key in correct_answers_set
+        is_correct = key in question.correct_answer_set
 
         if is_user_selected and is_correct:
             st.success(display_text, icon="✅")
@@ -132,126 +303,180 @@ def render_answer_feedback(question, choice_keys, correct_answers):
         else:
             st.markdown(display_text)
 
-st.title("Salesforce 資格試験 AIアシスタント")
+def render_question_body(question):
+    header_text = f"問題 {question.question_id}"
+    if st.session_state.is_review_mode:
+        header_text = f"復習問題 {st.session_state.current_index + 1} (元の問 {question.question_id})"
+    st.header(header_text)
 
-if st.session_state.page == 'start':
-    st.subheader("Salesforce Data Cloud 認定コンサルタント試験対策へようこそ！")
-    st.write("このツールは、非公式の試験問題を基に、AIが公式ドキュメントと照らし合わせて解説とファクトチェックを行う学習支援ツールです。")
-    if st.button("学習を開始する (問1から)", type="primary"):
-        st.session_state.page = 'quiz'
-        go_to_question_by_id(sorted_questions_list[0]['question_id'])
+    st.markdown("---")
+    st.info(question.question_text)
+
+    st.markdown("#### 選択肢")
+    if question.is_multiple_choice and not st.session_state.answer_submitted:
+        st.warning(f"この問題は **{question.num_correct_answers}個** の正解を選択してください。")
+
+def answer_checkbox_key(question, choice_key):
+    return f"answer_{question.question_id}_{choice_key}"
+
+def submit_answer(question):
+    """回答フォームの送信時に、再実行より先に呼ばれる。ここで記録すれば、同じ1回の実行でサイドバーにも反映される"""
+    num_correct_answers = question.num_correct_answers
+    is_multiple_choice = question.is_multiple_choice
+    st.session_state.user_answers = sorted([key for key in question.choice_keys if st.session_state.get(answer_checkbox_key(question, key))])
+    st.session_state.all_user_answers[question.question_id] = st.session_state.user_answers
+
+    # ★★★ ここからが修正されたバリデーションロジック ★★★
+    errors = []
+    if is_multiple_choice:
+        if len(st.session_state.user_answers) != num_correct_answers:
+            errors.append(f"エラー: この問題では正確に **{num_correct_answers}個** の選択肢を選んでください。")
+    elif not is_multiple_choice:
+        if len(st.session_state.user_answers) != 1:
+            errors.append("エラー: この問題では **1個だけ** 選択肢を選んでください。")
+
+    if not st.session_state.user_answers:
+        errors.append("エラー: 少なくとも1つの選択肢を選んでください。")
+    # ★★★ ここまでが修正されたバリデーションロジック ★★★
+
+    if errors:
+        st.session_state.answer_errors = errors
+        return
+    st.session_state.answer_submitted = True
+    st.session_state.answered_ids.add(question.question_id)
+    is_correct = set(st.session_state.user_answers) == question.correct_answer_set
+    if not is_correct:
+        st.session_state.wrong_answer_ids.add(question.question_id)
+    else:
+        st.session_state.wrong_answer_ids.discard(question.question_id)
+    progress_store.record_answer(st.session_state.progress_key, question.question_id, st.session_state.user_answers, is_correct)
+    card = st.session_state.review_scheduler.record(question.question_id, is_correct)
+    progress_store.record_review_card(st.session_state.progress_key, card)
+
+def render_answer_form(question):
+    with st.form(key=f"answer_form_{question.question_id}"):
+        for key, label in zip(question.choice_keys, question.choice_labels):
+            st.checkbox(label, key=answer_checkbox_key(question, key))
+        st.form_submit_button("回答を決定", type="primary", on_click=submit_answer, args=(question,))
+        for error in st.session_state.pop('answer_errors', []):
+            st.error(error)
+
+def render_ai_verification(question):
+    st.markdown("#### AIによる答えの検証")
+    justification = question.ai_justification
+    if question.ai_verdict == 'match':
+        st.info(f"**AIの評価:** {justification}")
+    elif question.ai_verdict == 'warning':
+        st.warning(f"**AIの評価:** {justification}")
+        q_info = (question.question_id, question.question_text)
+        if q_info not in st.session_state.stats['contradicted_questions']:
+            st.session_state.stats['contradicted_questions'].append(q_info)
+    else:
+        st.error(f"**AIの評価:** {justification}")
+
+    st.markdown("#### 解説")
+    st.write(question.explanation_markdown)
+
+    with st.expander("AIが厳選した関連ヘルプドキュメントを見る"):
+        if question.related_docs:
+            for caption, supporting_markdown, link_html in question.related_docs:
+                st.caption(caption)
+                st.markdown(supporting_markdown)
+                st.markdown(link_html, unsafe_allow_html=True)
+                st.divider()
+        else:
+            st.write("AIは正答の根拠となるドキュメントを見つけられませんでした。")
+
+def render_navigation():
+    # 前の問題は回答済みのため、結果のフラグメントだけを再実行すれば表示できる
+    col1, col2 = st.columns(2)
+    with col1:
+        st.button("⬅️ 前の問題へ", use_container_width=True, disabled=(st.session_state.current_index <= 0), on_click=go_to_prev_question)
+    with col2:
+        active_list_for_nav = st.session_state.review_history if st.session_state.is_review_mode else st.session_state.navigator.history
+        is_last = st.session_state.current_index >= len(active_list_for_nav) - 1
+        if st.session_state.is_review_mode:
+            has_more = st.session_state.review_scheduler.peek_due() is not None
+        else:
+            has_more = st.session_state.navigator.has_unseen()
+        if not is_last or has_more:
+            st.button("次の問題へ ➡️", use_container_width=True, on_click=go_to_next_question)
+
+@st.fragment
+@profiled_fragment("quiz")
+def render_answer_result():
+    """回答後の結果・解説・移動ボタン。前の問題への移動ではこの部分だけを再実行する"""
+    question = get_current_question()
+    if not question or not st.session_state.answer_submitted:
+        # 未回答の問題へ進んだ場合、回答フォームはフラグメントの外にあるため、アプリ全体を再実行する
         st.rerun()
 
-elif st.session_state.page == 'quiz':
+    render_question_body(question)
+
+    active_profiler().begin("feedback")
+    render_answer_feedback(question)
+
+    st.markdown("---")
+    st.markdown("### 分析結果")
+    ua_str = ", ".join(st.session_state.user_answers)
+    ca_str = ", ".join(question.correct_answers)
+
+    if set(st.session_state.user_answers) == question.correct_answer_set:
+        st.success(f"🎉 **正解！**")
+    else:
+        st.error(f"❌ **不正解...** (あなたの回答: {ua_str} ／ 正解: {ca_str})")
+
+    render_ai_verification(question)
+
+    st.markdown("---")
+    render_navigation()
+
+def render_quiz_page():
+    """問題と回答フォーム。回答の送信はサイドバーの回答状況と復習数も変えるため、アプリ全体の1回の実行で処理する"""
     question = get_current_question()
     if not question:
-        st.info("「学習を開始する」またはサイドバーから問題を選択してください。")
-        st.stop()
+        if st.session_state.current_index >= 0:
+            # 表示中の問題が問題集の更新で削除された場合も、前後の問題へ移動できるようにする
+            st.info("この問題は問題集の更新で削除されました。前後の問題へ移動してください。")
+            render_navigation()
+        else:
+            st.info("「学習を開始する」またはサイドバーから問題を選択してください。")
+        return
 
-    header_text = f"問題 {question['question_id']}"
-    if st.session_state.is_review_mode:
-        header_text = f"復習問題 {st.session_state.current_index + 1}/{len(st.session_state.review_history)} (元の問 {question['question_id']})"
-    st.header(header_text)
+    if st.session_state.answer_submitted:
+        render_answer_result()
+        return
+
+    render_question_body(question)
+    active_profiler().begin("answer_form")
+    render_answer_form(question)
+
+profiler.begin("sidebar")
+with st.sidebar:
+    st.title("Salesforce AI クイズ")
+    render_perf_panel()
+    if len(bank_ids) > 1:
+        st.selectbox("問題集", bank_ids, key='bank_id', format_func=bank_registry.title)
+    due_count = st.session_state.review_scheduler.due_count()
+    if due_count:
+        st.button(f"復習する (期限到来 {due_count}問)", use_container_width=True, on_click=start_review)
 
     st.markdown("---")
-    st.info(question['question_text'])
+    render_question_list()
 
-    choices = question['choices']
-    choice_keys = sorted(choices.keys())
-    correct_answers = sorted([key.strip() for key in question['correct_answer'].replace(" ", "").split(',')])
-    num_correct_answers = len(correct_answers)
-    is_multiple_choice = num_correct_answers > 1
+profiler.begin("header")
+st.title("Salesforce 資格試験 AIアシスタント")
 
-    st.markdown("#### 選択肢")
-    if is_multiple_choice and not st.session_state.answer_submitted:
-        st.warning(f"この問題は **{num_correct_answers}個** の正解を選択してください。")
-
-    if not st.session_state.answer_submitted:
-        with st.form(key=f"answer_form_{question['question_id']}"):
-            user_selections = {key: st.checkbox(f"{key}. {choices[key]}") for key in choice_keys}
-            submitted = st.form_submit_button("回答を決定", type="primary")
-            if submitted:
-                st.session_state.user_answers = sorted([key for key, checked in user_selections.items() if checked])
-                st.session_state.all_user_answers[question['question_id']] = st.session_state.user_answers
-
-                # ★★★ ここからが修正されたバリデーションロジック ★★★
-                is_valid_submission = True
-                if is_multiple_choice:
-                    if len(st.session_state.user_answers) != num_correct_answers:
-                        st.error(f"エラー: この問題では正確に **{num_correct_answers}個** の選択肢を選んでください。")
-                        is_valid_submission = False
-                elif not is_multiple_choice:
-                    if len(st.session_state.user_answers) != 1:
-                        st.error("エラー: この問題では **1個だけ** 選択肢を選んでください。")
-                        is_valid_submission = False
-                
-                if not st.session_state.user_answers:
-                    st.error("エラー: 少なくとも1つの選択肢を選んでください。")
-                    is_valid_submission = False
-                # ★★★ ここまでが修正されたバリデーションロジック ★★★
-
-                if is_valid_submission:
-                    st.session_state.answer_submitted = True
-                    st.session_state.answered_ids.add(question['question_id'])
-                    if set(st.session_state.user_answers) != set(correct_answers):
-                        st.session_state.wrong_answer_ids.add(question['question_id'])
-                    else:
-                        st.session_state.wrong_answer_ids.discard(question['question_id'])
-                    st.rerun()
+with st.expander("📚 公式ドキュメントを検索"):
+    render_doc_search_panel()
 
-    if st.session_state.answer_submitted:
-        render_answer_feedback(question, choice_keys, correct_answers)
+if st.session_state.page == 'start':
+    st.subheader(f"Salesforce {bank_registry.title(st.session_state.bank_id)} 試験対策へようこそ！")
+    st.write("このツールは、非公式の試験問題を基に、AIが公式ドキュメントと照らし合わせて解説とファクトチェックを行う学習支援ツールです。")
+    st.selectbox("出題順", list(QUESTION_ORDER_LABELS), format_func=QUESTION_ORDER_LABELS.get, key="start_question_order")
+    st.button("学習を開始する", type="primary", on_click=start_quiz)
 
-        st.markdown("---")
-        st.markdown("### 分析結果")
-        ua_str = ", ".join(st.session_state.user_answers)
-        ca_str = ", ".join(correct_answers)
+elif st.session_state.page == 'quiz':
+    render_quiz_page()
 
-        if set(st.session_state.user_answers) == set(correct_answers):
-            st.success(f"🎉 **正解！**")
-        else:
-            st.error(f"❌ **不正解...** (あなたの回答: {ua_str} ／ 正解: {ca_str})")
-
-        ai_analysis = question.get('ai_analysis', {})
-        st.markdown("#### AIによる答えの検証")
-        verification = ai_analysis.get('ai_verification', {})
-        status = verification.get('status', '不明')
-        justification = verification.get('justification', '検証の理由がありません。')
-        if "一致" in status:
-            st.info(f"**AIの評価:** {justification}")
-        elif "矛盾" in status or "判断不能" in status:
-            st.warning(f"**AIの評価:** {justification}")
-            q_info = (question['question_id'], question['question_text'])
-            if q_info not in st.session_state.stats['contradicted_questions']:
-                st.session_state.stats['contradicted_questions'].append(q_info)
-        else:
-            st.error(f"**AIの評価:** {justification}")
-
-        st.markdown("#### 解説")
-        st.write(question.get('japanese_explanation', '（日本語の解説が見つかりません）'))
-
-        with st.expander("AIが厳選した関連ヘルプドキュメントを見る"):
-            related_docs = ai_analysis.get('related_docs', [])
-            if related_docs:
-                for doc in related_docs:
-                    st.caption(f"出典: {doc.get('title', 'N/A')}")
-                    st.markdown(f"> **根拠:** {doc.get('supporting_text', 'N/A')}")
-                    st.markdown(f"<a href='{doc.get('url', '#')}' target='_blank' rel='noopener noreferrer'>記事を読む ↗</a>", unsafe_allow_html=True)
-                    st.divider()
-            else:
-                st.write("AIは正答の根拠となるドキュメントを見つけられませんでした。")
-
-        st.markdown("---")
-        col1, col2 = st.columns(2)
-        with col1:
-            if st.button("⬅️ 前の問題へ", use_container_width=True, disabled=(st.session_state.current_index <= 0)):
-                go_to_prev_question()
-                st.rerun()
-        with col2:
-            active_list_for_nav = st.session_state.review_history if st.session_state.is_review_mode else st.session_state.history
-            is_last = st.session_state.current_index >= len(active_list_for_nav) - 1
-            has_more = len(st.session_state.history) < len(questions_dict)
-            if not is_last or (not st.session_state.is_review_mode and has_more):
-                if st.button("次の問題へ ➡️", use_container_width=True):
-                    go_to_next_question()
-                    st.rerun()
\ No newline at end of file
+finish_rerun_profiler(profiler)
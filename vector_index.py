@@ -0,0 +1,290 @@
+import os
+import sys
+import time
+import argparse
+import faiss
+import numpy as np
+
+# --- 設定項目 ---
+# flat: 全件探索(L2) ／ flat_ip: 正規化ベクトルの内積(コサイン類似度) ／ ivf_flat ／ ivf_pq ／ hnsw
+FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "flat")
+INDEX_TYPES = ("flat", "flat_ip", "ivf_flat", "ivf_pq", "hnsw")
+
+# IVFの設定（nlistは件数から自動で決める）
+IVF_NPROBE = 16
+# k-meansの学習に使うサンプル数（クラスタあたり）。FAISSの推奨範囲(39〜256)の範囲で選ぶ
+TRAIN_POINTS_PER_CENTROID = 64
+# PQの設定（サブベクトルあたりの次元数とビット数）
+PQ_DIMS_PER_SUBQUANTIZER = 16
+PQ_NBITS = 8
+# HNSWの設定
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+
+# ベクトルの保存形式（メモリを減らす代わりに、わずかにrecallが下がる）
+# none: float32 ／ fp16: float16 (1/2) ／ int8: 次元ごとの範囲で8ビットに量子化 (1/4)
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none")
+QUANTIZATION_TYPES = ("none", "fp16", "int8")
+# PCAで削減した後の次元数（0なら削減しない）。変換はインデックスに含めて保存され、クエリにも同じ変換がかかる
+VECTOR_PCA_DIM = int(os.getenv("VECTOR_PCA_DIM", "0"))
+# PCAとint8量子化の学習に使うサンプル数
+TRANSFORM_TRAIN_SAMPLES = 65536
+
+# 評価の設定（FAISS_INDEX_REPORT=1 のときだけ、作成したインデックスを全件探索と比べる）
+FAISS_INDEX_REPORT = os.getenv("FAISS_INDEX_REPORT", "0") == "1"
+EVAL_QUERIES = 200
+EVAL_K = 10
+EVAL_NOISE = 0.05
+
+
+def auto_nlist(n):
+    """件数に応じたIVFのクラスタ数。学習に十分な点が取れない場合は小さくする"""
+    return max(1, min(int(4 * np.sqrt(n)), n // 39))
+
+def sample_training_set(vectors, n_train, seed=0):
+    """学習用に重複なくランダムサンプリングする（全件で学習すると件数に比例して遅くなるため）"""
+    if len(vectors) <= n_train:
+        return vectors
+    rows = np.random.default_rng(seed).choice(len(vectors), n_train, replace=False)
+    return vectors[np.sort(rows)]
+
+def _pq_subquantizers(dimension):
+    m = max(1, dimension // PQ_DIMS_PER_SUBQUANTIZER)
+    while dimension % m:
+        m -= 1
+    return m
+
+def uses_inner_product(index):
+    return index.metric_type == faiss.METRIC_INNER_PRODUCT
+
+def prepare_vectors(index, vectors):
+    """インデックスの距離の種類に合わせてベクトルを整える（内積の場合はL2正規化する）"""
+    vectors = np.ascontiguousarray(vectors, dtype='float32').reshape(-1, index.d)
+    if uses_inner_product(index):
+        vectors = vectors.copy()
+        faiss.normalize_L2(vectors)
+    return vectors
+
+def _scalar_quantizer_type(quantization):
+    return {"fp16": faiss.ScalarQuantizer.QT_fp16, "int8": faiss.ScalarQuantizer.QT_8bit}[quantization]
+
+def _create_base_index(index_type, dimension, n, quantization):
+    """学習前のインデックスと、学習に使うサンプル数を返す"""
+    sq = quantization != "none"
+    if index_type == "flat":
+        index = faiss.IndexScalarQuantizer(dimension, _scalar_quantizer_type(quantization), faiss.METRIC_L2) if sq else faiss.IndexFlatL2(dimension)
+        return index, 0
+    if index_type == "flat_ip":
+        index = faiss.IndexScalarQuantizer(dimension, _scalar_quantizer_type(quantization), faiss.METRIC_INNER_PRODUCT) if sq else faiss.IndexFlatIP(dimension)
+        return index, 0
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWSQ(dimension, _scalar_quantizer_type(quantization), HNSW_M) if sq else faiss.IndexHNSWFlat(dimension, HNSW_M)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+        return index, 0
+
+    nlist = auto_nlist(n)
+    quantizer = faiss.IndexFlatL2(dimension)
+    if index_type == "ivf_flat":
+        if sq:
+            index = faiss.IndexIVFScalarQuantizer(quantizer, dimension, nlist, _scalar_quantizer_type(quantization), faiss.METRIC_L2)
+        else:
+            index = faiss.IndexIVFFlat(quantizer, dimension, nlist)
+        n_train = nlist * TRAIN_POINTS_PER_CENTROID
+    else:
+        # 件数が少ない場合は、PQのコードブック(2^nbits個)を学習できるようビット数を下げる
+        nbits = max(1, min(PQ_NBITS, int(np.log2(max(2, n // 39)))))
+        index = faiss.IndexIVFPQ(quantizer, dimension, nlist, _pq_subquantizers(dimension), nbits)
+        n_train = max(nlist, 2 ** nbits) * TRAIN_POINTS_PER_CENTROID
+    index.nprobe = min(IVF_NPROBE, nlist)
+    return index, n_train
+
+def validate_index_options(index_type, quantization, pca_dim, dimension=None):
+    """インデックスの種類・量子化・PCAの組み合わせを確かめる。埋め込みを始める前に呼び、無効ならValueErrorを送出する"""
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"未対応のインデックスの種類です: {index_type} (選択肢: {', '.join(INDEX_TYPES)})")
+    if quantization not in QUANTIZATION_TYPES:
+        raise ValueError(f"未対応の量子化の種類です: {quantization} (選択肢: {', '.join(QUANTIZATION_TYPES)})")
+    if index_type == "ivf_pq" and quantization != "none":
+        raise ValueError("ivf_pq は既に直積量子化で圧縮されているため、VECTOR_QUANTIZATION とは併用できません。")
+    if pca_dim < 0:
+        raise ValueError(f"PCAの次元数 ({pca_dim}) は0（PCAなし）以上で指定してください。")
+    if pca_dim and dimension is not None and pca_dim >= dimension:
+        raise ValueError(f"PCAの次元数 ({pca_dim}) は 1〜{dimension - 1} の範囲で指定してください。")
+
+def build_faiss_index(vectors, index_type=FAISS_INDEX_TYPE, quantization=VECTOR_QUANTIZATION, pca_dim=VECTOR_PCA_DIM):
+    """指定された種類のFaissインデックスを作成し、必要なら学習してからベクトルを追加する。
+
+    pca_dim を指定すると、PCAの変換を前段に持つインデックス (IndexPreTransform) を作る。
+    インデックスの入力次元 (index.d) は元の次元のままなので、クエリはこれまで通り渡せばよい。
+    内積のインデックスでは、PCAで変わったノルムをL2正規化し直してからスコアを計算する（スコアがコサイン類似度のままになる）。
+    """
+    vectors = np.ascontiguousarray(vectors, dtype='float32')
+    n, dimension = vectors.shape
+    validate_index_options(index_type, quantization, pca_dim, dimension)
+
+    index, n_train = _create_base_index(index_type, pca_dim or dimension, n, quantization)
+    if quantization == "int8":
+        n_train = max(n_train, TRANSFORM_TRAIN_SAMPLES)
+    if pca_dim:
+        if uses_inner_product(index):
+            index = faiss.IndexPreTransform(faiss.NormalizationTransform(pca_dim), index)
+            index.prepend_transform(faiss.PCAMatrix(dimension, pca_dim))
+        else:
+            index = faiss.IndexPreTransform(faiss.PCAMatrix(dimension, pca_dim), index)
+        n_train = max(n_train, TRANSFORM_TRAIN_SAMPLES)
+    if not index.is_trained:
+        # 学習は件数に見合った数のサンプルで行う（PCAの後段のインデックスは変換後のベクトルで学習される）
+        index.train(prepare_vectors(index, sample_training_set(vectors, n_train)))
+
+    index.add(prepare_vectors(index, vectors))
+    return index
+
+def storage_label(index_type, quantization, pca_dim):
+    label = f"{index_type}/{'float32' if quantization == 'none' else quantization}"
+    return label + (f"+pca{pca_dim}" if pca_dim else "")
+
+def index_size_bytes(index):
+    return int(faiss.serialize_index(index).size)
+
+def make_eval_queries(vectors, n_queries=EVAL_QUERIES, noise=EVAL_NOISE, seed=0):
+    """文書ベクトルにノイズを加えて、評価用のクエリを作る"""
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(vectors), min(n_queries, len(vectors)), replace=False)
+    queries = vectors[rows].astype('float32')
+    scale = noise * np.linalg.norm(queries, axis=1, keepdims=True) / np.sqrt(queries.shape[1])
+    return (queries + rng.standard_normal(queries.shape).astype('float32') * scale).astype('float32')
+
+def _search_latencies(index, queries, k):
+    latencies, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        _, ids = index.search(prepare_vectors(index, query), k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append(ids[0])
+    return np.array(latencies), np.array(results)
+
+def evaluate_index(index, baseline, queries, k=EVAL_K, size_bytes=None):
+    """全件探索のインデックスを正解として、recall@k とクエリ1件あたりのレイテンシを測る。
+
+    size_bytes を省略した場合は、インデックスをシリアライズしてサイズを求める。
+    """
+    _, truth = baseline.search(prepare_vectors(baseline, queries), k)
+    latencies, found = _search_latencies(index, queries, k)
+    recall = np.mean([len(set(t) & set(f)) / k for t, f in zip(truth, found)])
+    start = time.perf_counter()
+    index.search(prepare_vectors(index, queries), k)
+    batch_ms = (time.perf_counter() - start) * 1000
+    return {
+        'recall_at_k': float(recall),
+        'k': k,
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+        'batch_ms_per_query': batch_ms / len(queries),
+        'size_bytes': size_bytes if size_bytes is not None else index_size_bytes(index),
+    }
+
+def evaluate_built_index(index, vectors, k=EVAL_K, n_queries=EVAL_QUERIES, size_bytes=None):
+    """作成済みのインデックスを評価する。新たに作るのは正解を求めるための全件探索のインデックスだけ"""
+    vectors = np.ascontiguousarray(vectors, dtype='float32')
+    queries = make_eval_queries(vectors, n_queries)
+    baseline = build_faiss_index(vectors, "flat_ip" if uses_inner_product(index) else "flat", "none", 0)
+    return evaluate_index(index, baseline, queries, k, size_bytes)
+
+def _exact_baselines(vectors):
+    # 内積のインデックスは正規化ベクトルのコサイン類似度が基準になるため、基準も距離の種類ごとに作る
+    return {False: build_faiss_index(vectors, "flat", "none", 0), True: build_faiss_index(vectors, "flat_ip", "none", 0)}
+
+def compare_index_types(vectors, index_types=INDEX_TYPES, k=EVAL_K, n_queries=EVAL_QUERIES,
+                        quantization=VECTOR_QUANTIZATION, pca_dim=VECTOR_PCA_DIM):
+    """各種類のインデックスを作成し、recallとレイテンシの比較結果を返す"""
+    vectors = np.ascontiguousarray(vectors, dtype='float32')
+    queries = make_eval_queries(vectors, n_queries)
+    baselines = _exact_baselines(vectors)
+    report = {}
+    for index_type in index_types:
+        start = time.perf_counter()
+        index = build_faiss_index(vectors, index_type, quantization, pca_dim)
+        build_sec = time.perf_counter() - start
+        report[index_type] = {'build_sec': build_sec, **evaluate_index(index, baselines[uses_inner_product(index)], queries, k)}
+    return report
+
+def compare_vector_storage(vectors, index_type, storages, k=EVAL_K, n_queries=EVAL_QUERIES):
+    """同じ種類のインデックスを (量子化, PCAの次元数) の組み合わせごとに作り、サイズとrecallを比べる。
+
+    recall は常に float32 の全件探索を正解として測るため、圧縮で失われた精度がそのまま表れる。
+    """
+    vectors = np.ascontiguousarray(vectors, dtype='float32')
+    queries = make_eval_queries(vectors, n_queries)
+    baselines = _exact_baselines(vectors)
+    report = {}
+    for quantization, pca_dim in storages:
+        start = time.perf_counter()
+        index = build_faiss_index(vectors, index_type, quantization, pca_dim)
+        build_sec = time.perf_counter() - start
+        report[storage_label(index_type, quantization, pca_dim)] = {
+            'quantization': quantization, 'pca_dim': pca_dim, 'build_sec': build_sec,
+            **evaluate_index(index, baselines[uses_inner_product(index)], queries, k),
+        }
+    return report
+
+def print_report(report, n_vectors):
+    print(f"\n--- インデックスの比較 ({n_vectors}件, recall@k は全件探索との一致率) ---")
+    print(f"  {'種類':<10} {'recall@k':>9} {'p50(ms)':>9} {'p99(ms)':>9} {'一括(ms/件)':>12} {'サイズ(MB)':>11} {'作成(秒)':>9}")
+    for index_type, r in report.items():
+        print(f"  {index_type:<10} {r['recall_at_k']:>9.3f} {r['p50_ms']:>9.3f} {r['p99_ms']:>9.3f} "
+              f"{r['batch_ms_per_query']:>12.4f} {r['size_bytes'] / 1024 / 1024:>11.1f} {r['build_sec']:>9.2f}")
+
+def print_storage_report(report, n_vectors):
+    """保存形式ごとのサイズとrecallを、先頭の形式（通常は圧縮なし）からの差分付きで表示する"""
+    reference = next(iter(report.values()))
+    print(f"\n--- ベクトルの保存形式の比較 ({n_vectors}件, recall@k は float32 の全件探索との一致率) ---")
+    print(f"  {'保存形式':<24} {'サイズ(MB)':>11} {'削減率':>8} {'recall@k':>9} {'低下':>7} {'p50(ms)':>9}")
+    for label, r in report.items():
+        saved = 1 - r['size_bytes'] / reference['size_bytes']
+        lost = reference['recall_at_k'] - r['recall_at_k']
+        print(f"  {label:<24} {r['size_bytes'] / 1024 / 1024:>11.1f} {saved:>8.1%} {r['recall_at_k']:>9.3f} "
+              f"{lost:>+7.3f} {r['p50_ms']:>9.3f}")
+
+def print_built_storage_report(result, label, n_vectors, dimension):
+    """保存したインデックスのサイズを float32 のベクトルのサイズと比べ、全件探索に対するrecallと合わせて表示する"""
+    float32_bytes = n_vectors * dimension * 4
+    saved = 1 - result['size_bytes'] / float32_bytes
+    print(f"\n--- ベクトルの保存形式 ({label}, {n_vectors}件) ---")
+    print(f"  サイズ: float32のベクトル {float32_bytes / 1024 / 1024:.1f} MB → 保存したインデックス "
+          f"{result['size_bytes'] / 1024 / 1024:.1f} MB ({saved:.1%} 削減)")
+    print(f"  recall@{result['k']}: {result['recall_at_k']:.3f} (float32の全件探索を1.000とした場合) ／ "
+          f"p50: {result['p50_ms']:.3f} ms ／ p99: {result['p99_ms']:.3f} ms")
+
+def load_vectors_from_index(index_path):
+    """保存済みのインデックスからベクトルを取り出す（全件探索のインデックスのみ対応）"""
+    index = faiss.read_index(index_path)
+    if not isinstance(index, (faiss.IndexFlatL2, faiss.IndexFlatIP, faiss.IndexFlat)):
+        raise ValueError("ベクトルを取り出せるのは flat / flat_ip のインデックスのみです。")
+    return index.reconstruct_n(0, index.ntotal)
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Faissインデックスの種類ごとの recall とレイテンシを比較する")
+    parser.add_argument("index_path", nargs="?", help="ベクトルの取り出し元 (flatのインデックス。省略時は公開中のビルドのもの)")
+    parser.add_argument("--types", default=",".join(INDEX_TYPES), help="比較する種類 (カンマ区切り)")
+    parser.add_argument("--k", type=int, default=EVAL_K)
+    parser.add_argument("--queries", type=int, default=EVAL_QUERIES)
+    parser.add_argument("--storage", metavar="INDEX_TYPE", help="指定した種類で、量子化とPCAの組み合わせごとのサイズとrecallを比較する")
+    parser.add_argument("--pca-dims", default="0,256,128", help="--storage で比較するPCAの次元数 (カンマ区切り, 0は削減なし)")
+    args = parser.parse_args(argv)
+
+    if args.index_path is None:
+        from index_bundle import BUNDLE_FILES, current_build_dir
+        args.index_path = os.path.join(current_build_dir() or ".", BUNDLE_FILES['faiss'])
+    vectors = load_vectors_from_index(args.index_path)
+    if args.storage:
+        quantizations = [q for q in QUANTIZATION_TYPES if not (args.storage == "ivf_pq" and q != "none")]
+        storages = [(q, int(d)) for d in args.pca_dims.split(",") for q in quantizations]
+        print_storage_report(compare_vector_storage(vectors, args.storage, storages, args.k, args.queries), len(vectors))
+        return
+    report = compare_index_types(vectors, args.types.split(","), args.k, args.queries, "none", 0)
+    print_report(report, len(vectors))
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
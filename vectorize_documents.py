@@ -1,21 +1,28 @@
 import os
-import yaml
+import sys
+import time
 import faiss
-import numpy as np
-import google.generativeai as genai
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-import pickle
 from dotenv import load_dotenv
-from rank_bm25 import BM25Okapi
-import time
-import re
+import asyncio
+from collections import deque
+from itertools import chain, islice
+from concurrent.futures import ProcessPoolExecutor
+from document_loader import iter_documents, jsonl_sidecar_path
+from chunk_dedup import DEDUP_ENABLED, deduplicate_chunks, print_dedup_report
+from embedding_cache import EmbeddingCache, embedding_cache_key
+from embedding_engine import EmbeddingEngine
+from embedding_backends import create_embedding_backend
+from chunk_store import write_chunk_store
+from bm25_index import BM25Index, simple_tokenizer
+from index_bundle import IndexBundleBuilder
+from vector_index import (FAISS_INDEX_TYPE, FAISS_INDEX_REPORT, VECTOR_QUANTIZATION, VECTOR_PCA_DIM, build_faiss_index,
+                          validate_index_options, evaluate_built_index, print_report, print_built_storage_report, storage_label)
 
 # .envファイルから環境変数を読み込む
 load_dotenv()
 
 # --- 設定項目 ---
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-
 # 入力となるYAMLファイル
 INPUT_FILES = [
     "salesforce_help_articles.yaml",
@@ -24,126 +31,213 @@ INPUT_FILES = [
     "salesforce_data_cloud_developer_guide.yaml"
 ]
 
-# 出力ファイル
-FAISS_INDEX_FILE = "salesforce_docs.faiss"
-TEXT_CHUNKS_FILE = "salesforce_docs_chunks.pkl"
-BM25_INDEX_FILE = "salesforce_docs.bm25"
+# 出力先はバージョンごとのディレクトリ（index_bundle.INDEX_BUNDLE_ROOT 配下）に作成し、完成後に公開する
+
+# ベクトル化の設定（埋め込みバックエンドは環境変数 EMBEDDING_BACKEND で切り替える）
+EMBEDDING_TASK_TYPE = "RETRIEVAL_DOCUMENT"
 
 # テキスト分割の設定
 CHUNK_SIZE = 1000
 CHUNK_OVERLAP = 100
+# 改行や句読点を優先的に区切り文字として使うように設定（優先順位が高い順）
+CHUNK_SEPARATORS = ["\n\n", "\n", "。", "、", " ", ""]
+
+# チャンク分割の並列処理の設定
+CHUNK_WORKERS = int(os.getenv("CHUNK_WORKERS", str(os.cpu_count() or 1)))
+DOCS_PER_TASK = 32
+# これより少ないドキュメント数なら、プロセスを起動せずに直列で分割する
+# （ジェネレーターで渡された場合も、先頭からこの件数だけ読み込んで判定する）
+PARALLEL_CHUNKING_MIN_DOCS = 256
 
 def load_documents_from_files(filenames):
-    """複数のYAMLファイルからドキュメントを読み込む"""
-    all_docs = []
+    """複数のYAMLファイルからドキュメントを1件ずつ読み込んで返す（ファイル全体をメモリに載せない）"""
+    total = 0
     print("--- ドキュメントの読み込み開始 ---")
     for filename in filenames:
-        if not os.path.exists(filename):
+        if not os.path.exists(filename) and not os.path.exists(jsonl_sidecar_path(filename)):
             print(f"警告: ファイル '{filename}' が見つかりません。スキップします。")
             continue
-        
-        with open(filename, 'r', encoding='utf-8') as f:
-            data = yaml.safe_load(f)
-            if isinstance(data, list):
-                valid_docs = [doc for doc in data if doc and doc.get('content') and isinstance(doc.get('content'), str)]
-                all_docs.extend(valid_docs)
-                print(f"✔ '{filename}' から {len(valid_docs)} 件の有効なドキュメントを読み込みました。")
-    print(f"✔ 合計 {len(all_docs)} 件のドキュメントを読み込み完了。")
-    return all_docs
 
-def split_documents_into_chunks(documents):
-    """ドキュメントを意味のあるチャンクに分割する（メタデータ埋め込み＆分割戦略改善）"""
-    print("\n--- テキストのチャンク分割を開始 ---")
-    
-    # 改行や句読点を優先的に区切り文字として使うように設定
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=CHUNK_SIZE,
-        chunk_overlap=CHUNK_OVERLAP,
+        valid_count = 0
+        for doc in iter_documents(filename):
+            if isinstance(doc, dict) and doc.get('content') and isinstance(doc.get('content'), str):
+                valid_count += 1
+                yield doc
+        total += valid_count
+        print(f"✔ '{filename}' から {valid_count} 件の有効なドキュメントを読み込みました。")
+    print(f"✔ 合計 {total} 件のドキュメントを読み込み完了。")
+
+# ワーカープロセスごとに1つだけ作るテキスト分割器
+_text_splitter = None
+
+def _init_chunk_worker(chunk_size, chunk_overlap):
+    global _text_splitter
+    _text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
         length_function=len,
-        separators=["\n\n", "\n", "。", "、", " ", ""] # 優先順位が高い区切り文字
+        separators=CHUNK_SEPARATORS
     )
-    
+
+def _split_document_batch(documents):
+    """(本文, 出典, タイトル) のリストをチャンクに分割する。ワーカープロセスで実行される"""
     chunks_with_metadata = []
-    for doc in documents:
-        content = doc.get('content', '')
-        if not content or not isinstance(content, str):
-            continue
-            
-        split_texts = text_splitter.split_text(content)
-        
-        for text in split_texts:
-            # 各チャンクの先頭に、出典とタイトルの情報を追加
-            source_info = doc.get('url') or doc.get('source_document', 'N/A')
-            title_info = doc.get('title', 'N/A')
-            
-            # チャンクのテキスト本体
-            chunk_text = f"出典: {source_info}\nタイトル: {title_info}\n\n{text}"
-            
+    for content, source_info, title_info in documents:
+        # 各チャンクの先頭に付ける出典とタイトルは、ドキュメントごとに1回だけ作る
+        header = f"出典: {source_info}\nタイトル: {title_info}\n\n"
+        for text in _text_splitter.split_text(content):
             chunks_with_metadata.append({
-                "text": chunk_text, # メタデータが埋め込まれたテキスト
+                "text": header + text, # メタデータが埋め込まれたテキスト
                 "source": source_info,
                 "title": title_info
             })
-            
-    print(f"✔ {len(documents)}件のドキュメントを {len(chunks_with_metadata)}個のチャンクに分割しました。")
     return chunks_with_metadata
 
-def vectorize_chunks(chunks):
-    """Gemini APIを使ってチャンクをベクトル化する"""
-    if not GEMINI_API_KEY or GEMINI_API_KEY == "YOUR_GEMINI_API_KEY":
+def _document_batches(documents, stats):
+    batch = []
+    for doc in documents:
+        content = doc.get('content', '')
+        if not content or not isinstance(content, str):
+            continue
+        stats['documents'] += 1
+        # ワーカーへ送るデータを減らすため、分割に必要な項目だけを渡す
+        batch.append((content, doc.get('url') or doc.get('source_document', 'N/A'), doc.get('title', 'N/A')))
+        if len(batch) >= DOCS_PER_TASK:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def iter_document_chunks(documents, workers=CHUNK_WORKERS, stats=None):
+    """ドキュメントをプロセスプールで並列に分割し、入力と同じ順にチャンクを1つずつ返す"""
+    stats = stats if stats is not None else {'documents': 0}
+    stats.setdefault('documents', 0)
+    documents = iter(documents)
+    head = list(islice(documents, PARALLEL_CHUNKING_MIN_DOCS))
+    if len(head) < PARALLEL_CHUNKING_MIN_DOCS:
+        workers = 1
+    batches = _document_batches(chain(head, documents), stats)
+    if workers <= 1:
+        _init_chunk_worker(CHUNK_SIZE, CHUNK_OVERLAP)
+        for batch in batches:
+            yield from _split_document_batch(batch)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_chunk_worker, initargs=(CHUNK_SIZE, CHUNK_OVERLAP)) as pool:
+        # 投入済みのタスクを一定数に抑え、先頭のタスクから順に結果を返す（メモリを入力全体に比例させない）
+        pending = deque()
+        for batch in batches:
+            pending.append(pool.submit(_split_document_batch, batch))
+            if len(pending) >= workers * 4:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+def split_documents_into_chunks(documents):
+    """ドキュメントを意味のあるチャンクに分割する（メタデータ埋め込み＆分割戦略改善）"""
+    print("\n--- テキストのチャンク分割を開始 ---")
+    stats = {'documents': 0}
+    chunks_with_metadata = list(iter_document_chunks(documents, stats=stats))
+    print(f"✔ {stats['documents']}件のドキュメントを {len(chunks_with_metadata)}個のチャンクに分割しました。")
+    return chunks_with_metadata
+
+def vectorize_chunks(chunks, cache=None, backend=None):
+    """埋め込みバックエンドを使ってチャンクをベクトル化する（キャッシュ済みのチャンクは再計算しない）"""
+    print("\n--- チャンクのベクトル化を開始 ---")
+
+    backend = backend or create_embedding_backend()
+    if backend.needs_fit:
+        print("ℹ ローカル埋め込みモデルをチャンクから学習しています...")
+        backend.fit(chunk["text"] for chunk in chunks)
+        backend.save()
+    print(f"使用モデル: {backend.name} ({backend.dimension}次元)")
+
+    if cache is None:
+        # 空のキャッシュも len() が0で偽になるため、None かどうかで判定する
+        cache = EmbeddingCache()
+    keys = [embedding_cache_key(backend.name, EMBEDDING_TASK_TYPE, chunk["text"]) for chunk in chunks]
+
+    # キャッシュにないチャンクだけを、同じテキストは1回だけベクトル化する
+    rows = cache.lookup(keys)
+    missing = {}
+    for i, (key, row) in enumerate(zip(keys, rows)):
+        if row is None and key not in missing:
+            missing[key] = i
+    cached_count = sum(row is not None for row in rows)
+    print(f"ℹ キャッシュ済み: {cached_count}件 ／ 新規にベクトル化: {len(missing)}件 (重複テキストを除く)")
+
+    if missing and not backend.available:
         print("\n★★★ エラー: Gemini APIキーが設定されていません。★★★")
         return None, None
 
-    print("\n--- チャンクのベクトル化を開始 ---")
-    print("使用モデル: text-embedding-004")
-    
-    genai.configure(api_key=GEMINI_API_KEY)
-    
-    vectors = []
-    batch_size = 100
-    for i in range(0, len(chunks), batch_size):
+    missing_keys = list(missing)
+    if missing_keys:
         # チャンクの辞書からテキスト部分だけを抽出
-        batch_texts = [chunk["text"] for chunk in chunks[i:i+batch_size]]
-        
+        missing_texts = [chunks[missing[key]]["text"] for key in missing_keys]
+        progress = {'done': 0}
+
+        def on_batch(indices, vectors):
+            # バッチごとにキャッシュへ書き込むため、途中で中断しても次回はその続きから再開できる
+            cache.add([missing_keys[i] for i in indices], vectors)
+            progress['done'] += len(indices)
+            print(f"  - 進行状況: {progress['done']} / {len(missing_keys)} 件のチャンクをベクトル化済み...")
+
+        engine = EmbeddingEngine(backend.embed_documents_async, **backend.engine_options)
         try:
-            time.sleep(1) # レートリミット対策
-            result = genai.embed_content(
-                model="models/text-embedding-004",
-                content=batch_texts,
-                task_type="RETRIEVAL_DOCUMENT"
-            )
-            vectors.extend(result['embedding'])
-            progress = min(i + batch_size, len(chunks))
-            print(f"  - 進行状況: {progress} / {len(chunks)} 件のチャンクをベクトル化済み...")
+            _, failed = asyncio.run(engine.embed(missing_texts, on_batch=on_batch))
         except Exception as e:
-            print(f"✖ バッチ処理中にAPIエラーが発生しました (件名: {i}～{i+batch_size}): {e}")
-            vectors.extend([None] * len(batch_texts))
+            # 書き込み済みのバッチはキャッシュに残るため、再実行すればその続きから再開できる
+            print(f"✖ 埋め込みキャッシュへの書き込みに失敗したため、ベクトル化を中断しました: {e}")
+            return None, None
+        stats = engine.stats
+        print(f"ℹ スループット: {stats['chunks_per_sec']:.1f} チャンク/秒 "
+              f"({stats['chunks']}件 ／ {stats['elapsed_sec']:.1f}秒 ／ リクエスト {stats['requests']}回 ／ 再試行 {stats['retries']}回)")
+        if failed:
+            # 一部のチャンクが欠けたままのインデックスを公開しないよう、ここで打ち切る
+            print(f"✖ {len(failed)}件のチャンクはベクトル化できなかったため、インデックスを公開せずに終了します。"
+                  f"再実行するとキャッシュ済みの分を除いて再試行します。")
+            return None, None
 
     print(f"✔ ベクトル化処理完了。")
-    
-    valid_vectors = []
+
+    valid_rows = []
     valid_chunks = []
-    for chunk, vector in zip(chunks, vectors):
-        if vector is not None:
+    for chunk, row in zip(chunks, cache.lookup(keys)):
+        if row is not None:
             valid_chunks.append(chunk)
-            valid_vectors.append(vector)
+            valid_rows.append(row)
 
-    if not valid_vectors:
+    if not valid_rows:
         return None, None
-        
-    return np.array(valid_vectors).astype('float32'), valid_chunks
+
+    return cache.get(valid_rows), valid_chunks
 
 
-def create_and_save_faiss_index(vectors, index_path):
+def create_and_save_faiss_index(vectors, index_path, index_type=FAISS_INDEX_TYPE, quantization=VECTOR_QUANTIZATION, pca_dim=VECTOR_PCA_DIM):
     """ベクトルからFaissインデックスを作成し、保存する"""
     if vectors is None or len(vectors) == 0:
         print("✖ ベクトルが空のため、Faissインデックスを作成できません。")
         return False
         
-    print("\n--- Faissベクトルインデックスの作成と保存を開始 ---")
+    print(f"\n--- Faissベクトルインデックス ({storage_label(index_type, quantization, pca_dim)}) の作成と保存を開始 ---")
     dimension = vectors.shape[1]
     
-    if faiss.get_num_gpus() > 0:
+    if quantization != "none" or pca_dim:
+        index = build_faiss_index(vectors, index_type, quantization, pca_dim)
+        faiss.write_index(index, index_path)
+        # 圧縮した場合は、保存したインデックスそのものを測り、削減できたメモリと失ったrecallを確認できるようにする
+        result = evaluate_built_index(index, vectors, size_bytes=os.path.getsize(index_path))
+        print_built_storage_report(result, storage_label(index_type, quantization, pca_dim), len(vectors), dimension)
+    elif index_type != "flat":
+        start = time.perf_counter()
+        index = build_faiss_index(vectors, index_type, quantization, pca_dim)
+        build_sec = time.perf_counter() - start
+        faiss.write_index(index, index_path)
+        if FAISS_INDEX_REPORT:
+            # 近似インデックスの場合は、作成したインデックスが全件探索と比べてどれだけ精度を失ったかを確認できるようにする
+            result = evaluate_built_index(index, vectors, size_bytes=os.path.getsize(index_path))
+            print_report({index_type: {'build_sec': build_sec, **result}}, len(vectors))
+    elif faiss.get_num_gpus() > 0:
         print(f"✔ {faiss.get_num_gpus()}個のGPUを検出しました。GPU版Faissを使用します。")
         res = faiss.StandardGpuResources()
         index_gpu = faiss.GpuIndexFlatL2(res, dimension)
@@ -164,43 +258,69 @@ def create_and_save_bm25_index(chunks, index_path):
     """チャンクからBM25インデックスを作成し、保存する"""
     print("\n--- BM25キーワードインデックスの作成と保存を開始 ---")
     
-    def simple_tokenizer(text):
-        return re.findall(r'[A-Za-z0-9]+|[\u3040-\u309F\u30A0-\u30FF\u4E00-\u9FFF]+', text.lower())
-
     # BM25のインデックス作成には、メタデータが埋め込まれていない元のテキストを使う方が良い場合がある
     # ここでは、埋め込み済みのテキストをそのまま使う
     tokenized_corpus = [simple_tokenizer(chunk["text"]) for chunk in chunks]
     
-    bm25 = BM25Okapi(tokenized_corpus)
-    
-    with open(index_path, 'wb') as f:
-        pickle.dump(bm25, f)
+    # 転置インデックスをNumPy配列として保存する（pickleは使わない）
+    BM25Index.build(tokenized_corpus).save(index_path)
         
     print(f"✔ BM25インデックスを '{index_path}' に保存しました。")
 
 def save_chunks(chunks, chunks_path):
-    """チャンクのテキストデータを保存する"""
-    with open(chunks_path, 'wb') as f:
-        pickle.dump(chunks, f)
+    """チャンクのテキストデータを、Faissの行番号と揃えた列指向のファイルに保存する"""
+    write_chunk_store(chunks, chunks_path)
     print(f"✔ チャンクデータを '{chunks_path}' に保存しました。")
 
 # --- メイン処理 ---
 if __name__ == "__main__":
-    docs = load_documents_from_files(INPUT_FILES)
-    
-    if docs:
-        chunks = split_documents_into_chunks(docs)
-        if chunks:
-            vectors, valid_chunks = vectorize_chunks(chunks)
-            
-            if vectors is not None and len(vectors) > 0:
-                create_and_save_bm25_index(valid_chunks, BM25_INDEX_FILE)
-                if create_and_save_faiss_index(vectors, FAISS_INDEX_FILE):
-                    save_chunks(valid_chunks, TEXT_CHUNKS_FILE)
-                    print("\n🎉 全てのドキュメントのベクトル化とインデックス作成が完了しました！ 🎉")
-                else:
-                    print("\n✖ Faissインデックスの作成または保存に失敗しました。")
+    # インデックスの設定の誤りは、埋め込みAPIを呼ぶ前に知らせる
+    backend = create_embedding_backend()
+    try:
+        validate_index_options(FAISS_INDEX_TYPE, VECTOR_QUANTIZATION, VECTOR_PCA_DIM, backend.dimension)
+    except ValueError as e:
+        print(f"✖ インデックスの設定が正しくありません: {e}")
+        sys.exit(1)
+
+    # 読み込みとチャンク分割を流れ作業にし、ドキュメント全体を同時にメモリに載せない
+    chunks = split_documents_into_chunks(load_documents_from_files(INPUT_FILES))
+
+    if chunks and DEDUP_ENABLED:
+        # 複数のガイドで重複する記述や、オーバーラップでほぼ同じになったチャンクを埋め込み前にまとめる
+        print("\n--- ほぼ重複するチャンクの除去を開始 ---")
+        chunks, dedup_stats = deduplicate_chunks(chunks)
+        print_dedup_report(dedup_stats)
+
+    if chunks:
+        vectors, valid_chunks = vectorize_chunks(chunks, backend=backend)
+        
+        if vectors is not None and len(vectors) > 0:
+            # 全ファイルを新しいビルドのディレクトリに書き、揃ってから公開する（途中で失敗しても公開中のものは壊れない）
+            bundle = IndexBundleBuilder()
+            try:
+                create_and_save_bm25_index(valid_chunks, bundle.path('bm25'))
+                if not create_and_save_faiss_index(vectors, bundle.path('faiss')):
+                    raise RuntimeError("Faissインデックスを作成できませんでした。")
+                save_chunks(valid_chunks, bundle.path('chunks'))
+                if backend.kind == "local":
+                    backend.save(bundle.path('embedding_model'))
+                manifest = bundle.publish(
+                    row_count=len(valid_chunks),
+                    embedding={'backend': backend.kind, 'model': backend.name, 'dimension': int(vectors.shape[1])},
+                    index_type=FAISS_INDEX_TYPE,
+                    vector_storage={'quantization': VECTOR_QUANTIZATION, 'pca_dim': VECTOR_PCA_DIM},
+                    chunking={'chunk_size': CHUNK_SIZE, 'chunk_overlap': CHUNK_OVERLAP, 'separators': CHUNK_SEPARATORS, 'dedup': DEDUP_ENABLED},
+                )
+            except Exception as e:
+                bundle.abort()
+                print(f"\n✖ 検索インデックスの作成または保存に失敗しました: {e}")
+                sys.exit(1)
             else:
-                print("\n✖ 有効なベクトルが生成されなかったため、処理を終了します。")
+                print(f"✔ 検索インデックス (ビルド {manifest['build_id']}) を公開しました。")
+                print("\n🎉 全てのドキュメントのベクトル化とインデックス作成が完了しました！ 🎉")
         else:
-            print("\n✖ チャンクが生成されなかったため、処理を終了します。")
\ No newline at end of file
+            print("\n✖ 有効なベクトルが生成されなかったため、処理を終了します。")
+            sys.exit(1)
+    else:
+        print("\n✖ チャンクが生成されなかったため、処理を終了します。")
+        sys.exit(1)
\ No newline at end of file